@@ -0,0 +1,84 @@
+"""
+Compares CSV import throughput of the inferred dtype reader with the typed readers
+Each path is timed from the .csv file to a DataFrame holding the final column types
+
+Run from the project root:
+    python -m Benchmarks.bench_import --rows 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import schema
+import weather_pipeline as wp
+from Benchmarks.bench_validation import build_frame
+
+FINAL_DTYPES = {
+    "ObservationDate": np.dtype("datetime64[ns]"),
+    "Pressure": pd.Int64Dtype(),
+    "WindDirection": pd.Int64Dtype(),
+    "WindSpeed": pd.Int64Dtype(),
+    "SignificantWeatherCode": pd.Int64Dtype(),
+    "WindGust": pd.Int64Dtype(),
+    "Visibility": pd.Int64Dtype(),
+}
+
+
+def read_applymap(fpath: str) -> pd.DataFrame:
+    """
+    The original import path with a per-cell whitespace strip
+    """
+    return (
+        pd.read_csv(fpath, na_values=-99)
+        .applymap(lambda x: x.strip() if isinstance(x, str) else x)
+        .astype(FINAL_DTYPES)
+    )
+
+
+def read_inferred(fpath: str) -> pd.DataFrame:
+    return wp.import_monthly_weather_csv(fpath).astype(FINAL_DTYPES)
+
+
+def read_typed_pandas(fpath: str) -> pd.DataFrame:
+    return wp.import_typed_weather_csv(fpath, engine="pandas")
+
+
+def read_typed_pyarrow(fpath: str) -> pd.DataFrame:
+    return wp.import_typed_weather_csv(fpath, engine="pyarrow")
+
+
+READERS = {
+    "read_csv + applymap": read_applymap,
+    "read_csv + str.strip": read_inferred,
+    "typed pandas": read_typed_pandas,
+    "typed pyarrow": read_typed_pyarrow,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'reader':>22} {'seconds':>8} {'rows/s':>12}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in args.rows:
+            fpath = os.path.join(tmp_dir, f"weather.{rows}.csv")
+            build_frame(rows).astype(
+                {
+                    column: dtype
+                    for column, dtype in schema.PANDAS_DTYPES.items()
+                    if dtype == pd.Int64Dtype()
+                }
+            ).to_csv(fpath, index=False)
+            for name, reader in READERS.items():
+                start = time.perf_counter()
+                reader(fpath)
+                seconds = time.perf_counter() - start
+                print(f"{rows:>10} {name:>22} {seconds:>8.3f} {rows / seconds:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
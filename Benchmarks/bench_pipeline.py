@@ -0,0 +1,215 @@
+"""
+Times and memory profiles every pipeline stage on synthetic weather data at several scales
+Results are written to a JSON file and can be checked against a baseline results file
+
+Run from the project root:
+    python -m Benchmarks.bench_pipeline --scales 100x1 500x1 500x3 --output results.json
+    python -m Benchmarks.bench_pipeline --baseline baseline.json --threshold 1.25
+
+Scales are sites x months. Exits with status 1 when a stage is slower or uses more memory
+than threshold times the baseline
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+import pyarrow as pa
+import local_query
+import weather_pipeline as wp
+from Benchmarks.synthetic import generate_weather_csvs
+
+STAGES = ["import", "validate", "transform", "export", "query"]
+
+# Stages faster than this in the baseline are too noisy to flag as slower
+MIN_SECONDS = 0.05
+
+
+def parse_scale(scale: str):
+    """
+    Parses a scale written as sites x months eg 100x3
+    """
+    sites, months = scale.lower().split("x")
+    return int(sites), int(months)
+
+
+def measure(func, repeat: int = 1):
+    """
+    Returns the result of func, the best wall time of repeat runs
+    and the peak traced memory in MB of one more run
+    tracemalloc sees Python and numpy allocations but not pyarrow's memory pool
+    """
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak_memory_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+    return result, seconds, peak_memory_mb
+
+
+def validate_all(frames: list) -> bool:
+    """
+    Validates every frame, returning False if any frame fails validation
+    """
+    valid = True
+    for frame in frames:
+        try:
+            wp.validate_weather_data(frame)
+        except wp.DataValidationError:
+            valid = False
+    return valid
+
+
+def run_stages(fpaths: list, output_dir: str, repeat: int = 1) -> list:
+    """
+    Runs each pipeline stage over the weather files and returns one result per stage
+    Transformed files are merged before export and the query runs on the export
+    """
+    fpath_parquet = os.path.join(output_dir, "weather.parquet")
+    stages = {
+        "import": lambda: [wp.import_monthly_weather_csv(fpath) for fpath in fpaths],
+        "validate": lambda: validate_all(frames),
+        "transform": lambda: [wp.transform_weather_df(frame) for frame in frames],
+        "export": lambda: wp.export_weather_to_parquet(
+            wp.concat_weather_frames(transformed), fpath_parquet
+        ),
+        "query": lambda: local_query.max_daily_average_temperature(fpath_parquet),
+    }
+
+    results = []
+    for stage in STAGES:
+        result, seconds, peak_memory_mb = measure(stages[stage], repeat)
+        if stage == "import":
+            frames = result
+            rows = sum(len(frame) for frame in frames)
+        elif stage == "transform":
+            transformed = result
+
+        results.append(
+            {
+                "stage": stage,
+                "rows": rows,
+                "seconds": round(seconds, 4),
+                "rows_per_second": round(rows / seconds) if seconds else None,
+                "peak_memory_mb": round(peak_memory_mb, 2),
+            }
+        )
+        if stage == "validate":
+            results[-1]["valid"] = result
+
+    return results
+
+
+def run_benchmarks(
+    scales: list, dirty_rate: float = 0.0, repeat: int = 1, seed: int = 0
+) -> list:
+    """
+    Generates synthetic weather files for each scale and benchmarks every stage on them
+    """
+    results = []
+    for sites, months in scales:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fpaths = generate_weather_csvs(
+                tmp_dir, sites=sites, months=months, dirty_rate=dirty_rate, seed=seed
+            )
+            for result in run_stages(fpaths, tmp_dir, repeat):
+                results.append(
+                    dict(sites=sites, months=months, dirty_rate=dirty_rate, **result)
+                )
+    return results
+
+
+def result_key(result: dict):
+    return result["sites"], result["months"], result["dirty_rate"], result["stage"]
+
+
+def check_regressions(results: list, baseline: list, threshold: float = 1.25) -> list:
+    """
+    Returns a message for each stage whose time or peak memory is more than
+    threshold times the same stage at the same scale in the baseline
+    """
+    baseline_results = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        expected = baseline_results.get(result_key(result))
+        if expected is None:
+            continue
+        for metric in ["seconds", "peak_memory_mb"]:
+            if metric == "seconds" and expected[metric] < MIN_SECONDS:
+                continue
+            if result[metric] > expected[metric] * threshold:
+                regressions.append(
+                    f"{result['stage']} at {result['sites']} sites x {result['months']} "
+                    f"months: {metric} {result[metric]} > {threshold} x {expected[metric]}"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scales", nargs="+", default=["100x1", "500x1", "500x3"])
+    parser.add_argument("--dirty-rate", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        [parse_scale(scale) for scale in args.scales],
+        args.dirty_rate,
+        args.repeat,
+        args.seed,
+    )
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "pyarrow": pa.__version__,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+
+    print(
+        f"{'sites':>6} {'months':>6} {'stage':>10} {'rows':>9} {'s':>8} "
+        f"{'rows/s':>11} {'peak MB':>8}"
+    )
+    for result in results:
+        print(
+            f"{result['sites']:>6} {result['months']:>6} {result['stage']:>10} "
+            f"{result['rows']:>9} {result['seconds']:>8.3f} "
+            f"{result['rows_per_second'] or 0:>11,} {result['peak_memory_mb']:>8.1f}"
+        )
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = check_regressions(
+                results, json.load(f)["results"], args.threshold
+            )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Compares the rows per second of the fast transform with the string based transform
+
+Run from the project root:
+    python -m Benchmarks.bench_transform --rows 1000000 3000000
+"""
+import argparse
+import time
+import pandas as pd
+import weather_pipeline as wp
+from Benchmarks.bench_validation import build_frame
+
+
+def time_transform(frame_in: pd.DataFrame, fast: bool) -> float:
+    start = time.perf_counter()
+    wp.transform_weather_df(frame_in, fast=fast)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000000, 3000000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'strings (rows/s)':>17} {'fast (rows/s)':>14} {'speedup':>8}")
+    for rows in args.rows:
+        frame = build_frame(rows)
+        strings_time = time_transform(frame, fast=False)
+        fast_time = time_transform(frame, fast=True)
+        print(
+            f"{rows:>10} {rows / strings_time:>17,.0f} {rows / fast_time:>14,.0f} "
+            f"{strings_time / fast_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Compares the vectorized validation engine with the pandas_schema engine
+
+Run from the project root:
+    python -m Benchmarks.bench_validation --rows 100000
+"""
+import argparse
+import time
+import pandas as pd
+import weather_pipeline as wp
+
+EXAMPLE_INPUT_DATA_PATH = "Tests/Data/example-input-data.csv"
+
+
+def build_frame(rows: int) -> pd.DataFrame:
+    """
+    Tiles the example input data up to the requested number of rows
+    """
+    example = wp.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+    repeats = -(-rows // len(example))
+    return pd.concat([example] * repeats, ignore_index=True).head(rows)
+
+
+def time_engine(frame_in: pd.DataFrame, engine: str) -> float:
+    start = time.perf_counter()
+    wp.validate_weather_data(frame_in, engine=engine)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'pandas_schema (s)':>18} {'vectorized (s)':>15} {'speedup':>8}")
+    for rows in args.rows:
+        frame = build_frame(rows)
+        pandas_schema_time = time_engine(frame, "pandas_schema")
+        vectorized_time = time_engine(frame, "vectorized")
+        print(
+            f"{rows:>10} {pandas_schema_time:>18.3f} {vectorized_time:>15.3f} "
+            f"{pandas_schema_time / vectorized_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Generates realistic monthly weather .csv files in the 15 column Met Office format
+for benchmarking the pipeline at scale
+
+Run from the project root:
+    python -m Benchmarks.synthetic --sites 100 --months 3 --dirty-rate 0.001
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import mappings
+import schema
+
+# Regions of the raw files, the Isle of Man is only set by the transform
+RAW_REGIONS = [
+    region for region in mappings.REGION_TO_COUNTRY if region != "Isle of Man"
+]
+
+# Share of sites whose raw country is blank
+BLANK_COUNTRY_RATE = 0.1
+
+SITE_NAME_WORDS = [
+    "ABER", "BAL", "BRIDGE", "CASTLE", "DUN", "EAST", "FELL", "GLEN", "HEATH",
+    "HILL", "KIRK", "LOCH", "MOOR", "NORTH", "PORT", "RIDGE", "SOUTH", "ST.",
+    "STONE", "UPPER", "VALE", "WEST", "WICK", "WOLD",
+]
+
+# Invalid values written to dirty rows, one column per fault
+DIRTY_VALUES = {
+    "ObservationTime": 24,
+    "WindDirection": 20,
+    "ScreenTemperature": 99.9,
+    "Pressure": 2000,
+    "SiteName": "BAD #NAME",
+}
+
+
+def generate_sites(sites: int, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Returns sites with 4 and 5 digit codes, upper case names suffixed with the code,
+    UK coordinates and a raw region and country
+    """
+    codes = np.sort(
+        rng.choice(np.arange(3000, 4000), size=min(sites, 1000), replace=False)
+    )
+    if sites > len(codes):
+        five_digit_codes = rng.choice(
+            np.arange(10000, 100000), size=sites - len(codes), replace=False
+        )
+        codes = np.concatenate([codes, np.sort(five_digit_codes)])
+    regions = rng.choice(RAW_REGIONS, size=sites)
+    countries = [mappings.REGION_TO_COUNTRY[region].upper() for region in regions]
+    names = [
+        " ".join(rng.choice(SITE_NAME_WORDS, size=rng.integers(1, 3)))
+        for _ in range(sites)
+    ]
+    return pd.DataFrame(
+        {
+            "ForecastSiteCode": codes,
+            "SiteName": [f"{name} ({code})" for name, code in zip(names, codes)],
+            "Latitude": np.round(rng.uniform(49.9, 60.8, sites), 3),
+            "Longitude": np.round(rng.uniform(-8.2, 1.8, sites), 3),
+            "Region": regions,
+            "Country": np.where(
+                rng.random(sites) < BLANK_COUNTRY_RATE, "", countries
+            ),
+        }
+    )
+
+
+def generate_month(
+    sites: pd.DataFrame,
+    month_start: pd.Timestamp,
+    dirty_rate: float,
+    rng: np.random.Generator,
+) -> pd.DataFrame:
+    """
+    Returns one hourly reading per site for every hour of the month in the raw file layout
+    Blank and -99 values are used for missing readings as in the raw files
+    and dirty_rate of the rows hold a value which fails validation
+    """
+    days = pd.date_range(month_start, month_start + pd.offsets.MonthEnd(0), freq="D")
+    hours = len(days) * 24
+    rows = hours * len(sites)
+
+    site_index = np.tile(np.arange(len(sites)), hours)
+    hour_index = np.repeat(np.arange(hours), len(sites))
+    day_of_month = hour_index // 24
+    hour_of_day = hour_index % 24
+
+    latitude = sites.Latitude.to_numpy()[site_index]
+    temperature = (
+        12
+        - (latitude - 50) * 0.6
+        - 4 * np.cos((hour_of_day - 3) / 24 * 2 * np.pi)
+        + rng.normal(0, 2, rows)
+    )
+    wind_speed = rng.gamma(2, 5, rows).astype(int)
+
+    frame_out = pd.DataFrame(
+        {
+            "ForecastSiteCode": sites.ForecastSiteCode.to_numpy()[site_index],
+            "ObservationTime": hour_of_day,
+            "ObservationDate": np.asarray(
+                days.strftime(schema.OBSERVATION_DATE_FORMAT)
+            )[day_of_month],
+            "WindDirection": rng.integers(0, 17, rows),
+            "WindSpeed": wind_speed,
+            "WindGust": pd.Series(
+                wind_speed + rng.integers(5, 25, rows), dtype="Int64"
+            ).where(rng.random(rows) >= 0.7),
+            "Visibility": rng.choice(
+                [500, 2000, 7000, 15000, 25000, 35000, 50000], size=rows
+            ),
+            "ScreenTemperature": np.round(temperature, 1),
+            "Pressure": rng.integers(960, 1040, rows),
+            "SignificantWeatherCode": np.where(
+                rng.random(rows) < 0.05, -99, rng.integers(0, 31, rows)
+            ),
+            "SiteName": sites.SiteName.to_numpy()[site_index],
+            "Latitude": latitude,
+            "Longitude": sites.Longitude.to_numpy()[site_index],
+            "Region": sites.Region.to_numpy()[site_index],
+            "Country": sites.Country.to_numpy()[site_index],
+        },
+        columns=schema.COLUMN_NAMES,
+    )
+
+    dirty_rows = np.flatnonzero(rng.random(rows) < dirty_rate)
+    dirty_columns = rng.choice(list(DIRTY_VALUES), size=len(dirty_rows))
+    for column, value in DIRTY_VALUES.items():
+        rows_to_dirty = dirty_rows[dirty_columns == column]
+        if len(rows_to_dirty):
+            frame_out[column] = frame_out[column].astype(object)
+            frame_out.iloc[rows_to_dirty, frame_out.columns.get_loc(column)] = value
+
+    return frame_out
+
+
+def generate_weather_csvs(
+    output_dir: str,
+    sites: int = 100,
+    months: int = 1,
+    dirty_rate: float = 0.0,
+    start: str = "2016-02-01",
+    seed: int = 0,
+) -> list:
+    """
+    Writes one weather.YYYYMMDD.csv file per month to output_dir
+    Returns the paths of the files written
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    site_frame = generate_sites(sites, rng)
+
+    fpaths = []
+    for month_start in pd.date_range(start, periods=months, freq="MS"):
+        fpath = os.path.join(output_dir, f"weather.{month_start:%Y%m%d}.csv")
+        generate_month(site_frame, month_start, dirty_rate, rng).to_csv(
+            fpath, index=False
+        )
+        fpaths.append(fpath)
+
+    return fpaths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--months", type=int, default=1)
+    parser.add_argument("--dirty-rate", type=float, default=0.0)
+    parser.add_argument("--start", default="2016-02-01")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default="Data/Synthetic")
+    args = parser.parse_args()
+
+    for fpath in generate_weather_csvs(
+        args.output_dir, args.sites, args.months, args.dirty_rate, args.start, args.seed
+    ):
+        print(fpath)
+
+
+if __name__ == "__main__":
+    main()
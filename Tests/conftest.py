@@ -0,0 +1,11 @@
+import pytest
+import weather_pipeline
+
+EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
+
+
+@pytest.fixture
+def weather_frame():
+    return weather_pipeline.transform_weather_df(
+        weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+    )
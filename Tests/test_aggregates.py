@@ -0,0 +1,72 @@
+import pytest
+import pandas as pd
+import aggregates
+import local_query
+import weather_pipeline
+from pandas.testing import assert_frame_equal
+
+
+def test_site_day_aggregates(weather_frame):
+    # Two readings for the same site day
+    weather_frame = pd.concat(
+        [
+            weather_frame,
+            weather_frame[weather_frame.SiteName == "Stornoway"].assign(
+                ObservationTime=1, ScreenTemperature=6.3, WindGust=20, Pressure=1001
+            ),
+        ]
+    )
+    site_days = aggregates.site_day_aggregates(weather_frame)
+
+    assert len(site_days) == 12
+    stornoway = site_days[site_days.SiteName == "Stornoway"].iloc[0]
+    assert stornoway.MeanTemperature == pytest.approx(5.3)
+    assert (stornoway.MinTemperature, stornoway.MaxTemperature) == (4.3, 6.3)
+    assert (stornoway.ReadingCount, stornoway.MaxWindGust) == (2, 20)
+    assert stornoway.MeanPressure == pytest.approx(996)
+
+
+def test_combine_site_day_aggregates(weather_frame):
+    partials = [
+        aggregates.partial_site_day_aggregates(weather_frame.iloc[start : start + 5])
+        for start in range(0, len(weather_frame), 5)
+    ]
+    assert_frame_equal(
+        aggregates.combine_site_day_aggregates(partials),
+        aggregates.site_day_aggregates(weather_frame),
+    )
+
+
+def test_update_site_day_aggregates(tmp_path, weather_frame):
+    fpath_aggregates = str(tmp_path / "weather_site_day.parquet")
+    aggregates.update_site_day_aggregates(
+        aggregates.site_day_aggregates(weather_frame), fpath_aggregates
+    )
+
+    # Only the updated site day changes
+    aggregates.update_site_day_aggregates(
+        aggregates.site_day_aggregates(
+            weather_frame[weather_frame.SiteName == "Stornoway"].assign(
+                ScreenTemperature=20.0
+            )
+        ),
+        fpath_aggregates,
+    )
+    site_days = pd.read_parquet(fpath_aggregates)
+    assert len(site_days) == 12
+    assert site_days.set_index("SiteName").MeanTemperature.to_dict() == dict(
+        weather_frame.set_index("SiteName").ScreenTemperature, Stornoway=20.0
+    )
+
+
+def test_max_daily_average_temperature(tmp_path, weather_frame):
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    fpath_aggregates = str(tmp_path / "weather_site_day.parquet")
+    weather_pipeline.export_weather_to_parquet(weather_frame, fpath_parquet)
+    aggregates.update_site_day_aggregates(
+        aggregates.site_day_aggregates(weather_frame), fpath_aggregates
+    )
+    assert_frame_equal(
+        aggregates.max_daily_average_temperature(fpath_aggregates),
+        local_query.max_daily_average_temperature(fpath_parquet),
+    )
@@ -0,0 +1,114 @@
+import pytest
+import pandas as pd
+import pyarrow.parquet as pq
+import arrow_pipeline
+import catalog
+import parallel
+import weather_pipeline
+from pandas.testing import assert_frame_equal
+from Benchmarks import synthetic
+
+EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
+TEST_OUT_PATH = "Data/CSVTestFiles/test-out.csv"
+
+
+@pytest.mark.parametrize("dedupe_policy", ["first", "last", "most_complete"])
+@pytest.mark.parametrize(
+    "fpaths", [[EXAMPLE_INPUT_DATA_PATH], [EXAMPLE_INPUT_DATA_PATH, TEST_OUT_PATH]]
+)
+def test_run_weather_files_arrow(tmp_path, fpaths, dedupe_policy):
+    fpath_pandas = str(tmp_path / "pandas.parquet")
+    fpath_arrow = str(tmp_path / "arrow.parquet")
+    weather_pipeline.export_weather_to_parquet(
+        parallel.run_weather_files(fpaths, 1, dedupe_policy), fpath_pandas
+    )
+    arrow_pipeline.run_weather_files_arrow(fpaths, fpath_arrow, dedupe_policy)
+
+    assert pq.read_schema(fpath_arrow).equals(
+        pq.read_schema(fpath_pandas), check_metadata=True
+    )
+    assert_frame_equal(pd.read_parquet(fpath_arrow), pd.read_parquet(fpath_pandas))
+
+
+@pytest.mark.parametrize("dedupe_policy", ["first", "last"])
+@pytest.mark.parametrize(
+    "order",
+    [
+        # Months in order are written a run after another
+        [0, 1, 2],
+        # Months out of order and a repeated month are merged
+        [2, 0, 1, 0],
+    ],
+)
+def test_run_weather_files_arrow_streams_files(tmp_path, monkeypatch, order, dedupe_policy):
+    monkeypatch.setattr(arrow_pipeline, "MERGE_ROWS", 2000)
+    months = synthetic.generate_weather_csvs(str(tmp_path / "input"), sites=4, months=3)
+    fpaths = [months[i] for i in order]
+    fpath_pandas = str(tmp_path / "pandas.parquet")
+    fpath_arrow = str(tmp_path / "arrow.parquet")
+    weather_pipeline.export_weather_to_parquet(
+        parallel.run_weather_files(fpaths, 1, dedupe_policy), fpath_pandas
+    )
+    rows = arrow_pipeline.run_weather_files_arrow(
+        fpaths, fpath_arrow, dedupe_policy, spill_dir=str(tmp_path), row_group_size=1000
+    )
+
+    assert pq.read_schema(fpath_arrow).equals(
+        pq.read_schema(fpath_pandas), check_metadata=True
+    )
+    assert_frame_equal(pd.read_parquet(fpath_arrow), pd.read_parquet(fpath_pandas))
+    assert rows == pq.read_metadata(fpath_arrow).num_rows
+    assert catalog.load_catalog(fpath_arrow)["arrow.parquet"]["rows"] == rows
+    # The spilled runs are removed
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "_arrow.parquet.catalog.json",
+        "_pandas.parquet.catalog.json",
+        "arrow.parquet",
+        "input",
+        "pandas.parquet",
+    ]
+
+
+def test_run_weather_files_arrow_whitespace_only_text(tmp_path):
+    lines = open(EXAMPLE_INPUT_DATA_PATH).read().splitlines()
+    lines[1] = lines[1].replace("Orkney & Shetland,SCOTLAND", "  ,   ")
+    fpath = str(tmp_path / "weather.csv")
+    with open(fpath, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    fpath_pandas = str(tmp_path / "pandas.parquet")
+    fpath_arrow = str(tmp_path / "arrow.parquet")
+    weather_pipeline.export_weather_to_parquet(
+        parallel.run_weather_files([fpath], 1), fpath_pandas
+    )
+    arrow_pipeline.run_weather_files_arrow([fpath], fpath_arrow)
+
+    frame_out = pd.read_parquet(fpath_arrow)
+    assert_frame_equal(frame_out, pd.read_parquet(fpath_pandas))
+    assert frame_out.Region.isnull().sum() == 1
+
+
+def test_transform_weather_files_arrow_batches():
+    # Small blocks split the file into several record batches
+    assert arrow_pipeline.transform_weather_files_arrow(
+        [EXAMPLE_INPUT_DATA_PATH], block_size=512
+    ).equals(arrow_pipeline.transform_weather_files_arrow([EXAMPLE_INPUT_DATA_PATH]))
+
+
+@pytest.mark.parametrize(
+    "fpath, expected_raise",
+    [
+        ("Data/CSVTestFiles/blank.csv", "pytest.raises(pd.errors.EmptyDataError)"),
+        ("Data/CSVTestFiles/header-only.csv", "pytest.raises(pd.errors.EmptyDataError)"),
+        (
+            "Data/CSVTestFiles/missing-data.csv",
+            "pytest.raises(weather_pipeline.DataValidationError)",
+        ),
+        (
+            "Data/CSVTestFiles/extra-column-names.csv",
+            "pytest.raises(weather_pipeline.DataValidationError)",
+        ),
+    ],
+)
+def test_transform_weather_files_arrow_errors(fpath, expected_raise):
+    with eval(expected_raise):
+        arrow_pipeline.transform_weather_files_arrow([fpath])
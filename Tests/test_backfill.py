@@ -0,0 +1,66 @@
+import os
+import pytest
+import pandas as pd
+import pyarrow.parquet as pq
+import backfill
+import parallel
+import weather_pipeline
+from pandas.testing import assert_frame_equal
+
+EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
+TEST_OUT_PATH = "Data/CSVTestFiles/test-out.csv"
+FPATHS = [EXAMPLE_INPUT_DATA_PATH, TEST_OUT_PATH, EXAMPLE_INPUT_DATA_PATH]
+
+
+@pytest.mark.parametrize("dedupe_policy", ["first", "last", "most_complete"])
+@pytest.mark.parametrize("memory_budget_mb", [256, 0.001])
+def test_backfill_weather_files(tmp_path, monkeypatch, dedupe_policy, memory_budget_mb):
+    # A tiny budget spills runs of 2 rows, merged 2 at a time over several passes
+    monkeypatch.setattr(backfill, "MIN_BATCH_ROWS", 1)
+    fpath_pandas = str(tmp_path / "pandas.parquet")
+    fpath_backfill = str(tmp_path / "backfill.parquet")
+    weather_pipeline.export_weather_to_parquet(
+        parallel.run_weather_files(FPATHS, 1, dedupe_policy), fpath_pandas
+    )
+
+    rows = backfill.backfill_weather_files(
+        FPATHS, fpath_backfill, memory_budget_mb, dedupe_policy, spill_dir=str(tmp_path)
+    )
+
+    expected_output = pd.read_parquet(fpath_pandas)
+    assert rows == len(expected_output)
+    assert_frame_equal(pd.read_parquet(fpath_backfill), expected_output)
+    # Run files are removed and both outputs are catalogued
+    assert sorted(os.listdir(tmp_path)) == [
+        "_backfill.parquet.catalog.json",
+        "_pandas.parquet.catalog.json",
+        "backfill.parquet",
+        "pandas.parquet",
+    ]
+
+
+def test_backfill_row_groups(tmp_path, monkeypatch):
+    monkeypatch.setattr(backfill, "MIN_BATCH_ROWS", 1)
+    fpath_backfill = str(tmp_path / "backfill.parquet")
+    backfill.backfill_weather_files(FPATHS, fpath_backfill, 0.001, row_group_size=5)
+    metadata = pq.ParquetFile(fpath_backfill).metadata
+    # Row groups are no larger than the budget of 2 rows
+    assert metadata.num_rows == 12
+    assert all(
+        metadata.row_group(i).num_rows <= 2 for i in range(metadata.num_row_groups)
+    )
+
+
+def test_backfill_no_files(tmp_path):
+    with pytest.raises(ValueError):
+        backfill.backfill_weather_files([], str(tmp_path / "backfill.parquet"))
+
+
+def test_backfill_invalid_file(tmp_path):
+    with pytest.raises(weather_pipeline.DataValidationError):
+        backfill.backfill_weather_files(
+            [EXAMPLE_INPUT_DATA_PATH, "Data/CSVTestFiles/missing-data.csv"],
+            str(tmp_path / "backfill.parquet"),
+            spill_dir=str(tmp_path),
+        )
+    assert os.listdir(tmp_path) == []
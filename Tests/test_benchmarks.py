@@ -0,0 +1,63 @@
+import pytest
+import pandas as pd
+import schema
+import weather_pipeline
+from Benchmarks import bench_pipeline, synthetic
+
+
+@pytest.mark.parametrize(
+    "dirty_rate, expected_exception",
+    [
+        (0.0, None),
+        (0.05, weather_pipeline.DataValidationError),
+    ],
+)
+def test_generate_weather_csvs(tmp_path, dirty_rate, expected_exception):
+    fpaths = synthetic.generate_weather_csvs(
+        str(tmp_path), sites=5, months=2, dirty_rate=dirty_rate
+    )
+    assert [fpath.rsplit("/", 1)[1] for fpath in fpaths] == [
+        "weather.20160201.csv",
+        "weather.20160301.csv",
+    ]
+
+    frame = weather_pipeline.import_monthly_weather_csv(fpaths[0])
+    assert list(frame.columns) == schema.COLUMN_NAMES
+    assert len(frame) == 5 * 29 * 24
+
+    if expected_exception is None:
+        weather_pipeline.validate_weather_data(frame)
+    else:
+        with pytest.raises(expected_exception):
+            weather_pipeline.validate_weather_data(frame)
+
+
+@pytest.mark.parametrize(
+    "seconds, peak_memory_mb, expected_regressions",
+    [
+        (1.2, 100, 0),
+        (1.3, 100, 1),
+        (1.3, 130, 2),
+    ],
+)
+def test_check_regressions(seconds, peak_memory_mb, expected_regressions):
+    scale = {"sites": 100, "months": 1, "dirty_rate": 0.0}
+    baseline = [
+        dict(scale, stage="transform", seconds=1.0, peak_memory_mb=100),
+        # Too fast to compare times
+        dict(scale, stage="query", seconds=0.01, peak_memory_mb=1),
+    ]
+    results = [
+        dict(baseline[0], seconds=seconds, peak_memory_mb=peak_memory_mb),
+        dict(baseline[1], seconds=0.02),
+    ]
+    assert len(bench_pipeline.check_regressions(results, baseline, 1.25)) == (
+        expected_regressions
+    )
+
+
+def test_run_benchmarks():
+    results = bench_pipeline.run_benchmarks([(3, 1)])
+    assert [result["stage"] for result in results] == bench_pipeline.STAGES
+    assert all(result["rows"] == 3 * 29 * 24 for result in results)
+    assert pd.DataFrame(results).seconds.gt(0).all()
@@ -0,0 +1,140 @@
+import os
+import pytest
+import catalog
+import reports
+import weather_pipeline
+from pandas.testing import assert_frame_equal
+
+
+@pytest.fixture
+def fpath_dataset(tmp_path, weather_frame):
+    fpath_dataset = str(tmp_path / "weather")
+    weather_pipeline.export_weather_to_parquet(
+        weather_frame,
+        fpath_dataset,
+        partitioned=True,
+        partition_by_region=True,
+        update_catalog=False,
+    )
+    return fpath_dataset
+
+
+def test_update_catalog_file(tmp_path, weather_frame):
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    weather_pipeline.export_weather_to_parquet(weather_frame, fpath_parquet)
+
+    assert catalog.update_catalog(fpath_parquet) == {
+        "weather.parquet": dict(
+            catalog.file_version(fpath_parquet),
+            rows=12,
+            min_date="2016-02-01",
+            max_date="2016-02-28",
+            regions=sorted(weather_frame.Region.unique()),
+            site_codes=sorted(weather_frame.ForecastSiteCode.unique()),
+            min_temperature=0.1,
+            max_temperature=9.8,
+        )
+    }
+    assert os.path.exists(tmp_path / "_weather.parquet.catalog.json")
+    assert not os.path.exists(tmp_path / "_weather.parquet.catalog.json.tmp")
+
+
+def test_update_catalog_dataset(fpath_dataset, weather_frame, monkeypatch):
+    entries = catalog.update_catalog(fpath_dataset)
+    assert len(entries) == 5
+    assert sum(entry["rows"] for entry in entries.values()) == 12
+
+    # Unchanged files are not read again
+    zone_maps = []
+    monkeypatch.setattr(catalog, "zone_map", lambda fpath: zone_maps.append(fpath))
+    assert catalog.update_catalog(fpath_dataset) == entries
+    assert zone_maps == []
+
+    # Replaced partitions are read again
+    weather_pipeline.export_weather_to_parquet(
+        weather_frame[weather_frame.Region == "Orkney & Shetland"],
+        fpath_dataset,
+        partitioned=True,
+        partition_by_region=True,
+        update_catalog=False,
+    )
+    catalog.update_catalog(fpath_dataset)
+    assert len(zone_maps) == 1 and "Orkney" in zone_maps[0]
+
+
+@pytest.mark.parametrize("partitioned", [False, True])
+def test_export_updates_catalog(tmp_path, weather_frame, partitioned):
+    fpath_parquet = str(tmp_path / "weather")
+    weather_pipeline.export_weather_to_parquet(
+        weather_frame, fpath_parquet, partitioned=partitioned
+    )
+    entries = catalog.load_catalog(fpath_parquet)
+    assert sum(entry["rows"] for entry in entries.values()) == 12
+
+    # Rewriting the output (or its only month partition) updates its catalog
+    weather_pipeline.export_weather_to_parquet(
+        weather_frame[weather_frame.Region == "Orkney & Shetland"],
+        fpath_parquet,
+        partitioned=partitioned,
+    )
+    assert catalog.load_catalog(fpath_parquet) == catalog.update_catalog(fpath_parquet)
+    assert sum(entry["rows"] for entry in catalog.load_catalog(fpath_parquet).values()) == 4
+
+
+@pytest.mark.parametrize(
+    "filters, expected_files",
+    [
+        ({}, 5),
+        ({"regions": ["Orkney & Shetland"]}, 1),
+        ({"start_date": "2016-02-20"}, 3),
+        ({"end_date": "2016-02-05"}, 2),
+        ({"start_date": "2016-02-08", "end_date": "2016-02-18"}, 2),
+        ({"site_codes": [3772, 3210]}, 2),
+        ({"regions": ["Nowhere"]}, 0),
+    ],
+)
+def test_pruned_dataset(fpath_dataset, filters, expected_files):
+    catalog.update_catalog(fpath_dataset)
+    assert len(catalog.pruned_dataset(fpath_dataset, **filters).files) == expected_files
+
+
+def test_pruned_dataset_keeps_changed_files(fpath_dataset, weather_frame):
+    # Without a catalog nothing is pruned
+    assert len(catalog.pruned_dataset(fpath_dataset, regions=["Nowhere"]).files) == 5
+
+    catalog.update_catalog(fpath_dataset)
+    weather_pipeline.export_weather_to_parquet(
+        weather_frame.assign(Region="Orkney & Shetland"),
+        fpath_dataset,
+        partitioned=True,
+        partition_by_region=True,
+        update_catalog=False,
+    )
+    # The rewritten partition's zone map is stale so it is read
+    assert len(catalog.pruned_dataset(fpath_dataset, regions=["Nowhere"]).files) == 1
+
+
+@pytest.mark.parametrize(
+    "report, filters",
+    [
+        ("hottest_day", {}),
+        ("hottest_day", {"regions": ["Orkney & Shetland"]}),
+        ("region_daily_stats", {"start_date": "2016-02-20", "end_date": "2016-02-23"}),
+        ("windiest_sites", {"regions": ["North West England", "Yorkshire & Humber"]}),
+        ("coldest_day", {"regions": ["Nowhere"]}),
+    ],
+)
+def test_run_report_pruned(fpath_dataset, report, filters):
+    expected_output = reports.run_report(report, fpath_dataset, **filters)
+    catalog.update_catalog(fpath_dataset)
+    assert_frame_equal(reports.run_report(report, fpath_dataset, **filters), expected_output)
+
+
+def test_catalog_summary(fpath_dataset):
+    assert catalog.catalog_summary(fpath_dataset).empty
+    catalog.update_catalog(fpath_dataset)
+    summary = catalog.catalog_summary(fpath_dataset)
+    assert summary.Rows.sum() == 12
+    assert (summary.Regions == 1).all()
+    assert summary.MinDate.min() == "2016-02-01"
+    assert summary.MaxDate.max() == "2016-02-28"
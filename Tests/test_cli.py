@@ -0,0 +1,285 @@
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+import pytest
+import pandas as pd
+import cli
+import manifest
+import weather_pipeline
+from pandas.testing import assert_frame_equal
+
+EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
+MISSING_DATA_PATH = "Data/CSVTestFiles/missing-data.csv"
+
+
+@pytest.fixture
+def fpath_parquet(tmp_path):
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    weather_pipeline.export_weather_to_parquet(
+        weather_pipeline.transform_weather_df(
+            weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+        ),
+        fpath_parquet,
+    )
+    return fpath_parquet
+
+
+def run_cli(tmp_path, *argv):
+    return cli.main(["--error-log", str(tmp_path / "error.log"), *argv])
+
+
+def test_import_has_no_side_effects():
+    code = (
+        "import sys, cli, weather_pipeline; "
+        "print(weather_pipeline.clogger.handlers, "
+        "[module for module in ('pydrill', 'pandas_schema', 'pyarrow.dataset', "
+        "'pyarrow.parquet', 'catalog', 'local_query', 'reports') if module in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(cli.__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output.strip() == "[] []"
+
+
+def test_ingest(tmp_path):
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    fpath_site_days = str(tmp_path / "site_days.parquet")
+    assert (
+        run_cli(
+            tmp_path,
+            "ingest",
+            EXAMPLE_INPUT_DATA_PATH,
+            "--output",
+            fpath_parquet,
+            "--site-day-output",
+            fpath_site_days,
+            "--processes",
+            "1",
+            "--metrics",
+            "",
+            "--run-summary",
+            str(tmp_path / "run_summary.json"),
+        )
+        == 0
+    )
+    assert_frame_equal(
+        pd.read_parquet(fpath_parquet),
+        weather_pipeline.transform_weather_df(
+            weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+        ).reset_index(drop=True),
+    )
+    assert os.path.exists(fpath_site_days)
+    assert os.path.exists(tmp_path / "_weather.parquet.catalog.json")
+    # Nothing failed so no error log is written
+    assert not os.path.exists(tmp_path / "error.log")
+
+
+def test_watch(tmp_path):
+    input_dir, output_dir = tmp_path / "input", str(tmp_path / "weather")
+    input_dir.mkdir()
+    shutil.copy(EXAMPLE_INPUT_DATA_PATH, input_dir / "weather.20160201.csv")
+    fpath_metrics, fpath_summary = tmp_path / "metrics.jsonl", tmp_path / "run_summary.json"
+
+    def stop_once_written():
+        deadline = time.monotonic() + 20
+        while not manifest.load_manifest(output_dir) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)}
+    threading.Thread(target=stop_once_written, daemon=True).start()
+    try:
+        assert (
+            run_cli(
+                tmp_path,
+                "watch",
+                "--input-dir",
+                str(input_dir),
+                "--output-dir",
+                output_dir,
+                "--site-day-output",
+                str(tmp_path / "site_days.parquet"),
+                "--processes",
+                "1",
+                "--poll-seconds",
+                "0.05",
+                "--settle-seconds",
+                "0.1",
+                "--batch-wait-seconds",
+                "0.1",
+                "--metrics",
+                str(fpath_metrics),
+                "--run-summary",
+                str(fpath_summary),
+            )
+            == 0
+        )
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+    # The batch's stage records are written out although the service clears them
+    summary = json.loads(fpath_summary.read_text())
+    assert summary["transform_weather_df"]["calls"] == 1
+    assert summary["transform_weather_df"]["rows_in"] == 12
+    stages = [json.loads(line)["stage"] for line in fpath_metrics.read_text().splitlines()]
+    assert stages.count("transform_weather_df") == 1
+
+
+def test_backfill(tmp_path):
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    fpath_site_days = str(tmp_path / "site_days.parquet")
+    assert (
+        run_cli(
+            tmp_path,
+            "backfill",
+            EXAMPLE_INPUT_DATA_PATH,
+            "--output",
+            fpath_parquet,
+            "--site-day-output",
+            fpath_site_days,
+            "--memory-budget-mb",
+            "1",
+            "--spill-dir",
+            str(tmp_path),
+            "--metrics",
+            "",
+            "--run-summary",
+            str(tmp_path / "run_summary.json"),
+        )
+        == 0
+    )
+    assert_frame_equal(
+        pd.read_parquet(fpath_parquet),
+        weather_pipeline.transform_weather_df(
+            weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+        ).reset_index(drop=True),
+    )
+    assert len(pd.read_parquet(fpath_site_days)) > 0
+
+
+@pytest.mark.parametrize(
+    "argv, expected_output",
+    [
+        ([], "South Uist Range"),
+        (["coldest_day"], "Lerwick (S. Screen)"),
+        (["windiest_sites", "--top", "1"], "Aonach Mor"),
+        (["region_daily_stats", "--region", "North West England"], "North West England"),
+    ],
+)
+def test_query(tmp_path, fpath_parquet, capsys, argv, expected_output):
+    assert (
+        run_cli(tmp_path, "query", *argv, "--parquet", fpath_parquet, "--no-cache") == 0
+    )
+    assert expected_output in capsys.readouterr().out
+
+
+def test_query_drill_filters(tmp_path, fpath_parquet):
+    with pytest.raises(ValueError):
+        run_cli(
+            tmp_path, "query", "--backend", "drill", "--start", "2016-02-01",
+            "--parquet", fpath_parquet,
+        )
+
+
+@pytest.mark.parametrize(
+    "fpath, max_reject_rate, expected_status",
+    [
+        (EXAMPLE_INPUT_DATA_PATH, None, 0),
+        (MISSING_DATA_PATH, None, 1),
+        (MISSING_DATA_PATH, "0.5", 0),
+        (MISSING_DATA_PATH, "0.01", 1),
+        ("Data/CSVTestFiles/blank.csv", None, 1),
+    ],
+)
+def test_validate_dry_run(tmp_path, fpath, max_reject_rate, expected_status):
+    # Without a quarantine dir every rejected row fails the file
+    quarantine_dir = tmp_path / "quarantine"
+    argv = ["validate", fpath, "--dry-run"]
+    if max_reject_rate is not None:
+        argv += ["--quarantine-dir", str(quarantine_dir), "--max-reject-rate", max_reject_rate]
+    assert run_cli(tmp_path, *argv) == expected_status
+    assert not quarantine_dir.exists()
+
+
+def test_validate_quarantine(tmp_path, capsys):
+    quarantine_dir = tmp_path / "quarantine"
+    assert (
+        run_cli(
+            tmp_path,
+            "validate",
+            MISSING_DATA_PATH,
+            "--quarantine-dir",
+            str(quarantine_dir),
+            "--max-reject-rate",
+            "0.5",
+        )
+        == 0
+    )
+    rejected = pd.read_parquet(quarantine_dir / "missing-data.parquet")
+    assert f"{len(rejected)} rejected" in capsys.readouterr().out
+
+
+def test_ingest_features(tmp_path):
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    argv = [
+        "ingest",
+        EXAMPLE_INPUT_DATA_PATH,
+        "--output",
+        fpath_parquet,
+        "--site-day-output",
+        str(tmp_path / "site_days.parquet"),
+        "--processes",
+        "1",
+        "--features",
+        "--metrics",
+        "",
+        "--run-summary",
+        str(tmp_path / "run_summary.json"),
+    ]
+    assert run_cli(tmp_path, *argv) == 0
+    assert "PressureTendency3h" in pd.read_parquet(fpath_parquet).columns
+
+    # Chunks do not hold every row of a site
+    with pytest.raises(ValueError):
+        run_cli(tmp_path, *argv, "--chunksize", "5")
+
+
+def test_catalog(tmp_path, fpath_parquet, capsys):
+    os.remove(tmp_path / "_weather.parquet.catalog.json")
+    assert run_cli(tmp_path, "catalog", "--parquet", fpath_parquet) == 1
+    assert run_cli(tmp_path, "catalog", "--parquet", fpath_parquet, "--update") == 0
+    assert "12 rows in 1 file(s) from 2016-02-01 to 2016-02-28" in capsys.readouterr().out
+
+
+def test_export(tmp_path, fpath_parquet):
+    fpath_csv = str(tmp_path / "weather.csv")
+    fpath_cords = str(tmp_path / "cords.csv")
+    assert (
+        run_cli(
+            tmp_path,
+            "export",
+            "--parquet",
+            fpath_parquet,
+            "--csv",
+            fpath_csv,
+            "--cords",
+            fpath_cords,
+        )
+        == 0
+    )
+    assert len(pd.read_csv(fpath_csv)) == len(pd.read_parquet(fpath_parquet))
+    assert list(pd.read_csv(fpath_cords).columns) == [
+        "ForecastSiteCode",
+        "Latitude",
+        "Longitude",
+    ]
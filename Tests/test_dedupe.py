@@ -0,0 +1,68 @@
+import pytest
+import numpy as np
+import pandas as pd
+import dedupe
+import weather_pipeline
+
+EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
+
+
+@pytest.fixture
+def observations():
+    return pd.DataFrame(
+        {
+            "ForecastSiteCode": [3002, 3002, 3005, 3002],
+            "ObservationDateTime": pd.to_datetime(
+                ["2016-02-01 00:00", "2016-02-01 00:00", "2016-02-01 00:00", "2016-02-01 00:00"]
+            ),
+            "ScreenTemperature": [2.1, np.nan, 0.1, 2.3],
+            "WindGust": [np.nan, np.nan, 10, 20],
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "policy, expected_index",
+    [
+        ("first", [0, 2]),
+        ("last", [2, 3]),
+        ("most_complete", [2, 3]),
+    ],
+)
+def test_dedupe_observations(observations, policy, expected_index):
+    assert list(dedupe.dedupe_observations(observations, policy).index) == expected_index
+
+
+def test_dedupe_observations_most_complete_tie(observations):
+    observations = observations.assign(WindGust=[5, np.nan, 10, np.nan])
+    assert list(dedupe.dedupe_observations(observations, "most_complete").index) == [
+        0,
+        2,
+    ]
+
+
+def test_dedupe_observations_existing_keys(observations):
+    existing_keys = dedupe.observation_keys(observations.iloc[[2]])
+    assert list(
+        dedupe.dedupe_observations(observations, "first", existing_keys).index
+    ) == [0]
+
+
+def test_dedupe_observations_unknown_policy(observations):
+    with pytest.raises(ValueError):
+        dedupe.dedupe_observations(observations, "random")
+
+
+def test_read_existing_keys(tmp_path):
+    frame = weather_pipeline.transform_weather_df(
+        weather_pipeline.import_typed_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+    )
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    weather_pipeline.export_weather_to_parquet(frame, fpath_parquet)
+
+    # Nullable typed keys hash the same as the keys read back from parquet
+    assert np.array_equal(
+        np.sort(dedupe.read_existing_keys(fpath_parquet)),
+        np.sort(dedupe.observation_keys(frame)),
+    )
+    assert len(dedupe.read_existing_keys(str(tmp_path / "missing.parquet"))) == 0
@@ -0,0 +1,167 @@
+import datetime
+import json
+import pytest
+import requests
+import pyarrow as pa
+import drill_client
+import weather_pipeline
+from pydrill import client, exceptions
+
+RESULT_JSON = {
+    "columns": ["ObservationDate", "Region", "SiteName", "DailyAverageTemperature"],
+    "metadata": ["DATE", "VARCHAR", "VARCHAR", "DOUBLE"],
+    "rows": [
+        {
+            "DailyAverageTemperature": "9.8",
+            "ObservationDate": "2016-02-21",
+            "Region": "Highland & Eilean Siar",
+            "SiteName": "South Uist Range",
+        },
+        {
+            "DailyAverageTemperature": 9.8,
+            "ObservationDate": "2016-02-21",
+            "Region": None,
+            "SiteName": "Stornoway",
+        },
+    ],
+}
+
+requires_drill = pytest.mark.skipif(
+    not client.PyDrill(host="localhost", port=8047).is_active(),
+    reason="Apache Drill is not running on localhost:8047",
+)
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakePyDrill:
+    """
+    Stands in for pydrill's client, counting clients and active checks
+    """
+
+    instances = []
+    active = True
+
+    def __init__(self, host, port, timeout):
+        self.timeout = timeout
+        self.active_checks = 0
+        FakePyDrill.instances.append(self)
+
+    def is_active(self, timeout):
+        self.active_checks += 1
+        return FakePyDrill.active
+
+    def query(self, sql, timeout):
+        return FakeResult(
+            {"columns": ["sql"], "metadata": ["VARCHAR"], "rows": [{"sql": sql}]}
+        )
+
+
+@pytest.fixture
+def fake_drill(monkeypatch):
+    FakePyDrill.instances = []
+    FakePyDrill.active = True
+    monkeypatch.setattr(drill_client.client, "PyDrill", FakePyDrill)
+    return FakePyDrill
+
+
+def test_result_to_table():
+    table = drill_client.result_to_table(RESULT_JSON)
+    assert table.schema.types == [pa.date32(), pa.string(), pa.string(), pa.float64()]
+    assert table.column("ObservationDate").to_pylist() == [
+        datetime.date(2016, 2, 21)
+    ] * 2
+    assert table.column("DailyAverageTemperature").to_pylist() == [9.8, 9.8]
+    assert table.column("Region").to_pylist() == ["Highland & Eilean Siar", None]
+
+
+def test_result_to_table_schema():
+    table = drill_client.result_to_table(
+        RESULT_JSON, pa.schema([("ObservationDate", pa.timestamp("ms"))])
+    )
+    assert table.schema.field("ObservationDate").type == pa.timestamp("ms")
+
+
+@pytest.mark.parametrize(
+    "sql_type, expected_type",
+    [("BIGINT", pa.int64()), ("DECIMAL(10, 2)", pa.float64()), ("INTERVAL", pa.string())],
+)
+def test_drill_arrow_type(sql_type, expected_type):
+    assert drill_client.drill_arrow_type(sql_type) == expected_type
+
+
+def test_result_to_table_empty():
+    table = drill_client.result_to_table(
+        {"columns": ["ScreenTemperature"], "metadata": ["DOUBLE"], "rows": []}
+    )
+    assert table.num_rows == 0
+    assert table.schema.types == [pa.float64()]
+
+
+def test_drill_client_reuses_connection(fake_drill):
+    drill = drill_client.DrillClient(connect_timeout=1, query_timeout=5)
+    drill.query("select 1")
+    drill.query("select 2")
+    assert len(fake_drill.instances) == 1
+    assert fake_drill.instances[0].active_checks == 1
+    assert fake_drill.instances[0].timeout == (1, 5)
+
+
+def test_drill_client_query_timeout_reaches_transport(monkeypatch):
+    # pydrill's own client and transport run, only the HTTP requests are stubbed
+    timeouts = []
+
+    def request(session, method, url, timeout=None, **kwargs):
+        timeouts.append((url.split("?")[0].rsplit("/", 1)[-1], timeout))
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps(RESULT_JSON).encode()
+        response.request = requests.Request(method, url).prepare()
+        return response
+
+    monkeypatch.setattr(requests.Session, "request", request)
+    drill = drill_client.DrillClient(connect_timeout=1, query_timeout=5)
+    drill.query("select 1")
+    assert timeouts[-1] == ("query.json", (1, 5))
+
+
+def test_drill_client_query_many(fake_drill):
+    sqls = [f"select {i}" for i in range(10)]
+    with drill_client.DrillClient(max_workers=3) as drill:
+        tables = drill.query_many(sqls)
+    assert [table.column("sql")[0].as_py() for table in tables] == sqls
+    # One client per worker thread at most
+    assert len(fake_drill.instances) <= 3
+
+
+def test_drill_client_not_active(fake_drill):
+    fake_drill.active = False
+    with pytest.raises(exceptions.ImproperlyConfigured):
+        drill_client.DrillClient().query("select 1")
+
+
+def test_get_client_shared():
+    assert drill_client.get_client("drill-host", 1) is drill_client.get_client(
+        "drill-host", 1
+    )
+    assert drill_client.get_client("drill-host", 1) is not drill_client.get_client(
+        "drill-host", 2
+    )
+
+
+def test_format_task_query_output_result(capsys):
+    weather_pipeline.format_task_query_output(FakeResult(RESULT_JSON))
+    output = capsys.readouterr().out
+    assert "South Uist Range" in output and "Stornoway" in output
+
+
+@requires_drill
+def test_query_many_drill():
+    tables = drill_client.get_client().query_many(
+        ["select 1 as a from (values(1))", "select 2 as a from (values(1))"]
+    )
+    assert [table.column("a")[0].as_py() for table in tables] == [1, 2]
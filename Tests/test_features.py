@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+import pandas as pd
+import features
+import manifest
+import weather_pipeline
+from Benchmarks import synthetic
+from pandas.testing import assert_frame_equal
+
+
+def site_hours(site_code: int, hours: list, temperatures: list, gusts: list, pressures: list):
+    return pd.DataFrame(
+        {
+            "ForecastSiteCode": site_code,
+            "ObservationDateTime": pd.Timestamp("2016-02-01") + pd.to_timedelta(hours, unit="h"),
+            "ScreenTemperature": temperatures,
+            "WindSpeed": pd.array([10] * len(hours), dtype="Int64"),
+            "WindGust": pd.array(gusts, dtype="Int64"),
+            "Pressure": pd.array(pressures, dtype="Int64"),
+        }
+    )
+
+
+@pytest.fixture
+def weather_months(tmp_path):
+    fpaths = synthetic.generate_weather_csvs(str(tmp_path / "input"), sites=5, months=3)
+    return fpaths, [
+        weather_pipeline.transform_weather_df(weather_pipeline.import_monthly_weather_csv(fpath))
+        for fpath in fpaths
+    ]
+
+
+def test_add_rolling_features():
+    # Site 3005 is missing hour 2, the 24 hours ending at its hour 26 start at hour 3
+    frame_in = pd.concat(
+        [
+            site_hours(3002, [0, 1], [5.0, 3.0], [20, None], [1000, 1001]),
+            site_hours(
+                3005,
+                [0, 1, 3, 6, 26],
+                [1.0, 2.0, 4.0, -1.0, 0.0],
+                [30, None, 10, 12, 15],
+                [990, 991, 995, None, 999],
+            ),
+        ],
+        ignore_index=True,
+    ).sample(frac=1, random_state=0)
+
+    frame_out = features.add_rolling_features(frame_in)
+    # Input rows are left in their order
+    assert frame_out.index.equals(frame_in.index)
+
+    frame_out = frame_out.sort_values(["ForecastSiteCode", "ObservationDateTime"])
+    assert frame_out.PressureTendency3h.to_list() == pytest.approx(
+        [np.nan, np.nan, np.nan, np.nan, 5.0, np.nan, np.nan], nan_ok=True
+    )
+    assert frame_out.MinTemperature24h.to_list() == [5.0, 3.0, 1.0, 1.0, 1.0, -1.0, -1.0]
+    assert frame_out.MaxTemperature24h.to_list() == [5.0, 5.0, 1.0, 2.0, 4.0, 4.0, 4.0]
+    assert frame_out.MeanTemperature24h.to_list() == pytest.approx(
+        [5.0, 4.0, 1.0, 1.5, 7 / 3, 1.5, 1.0]
+    )
+    assert frame_out.MaxWindGust6h.to_list() == [20, 20, 30, 30, 30, 12, 15]
+
+
+@pytest.mark.parametrize(
+    "temperature, wind_speed, expected_wind_chill",
+    [
+        (0.0, 10, -4.61),
+        (-10.0, 30, -21.61),
+        (12.0, 30, 12.0),
+        (5.0, 2, 5.0),
+        (5.0, None, np.nan),
+    ],
+)
+def test_wind_chill(temperature, wind_speed, expected_wind_chill):
+    wind_chill = features.wind_chill(
+        pd.Series([temperature]), pd.Series([wind_speed], dtype="Int64")
+    )[0]
+    assert wind_chill == pytest.approx(expected_wind_chill, abs=0.01, nan_ok=True)
+
+
+def test_feature_tail(weather_months):
+    fpaths, frames = weather_months
+    full_output = features.add_rolling_features(
+        weather_pipeline.concat_weather_frames(frames).reset_index(drop=True)
+    )
+
+    tail = None
+    for frame in frames:
+        frame_out = features.add_rolling_features(frame, tail)
+        tail = features.feature_tail(frame_out, tail)
+
+        # Features of a month with the tail of the months before match the full history
+        expected_output = full_output[
+            full_output.ObservationDate.between(
+                frame.ObservationDate.min(), frame.ObservationDate.max()
+            )
+        ]
+        np.testing.assert_allclose(
+            frame_out[features.FEATURE_COLUMNS].to_numpy(float),
+            expected_output[features.FEATURE_COLUMNS].to_numpy(float),
+        )
+
+    assert tail.ObservationDateTime.nunique() == features.TAIL_HOURS
+    assert tail.columns.to_list() == features.FEATURE_INPUT_COLUMNS
+
+
+def test_run_incremental_rolling_features(tmp_path, weather_months):
+    fpaths, frames = weather_months
+    output_dir = str(tmp_path / "weather")
+
+    # The tail of each run is carried to the next
+    for fpath in fpaths:
+        manifest.run_incremental([fpath], output_dir, processes=1, rolling_features=True)
+
+    full_output = features.add_rolling_features(
+        weather_pipeline.concat_weather_frames(frames).reset_index(drop=True)
+    )
+    assert_frame_equal(
+        pd.read_parquet(manifest.output_part_path(fpaths[-1], output_dir))[
+            features.FEATURE_COLUMNS
+        ],
+        full_output[features.FEATURE_COLUMNS].tail(len(frames[-1])).reset_index(drop=True),
+    )
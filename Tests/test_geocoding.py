@@ -0,0 +1,178 @@
+import asyncio
+import json
+import threading
+import pytest
+import geocoding
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from locationiq.geocoder import LocationIqInvalidKey
+from urllib.parse import parse_qs, urlparse
+
+
+class LocationIqStub(BaseHTTPRequestHandler):
+    """
+    Local stand in for the LocationIQ reverse endpoint
+    Latitude 1 has no places, latitude 2 is rate limited on its first request
+    and the key "invalid" is rejected, as is every request after the first fail_after
+    """
+
+    requests = []
+    fail_after = None
+
+    def do_GET(self):
+        query = {key: value[0] for key, value in parse_qs(urlparse(self.path).query).items()}
+        lat = float(query["lat"])
+        LocationIqStub.requests.append(lat)
+
+        if query["key"] == "invalid" or (
+            LocationIqStub.fail_after is not None
+            and len(LocationIqStub.requests) > LocationIqStub.fail_after
+        ):
+            self.respond(401, {"error": "Invalid key"})
+        elif lat == 1:
+            self.respond(404, {"error": "Unable to geocode"})
+        elif lat == 2 and LocationIqStub.requests.count(2) == 1:
+            self.respond(429, {"error": "Rate Limited"})
+        else:
+            self.respond(200, {"address": {"town": f"Town {lat:g}", "postcode": "ZE2 9EA"}})
+
+    def respond(self, status: int, body: dict):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    LocationIqStub.requests = []
+    LocationIqStub.fail_after = None
+    server = ThreadingHTTPServer(("localhost", 0), LocationIqStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://localhost:{server.server_address[1]}/v1/reverse.php"
+    server.shutdown()
+
+
+@pytest.fixture
+def fpath_cords(tmp_path):
+    fpath = tmp_path / "ForecastSiteCords.csv"
+    fpath.write_text(
+        "ForecastSiteCode,Latitude,Longitude\n"
+        "3001,1,-0.854\n3002,2,-0.854\n3003,3,-0.854\n3004,4,-0.854\n3005,3.00001,-0.854\n"
+    )
+    return str(fpath)
+
+
+def test_get_reverse_geocodes(tmp_path, stub_url, fpath_cords):
+    cache_path = str(tmp_path / "GeocodeCache.json")
+    frame_out = geocoding.get_reverse_geocodes(
+        fpath_cords, cache_path, api_key="key", url=stub_url, rate=100, max_in_flight=4, backoff=0
+    )
+
+    assert frame_out.ForecastSiteCode.to_list() == [3001, 3002, 3003, 3004, 3005]
+    assert frame_out.town.fillna("").to_list() == ["", "Town 2", "Town 3", "Town 4", "Town 3"]
+    # The rate limited site is retried and sites with the same rounded coordinates share a request
+    assert sorted(LocationIqStub.requests) == [1, 2, 2, 3, 4]
+
+    # A rerun is served from the cache
+    LocationIqStub.requests = []
+    geocoding.get_reverse_geocodes(
+        fpath_cords, cache_path, api_key="key", url=stub_url, rate=100
+    )
+    assert LocationIqStub.requests == []
+
+
+def test_get_reverse_geocodes_resumes(tmp_path, stub_url, fpath_cords):
+    cache_path = str(tmp_path / "GeocodeCache.json")
+    with open(cache_path, "w") as f:
+        json.dump({"3.0000,-0.8540": {"town": "Cached"}}, f)
+
+    with pytest.raises(LocationIqInvalidKey):
+        geocoding.get_reverse_geocodes(
+            fpath_cords, cache_path, api_key="invalid", url=stub_url, rate=100
+        )
+
+    frame_out = geocoding.get_reverse_geocodes(
+        fpath_cords, cache_path, api_key="key", url=stub_url, rate=100, backoff=0
+    )
+    assert frame_out.town.to_list()[2] == "Cached"
+    assert 3 not in LocationIqStub.requests
+
+
+@pytest.mark.parametrize(
+    "stop, expected_raise",
+    [("server failure", LocationIqInvalidKey), ("cancelled", asyncio.CancelledError)],
+)
+def test_reverse_geocode_coordinates_checkpoints(tmp_path, stub_url, stop, expected_raise):
+    cache_path = str(tmp_path / "GeocodeCache.json")
+    coordinates = {f"{lat},0": (lat, 0) for lat in range(10, 18)}
+    options = dict(api_key="key", url=stub_url, rate=100, max_in_flight=1, checkpoint_every=3)
+    stop_after = 5
+
+    cache = geocoding.GeocodeCache(cache_path)
+    saved = []
+    save = cache.save
+
+    def save_and_read():
+        save()
+        with open(cache_path) as f:
+            saved.append(len(json.load(f)))
+
+    cache.save = save_and_read
+
+    async def run():
+        task = asyncio.ensure_future(
+            geocoding.reverse_geocode_coordinates(coordinates, cache, **options)
+        )
+        if stop == "server failure":
+            LocationIqStub.fail_after = stop_after
+        else:
+            set_address = cache.set
+
+            def set_and_cancel(key, address):
+                set_address(key, address)
+                if len(cache.addresses) == stop_after:
+                    task.cancel()
+
+            cache.set = set_and_cancel
+        await task
+
+    with pytest.raises(expected_raise):
+        asyncio.run(run())
+
+    # Saved every 3 addresses and when the run stopped
+    assert saved == [3, stop_after]
+    with open(cache_path) as f:
+        cached = json.load(f)
+    assert len(cached) == stop_after
+
+    # A rerun only requests the addresses which are not on disk
+    LocationIqStub.requests, LocationIqStub.fail_after = [], None
+    asyncio.run(
+        geocoding.reverse_geocode_coordinates(
+            coordinates, geocoding.GeocodeCache(cache_path), **options
+        )
+    )
+    assert sorted(f"{lat:g},0" for lat in LocationIqStub.requests) == sorted(
+        set(coordinates) - set(cached)
+    )
+    with open(cache_path) as f:
+        assert sorted(json.load(f)) == sorted(coordinates)
+
+
+def test_token_bucket():
+    async def acquire_all(bucket, count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    async def run():
+        bucket = geocoding.TokenBucket(rate=50, capacity=5)
+        start = geocoding.time.monotonic()
+        await acquire_all(bucket, 15)
+        return geocoding.time.monotonic() - start
+
+    # 5 requests burst immediately and the other 10 wait for 0.2s of tokens
+    assert 0.15 < geocoding.asyncio.run(run()) < 1
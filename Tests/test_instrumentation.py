@@ -0,0 +1,140 @@
+import json
+import logging
+import pytest
+import numpy as np
+import pandas as pd
+import instrumentation
+import weather_pipeline
+
+EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
+
+
+@pytest.fixture(autouse=True)
+def reset_instrumentation():
+    instrumentation.reset()
+    yield
+    instrumentation.configure()
+    instrumentation.reset()
+
+
+@weather_pipeline.log_error(None)
+def double_rows(frame_in: pd.DataFrame) -> pd.DataFrame:
+    return pd.concat([frame_in, frame_in])
+
+
+@weather_pipeline.log_error(None)
+def fail(frame_in: pd.DataFrame):
+    raise ValueError("failed")
+
+
+@weather_pipeline.log_error(None)
+def allocate_inner():
+    return np.ones(2 ** 20)
+
+
+@weather_pipeline.log_error(None)
+def allocate_outer():
+    allocate_inner()
+    return None
+
+
+def test_log_error_records_stage():
+    frame_in = pd.DataFrame({"a": range(10)})
+    double_rows(frame_in)
+
+    record = instrumentation.METRICS[-1]
+    assert record["stage"] == "double_rows"
+    assert (record["rows_in"], record["rows_out"]) == (10, 20)
+    assert record["wall_seconds"] >= 0 and record["cpu_seconds"] >= 0
+    assert record["error"] is None
+
+
+def test_log_error_records_error():
+    with pytest.raises(ValueError):
+        fail(pd.DataFrame({"a": range(3)}))
+    assert instrumentation.METRICS[-1]["error"] == "ValueError"
+    assert instrumentation.run_summary()["fail"]["errors"] == 1
+
+
+def test_log_error_keeps_logging_alive(tmp_path):
+    handler = logging.FileHandler(tmp_path / "error.log")
+    weather_pipeline.clogger.addHandler(handler)
+    try:
+        weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+        assert handler.stream is not None
+    finally:
+        weather_pipeline.clogger.removeHandler(handler)
+        handler.close()
+
+
+def test_trace_memory_nested_stages():
+    instrumentation.configure(trace_memory=True)
+    allocate_outer()
+
+    inner, outer = instrumentation.METRICS
+    assert inner["memory_source"] == "tracemalloc"
+    # One million float64 values is 8 MB
+    assert inner["peak_memory_delta_mb"] >= 7.9
+    assert outer["peak_memory_delta_mb"] >= inner["peak_memory_delta_mb"]
+
+
+def test_metrics_file_and_profile(tmp_path):
+    fpath_metrics = tmp_path / "metrics.jsonl"
+    fpath_profile = tmp_path / "transform.prof"
+    instrumentation.configure(
+        metrics_path=str(fpath_metrics),
+        profile_stage="transform_weather_df",
+        profile_path=str(fpath_profile),
+    )
+    weather_pipeline.transform_weather_df(
+        weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+    )
+    for handler in instrumentation.metrics_logger.handlers:
+        handler.flush()
+
+    records = [json.loads(line) for line in fpath_metrics.read_text().splitlines()]
+    stages = [record["stage"] for record in records]
+    assert stages == ["import_monthly_weather_csv", "transform_weather_df"]
+    assert fpath_profile.exists()
+
+    summary = instrumentation.run_summary()
+    assert summary["transform_weather_df"]["rows_in"] == 12
+    assert "transform_weather_df" in instrumentation.format_run_summary(summary)
+
+
+def test_clear_metrics_keeps_summary():
+    frame_in = pd.DataFrame({"a": [1, 2]})
+    double_rows(frame_in)
+    instrumentation.clear_metrics()
+    double_rows(frame_in)
+
+    assert len(instrumentation.METRICS) == 1
+    summary = instrumentation.run_summary()
+    assert summary["double_rows"]["calls"] == 2
+    assert summary["double_rows"]["rows_out"] == 8
+    # The totals of the cleared records are not changed by summarising again
+    assert instrumentation.run_summary() == summary
+    assert instrumentation.run_summary(instrumentation.METRICS)["double_rows"]["calls"] == 1
+
+    instrumentation.reset()
+    assert instrumentation.run_summary() == {}
+
+
+def test_configure_replaces_metrics_file(tmp_path):
+    fpath_first, fpath_second = tmp_path / "first.jsonl", tmp_path / "second.jsonl"
+    instrumentation.configure(metrics_path=str(fpath_first))
+    first_handler = instrumentation.metrics_logger.handlers[-1]
+    instrumentation.configure(metrics_path=str(fpath_second))
+    double_rows(pd.DataFrame({"a": [1]}))
+    instrumentation.clear_metrics()
+
+    assert first_handler not in instrumentation.metrics_logger.handlers
+    assert first_handler.stream is None
+    assert fpath_first.read_text() == ""
+    assert len(fpath_second.read_text().splitlines()) == 1
+    assert instrumentation.METRICS == []
+
+    # Configuring without a metrics file closes it
+    instrumentation.configure()
+    assert not instrumentation.metrics_logger.handlers
+    assert not instrumentation.metrics_logger.isEnabledFor(logging.INFO)
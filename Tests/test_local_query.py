@@ -0,0 +1,57 @@
+import pytest
+import pandas as pd
+import local_query
+import weather_pipeline
+from pandas.testing import assert_frame_equal
+
+
+def drill_task_query(frame_in: pd.DataFrame) -> pd.DataFrame:
+    """
+    The Drill task query written with pandas on the full DataFrame
+    """
+    daily_averages = (
+        frame_in.groupby(["ObservationDate", "Region", "SiteName"], dropna=False)
+        .ScreenTemperature.mean()
+        .map(local_query.round_half_up)
+        .rename("DailyAverageTemperature")
+        .reset_index()
+    )
+    return daily_averages[
+        daily_averages.DailyAverageTemperature
+        == daily_averages.DailyAverageTemperature.max()
+    ].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("partitioned", [False, True])
+def test_max_daily_average_temperature(tmp_path, weather_frame, partitioned):
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    weather_pipeline.export_weather_to_parquet(
+        weather_frame, fpath_parquet, partitioned=partitioned
+    )
+    assert_frame_equal(
+        local_query.max_daily_average_temperature(fpath_parquet),
+        drill_task_query(weather_frame),
+    )
+
+
+def test_max_daily_average_temperature_ties(tmp_path, weather_frame):
+    # Both sites average 9.8 once rounded to 2 places
+    weather_frame = weather_frame.assign(
+        ScreenTemperature=lambda df: df.ScreenTemperature.where(
+            df.SiteName != "Stornoway", 9.799
+        )
+    )
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    weather_pipeline.export_weather_to_parquet(weather_frame, fpath_parquet)
+
+    frame_out = local_query.max_daily_average_temperature(fpath_parquet)
+    assert frame_out.SiteName.to_list() == ["Stornoway", "South Uist Range"]
+    assert_frame_equal(frame_out, drill_task_query(weather_frame))
+
+
+@pytest.mark.parametrize(
+    "value, expected_output",
+    [(0.125, 0.13), (-0.125, -0.13), (2.675, 2.67), (12.666666666666666, 12.67)],
+)
+def test_round_half_up(value, expected_output):
+    assert local_query.round_half_up(value) == expected_output
@@ -0,0 +1,164 @@
+import os
+import shutil
+import pytest
+import pandas as pd
+import aggregates
+import catalog
+import manifest
+import weather_pipeline
+from pandas.testing import assert_frame_equal
+from Benchmarks import synthetic
+
+EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
+
+
+def test_run_incremental(tmp_path):
+    fpaths = [str(tmp_path / "weather.20160201.csv"), str(tmp_path / "weather.20160301.csv")]
+    for fpath in fpaths:
+        shutil.copy(EXAMPLE_INPUT_DATA_PATH, fpath)
+    output_dir = str(tmp_path / "weather")
+
+    assert manifest.run_incremental(fpaths, output_dir, processes=1) == fpaths
+    assert_frame_equal(
+        pd.read_parquet(manifest.output_part_path(fpaths[0], output_dir)),
+        weather_pipeline.transform_weather_df(
+            weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+        ).reset_index(drop=True),
+        check_categorical=False,
+    )
+
+    # Unchanged and touched files are skipped
+    os.utime(fpaths[0])
+    assert manifest.run_incremental(fpaths, output_dir, processes=1) == []
+
+    # Changed and new files are processed
+    with open(fpaths[1], "a") as f:
+        f.write(
+            "3002,1,2016-03-01T00:00:00,12,8,,30000,2.1,997,8,BALTASOUND (3002),"
+            "60.749,-0.854,Orkney & Shetland,SCOTLAND\n"
+        )
+    fpath_new = str(tmp_path / "weather.20160401.csv")
+    shutil.copy(EXAMPLE_INPUT_DATA_PATH, fpath_new)
+    assert manifest.run_incremental(fpaths + [fpath_new], output_dir, processes=1) == [
+        fpaths[1],
+        fpath_new,
+    ]
+
+    processed = manifest.load_manifest(output_dir)
+    assert sorted(processed) == sorted(fpaths + [fpath_new])
+    assert processed[fpaths[1]]["rows"] == 13
+    # The catalog has the zone map of every output file
+    entries = catalog.load_catalog(output_dir)
+    assert sorted(entries) == sorted(
+        os.path.basename(entry["output"]) for entry in processed.values()
+    )
+    assert entries["weather.20160301.parquet"]["rows"] == 13
+
+
+def test_run_incremental_dedupe_existing(tmp_path):
+    # The second delivery repeats the first and adds one new site hour
+    fpaths = [str(tmp_path / "weather.20160201.csv"), str(tmp_path / "weather.20160202.csv")]
+    shutil.copy(EXAMPLE_INPUT_DATA_PATH, fpaths[0])
+    shutil.copy(EXAMPLE_INPUT_DATA_PATH, fpaths[1])
+    with open(fpaths[1], "a") as f:
+        f.write(
+            "3002,1,2016-02-01T00:00:00,12,8,,30000,2.1,997,8,BALTASOUND (3002),"
+            "60.749,-0.854,Orkney & Shetland,SCOTLAND\n"
+        )
+    output_dir = str(tmp_path / "weather")
+
+    manifest.run_incremental(fpaths[:1], output_dir, processes=1, dedupe_existing=True)
+    manifest.run_incremental(fpaths, output_dir, processes=1, dedupe_existing=True)
+
+    processed = manifest.load_manifest(output_dir)
+    assert (processed[fpaths[0]]["rows"], processed[fpaths[1]]["rows"]) == (12, 1)
+    assert len(pd.read_parquet(output_dir)) == 13
+
+
+def test_run_incremental_site_day_split_across_files(tmp_path):
+    # Hours 0 to 11 of every site day are in one file and hours 12 to 23 in the other
+    fpath_month = synthetic.generate_weather_csvs(str(tmp_path / "input"), sites=3)[0]
+    month = pd.read_csv(fpath_month)
+    fpaths = [str(tmp_path / "weather.20160201.csv"), str(tmp_path / "weather.20160202.csv")]
+    month[month.ObservationTime < 12].to_csv(fpaths[0], index=False)
+    month[month.ObservationTime >= 12].to_csv(fpaths[1], index=False)
+    output_dir = str(tmp_path / "weather")
+    fpath_aggregates = str(tmp_path / "weather_site_day.parquet")
+
+    for fpath in fpaths:
+        manifest.run_incremental(
+            [fpath], output_dir, processes=1, fpath_aggregates=fpath_aggregates
+        )
+
+    expected_site_days = aggregates.site_day_aggregates(
+        weather_pipeline.transform_weather_df(
+            weather_pipeline.import_monthly_weather_csv(fpath_month)
+        )
+    )
+    site_days = pd.read_parquet(fpath_aggregates)
+    assert (site_days.ReadingCount == 24).all()
+    assert_frame_equal(
+        site_days.reset_index(drop=True),
+        expected_site_days.sort_values(aggregates.SITE_DAY_KEYS).reset_index(drop=True),
+        check_categorical=False,
+    )
+
+    # A changed file's site days are recomputed, those with no readings left are removed
+    month[
+        (month.ObservationTime >= 12) & ~month.ObservationDate.str.startswith("2016-02-01")
+    ].to_csv(fpaths[1], index=False)
+    manifest.run_incremental(
+        fpaths, output_dir, processes=1, fpath_aggregates=fpath_aggregates
+    )
+    site_days = pd.read_parquet(fpath_aggregates)
+    assert len(site_days) == len(expected_site_days)
+    assert site_days.ReadingCount.to_list() == [12] * 3 + [24] * (len(site_days) - 3)
+
+
+@pytest.mark.parametrize(
+    "dedupe_policy, redelivered_row, expected_rows, expected_temperature",
+    [
+        ("first", "12,8,30,30000,5.0,997", (12, 0), 2.1),
+        ("last", "12,8,,30000,5.0,997", (11, 1), 5.0),
+        # The redelivered row has a WindGust, the written row does not
+        ("most_complete", "12,8,30,30000,5.0,997", (11, 1), 5.0),
+        ("most_complete", "12,8,,30000,5.0,", (12, 0), 2.1),
+    ],
+)
+def test_run_incremental_dedupe_existing_policy(
+    tmp_path, dedupe_policy, redelivered_row, expected_rows, expected_temperature
+):
+    # The second delivery repeats the first observation of the first one
+    fpaths = [str(tmp_path / "weather.20160201.csv"), str(tmp_path / "weather.20160202.csv")]
+    shutil.copy(EXAMPLE_INPUT_DATA_PATH, fpaths[0])
+    with open(EXAMPLE_INPUT_DATA_PATH) as f:
+        header = f.readline()
+    with open(fpaths[1], "w") as f:
+        f.write(
+            f"{header}3002,0,2016-02-01T00:00:00,{redelivered_row},8,BALTASOUND (3002),"
+            "60.749,-0.854,Orkney & Shetland,SCOTLAND\n"
+        )
+    output_dir = str(tmp_path / "weather")
+    fpath_aggregates = str(tmp_path / "weather_site_day.parquet")
+
+    for fpath in fpaths:
+        manifest.run_incremental(
+            [fpath],
+            output_dir,
+            processes=1,
+            fpath_aggregates=fpath_aggregates,
+            dedupe_policy=dedupe_policy,
+            dedupe_existing=True,
+        )
+
+    processed = manifest.load_manifest(output_dir)
+    assert (processed[fpaths[0]]["rows"], processed[fpaths[1]]["rows"]) == expected_rows
+    output = pd.read_parquet(output_dir)
+    assert len(output) == 12
+    baltasound = output[output.ForecastSiteCode == 3002].ScreenTemperature
+    assert baltasound.to_list() == [expected_temperature]
+
+    site_days = pd.read_parquet(fpath_aggregates)
+    assert site_days[site_days.ForecastSiteCode == 3002].MeanTemperature.to_list() == [
+        expected_temperature
+    ]
@@ -0,0 +1,83 @@
+import json
+import pytest
+import pandas as pd
+import instrumentation
+import parallel
+import weather_pipeline
+from pandas.testing import assert_frame_equal
+
+EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
+MISSING_DATA_PATH = "Data/CSVTestFiles/missing-data.csv"
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_run_weather_files(processes):
+    fpaths = [EXAMPLE_INPUT_DATA_PATH, "Data/CSVTestFiles/test-out.csv"]
+    expected_output = weather_pipeline.transform_weather_df(
+        pd.concat(weather_pipeline.import_monthly_weather_csv(fpath) for fpath in fpaths)
+    )
+    assert_frame_equal(parallel.run_weather_files(fpaths, processes), expected_output)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_run_weather_files_records_file_stages(tmp_path, processes):
+    fpath_metrics = tmp_path / "metrics.jsonl"
+    instrumentation.reset()
+    instrumentation.configure(metrics_path=str(fpath_metrics))
+    try:
+        with pytest.raises(parallel.WeatherFileError):
+            parallel.run_weather_files(
+                [EXAMPLE_INPUT_DATA_PATH, "Data/CSVTestFiles/test-out.csv", MISSING_DATA_PATH],
+                processes,
+            )
+        summary = instrumentation.run_summary()
+    finally:
+        instrumentation.configure()
+        instrumentation.reset()
+
+    # The stages run in worker processes are recorded in this one, failed ones too
+    assert summary["import_monthly_weather_csv"]["calls"] == 3
+    assert summary["validate_weather_data"]["calls"] == 3
+    assert summary["validate_weather_data"]["errors"] == 1
+    assert summary["transform_weather_df"]["calls"] == 2
+    assert summary["transform_weather_df"]["rows_in"] == 24
+    # Each record is written to the metrics file once
+    stages = [
+        json.loads(line)["stage"] for line in fpath_metrics.read_text().splitlines()
+    ]
+    assert stages.count("import_monthly_weather_csv") == 3
+    assert stages.count("run_weather_files") == 1
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test2_run_weather_files(processes):
+    with pytest.raises(parallel.WeatherFileError) as error:
+        parallel.run_weather_files(
+            [EXAMPLE_INPUT_DATA_PATH, MISSING_DATA_PATH], processes
+        )
+    assert error.value.fpath == MISSING_DATA_PATH
+    assert "DataValidationError" in str(error.value)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_run_weather_files_quarantine(processes, tmp_path):
+    frame_out = parallel.run_weather_files(
+        [EXAMPLE_INPUT_DATA_PATH, MISSING_DATA_PATH],
+        processes,
+        quarantine_dir=str(tmp_path),
+        max_reject_rate=0.5,
+    )
+    assert frame_out.ObservationDateTime.notna().all()
+
+    quarantine = pd.read_parquet(tmp_path / "missing-data.parquet")
+    assert quarantine.SourceRow.to_list() == [3, 6, 8]
+    assert (quarantine.SourceFile == MISSING_DATA_PATH).all()
+    assert not (tmp_path / "example-input-data.parquet").exists()
+
+
+def test_run_weather_files_reject_rate(tmp_path):
+    with pytest.raises(parallel.WeatherFileError) as error:
+        parallel.run_weather_files(
+            [EXAMPLE_INPUT_DATA_PATH, MISSING_DATA_PATH], 1, quarantine_dir=str(tmp_path)
+        )
+    assert "RejectRateError" in str(error.value)
@@ -0,0 +1,128 @@
+import os
+import pytest
+import pandas as pd
+import local_query
+import reports
+import weather_pipeline
+from pandas.testing import assert_frame_equal
+
+
+@pytest.fixture
+def fpath_parquet(tmp_path, weather_frame):
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    weather_pipeline.export_weather_to_parquet(weather_frame, fpath_parquet)
+    return fpath_parquet
+
+
+@pytest.mark.parametrize(
+    "report, expected_site, expected_temperature",
+    [
+        ("hottest_day", "South Uist Range", 9.8),
+        ("coldest_day", "Lerwick (S. Screen)", 0.1),
+    ],
+)
+def test_extreme_days(fpath_parquet, report, expected_site, expected_temperature):
+    frame_out = reports.run_report(report, fpath_parquet)
+    assert frame_out.SiteName.to_list() == [expected_site]
+    assert frame_out.DailyAverageTemperature.to_list() == [expected_temperature]
+
+
+def test_hottest_day_matches_local_query(fpath_parquet):
+    assert_frame_equal(
+        reports.run_report("hottest_day", fpath_parquet),
+        local_query.max_daily_average_temperature(fpath_parquet),
+    )
+
+
+@pytest.mark.parametrize(
+    "start_date, end_date, regions",
+    [
+        (None, None, None),
+        ("2016-02-05", "2016-02-21", None),
+        (None, None, ["Orkney & Shetland", "North West England"]),
+        ("2016-02-01", "2016-02-01", ["Highland & Eilean Siar"]),
+    ],
+)
+def test_region_daily_stats(fpath_parquet, weather_frame, start_date, end_date, regions):
+    frame_in = weather_frame
+    if start_date is not None:
+        frame_in = frame_in[frame_in.ObservationDate >= start_date]
+    if end_date is not None:
+        frame_in = frame_in[frame_in.ObservationDate <= end_date]
+    if regions is not None:
+        frame_in = frame_in[frame_in.Region.isin(regions)]
+
+    expected_output = (
+        frame_in.groupby(["ObservationDate", "Region"], observed=True)
+        .agg(
+            MeanTemperature=("ScreenTemperature", "mean"),
+            ReadingCount=("ScreenTemperature", "size"),
+        )
+        .reset_index()
+        .assign(Region=lambda df: df.Region.astype(str))
+        .sort_values(["ObservationDate", "Region"])
+    )
+    frame_out = reports.run_report(
+        "region_daily_stats", fpath_parquet, start_date, end_date, regions
+    )
+    assert frame_out.ObservationDate.to_list() == expected_output.ObservationDate.to_list()
+    assert frame_out.Region.astype(str).to_list() == expected_output.Region.to_list()
+    assert frame_out.ReadingCount.to_list() == expected_output.ReadingCount.to_list()
+    assert frame_out.MeanTemperature.to_list() == pytest.approx(
+        expected_output.MeanTemperature.to_list(), nan_ok=True
+    )
+
+
+def test_windiest_sites(fpath_parquet):
+    frame_out = reports.run_report("windiest_sites", fpath_parquet, top=3)
+    assert frame_out.SiteName.to_list() == ["Aonach Mor", "South Uist Range", "Stornoway"]
+
+
+def test_visibility_distribution(fpath_parquet, weather_frame):
+    frame_out = reports.run_report("visibility_distribution", fpath_parquet)
+    assert frame_out.ReadingCount.sum() == len(weather_frame)
+    assert frame_out.Share.sum() == pytest.approx(1)
+    # Worst to best visibility with missing readings last
+    assert frame_out.VisibilityDescription.to_list()[:-1] == [
+        "Poor",
+        "Moderate",
+        "Very good",
+        "Excellent",
+    ]
+    assert pd.isna(frame_out.VisibilityDescription.iloc[-1])
+
+
+def test_run_report_unknown(fpath_parquet):
+    with pytest.raises(ValueError):
+        reports.run_report("wettest_day", fpath_parquet)
+
+
+def test_run_report_cache(fpath_parquet, weather_frame, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    calls = []
+
+    def counted_windiest_sites(*args, **kwargs):
+        calls.append(args)
+        return reports.windiest_sites(*args, **kwargs)
+
+    monkeypatch.setitem(reports.REPORTS, "windiest_sites", counted_windiest_sites)
+
+    first = reports.run_report("windiest_sites", fpath_parquet, cache_dir=cache_dir, top=2)
+    second = reports.run_report("windiest_sites", fpath_parquet, cache_dir=cache_dir, top=2)
+    assert len(calls) == 1
+    assert_frame_equal(first, second)
+
+    # Other parameters are cached separately
+    reports.run_report("windiest_sites", fpath_parquet, cache_dir=cache_dir, top=3)
+    assert len(calls) == 2
+
+    # New output changes the fingerprint so the cached result is not reused
+    weather_pipeline.export_weather_to_parquet(
+        weather_frame[weather_frame.SiteName != "Aonach Mor"], fpath_parquet
+    )
+    third = reports.run_report("windiest_sites", fpath_parquet, cache_dir=cache_dir, top=2)
+    assert len(calls) == 3
+    assert "Aonach Mor" not in third.SiteName.to_list()
+
+    assert reports.clear_cache(cache_dir) == 3
+    assert os.listdir(cache_dir) == []
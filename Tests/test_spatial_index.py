@@ -0,0 +1,51 @@
+import pytest
+import pandas as pd
+import spatial_index
+import weather_pipeline
+
+EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
+
+
+@pytest.fixture
+def site_index():
+    sites = pd.DataFrame(
+        {
+            "ForecastSiteCode": [3002, 3772],
+            "Latitude": [60.749, 51.479],
+            "Longitude": [-0.854, -0.449],
+            "Locality": ["Baltasound", "Harlington"],
+            "Postcode": ["ZE2 9EA", "TW6 1EW"],
+            "AddressRegion": ["Shetland Islands", "London Borough of Hillingdon"],
+        }
+    )
+    return spatial_index.SiteIndex(sites, max_distance_km=10)
+
+
+def test_nearest_distance(site_index):
+    # Heathrow to Paris Charles de Gaulle
+    distance, index = site_index.nearest([49.0097], [2.5479])
+    assert distance[0] == pytest.approx(347.7, abs=0.5)
+    assert index[0] == 1
+
+
+@pytest.mark.parametrize(
+    "latitude, longitude, expected_locality",
+    [
+        (60.749, -0.854, "Baltasound"),  # known site
+        (51.5, -0.5, "Harlington"),  # unknown site 4km away
+        (55.0, -3.0, None),  # unknown site too far from a known site
+    ],
+)
+def test_lookup(site_index, latitude, longitude, expected_locality):
+    assert site_index.lookup([latitude], [longitude]).Locality[0] == expected_locality
+
+
+def test_transform_weather_df_site_index(site_index):
+    frame_in = weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+    frame_out = weather_pipeline.transform_weather_df(frame_in, site_index=site_index)
+
+    assert len(frame_out) == len(frame_in)
+    assert frame_out.set_index("SiteName").Postcode.dropna().to_dict() == {
+        "Heathrow": "TW6 1EW"
+    }
+    assert frame_out.index.equals(weather_pipeline.transform_weather_df(frame_in).index)
@@ -0,0 +1,49 @@
+import pandas as pd
+import local_query
+import star_schema
+import weather_pipeline
+from pandas.testing import assert_frame_equal
+
+
+def test_split_weather_frame(weather_frame):
+    sites, observations = star_schema.split_weather_frame(weather_frame)
+
+    assert sites.ForecastSiteCode.is_unique
+    assert len(sites) == weather_frame.ForecastSiteCode.nunique()
+    assert list(observations.columns) == star_schema.OBSERVATION_COLUMNS
+    assert len(observations) == len(weather_frame)
+
+
+def test_build_sites_isle_of_man(weather_frame):
+    isle_of_man = weather_frame.iloc[:1].assign(
+        ForecastSiteCode=3204, Region="North West England", Country="England"
+    )
+    sites = star_schema.build_sites(pd.concat([weather_frame, isle_of_man]))
+    site = sites[sites.ForecastSiteCode == 3204].iloc[0]
+    assert (site.Region, site.Country) == ("Isle of Man", "Isle of Man")
+
+
+def test_read_star_schema(weather_frame, tmp_path):
+    star_schema.export_star_schema(weather_frame, str(tmp_path))
+    assert_frame_equal(
+        star_schema.read_star_schema(str(tmp_path)),
+        weather_frame.reset_index(drop=True),
+        check_categorical=False,
+    )
+
+
+def test_max_daily_average_temperature(weather_frame, tmp_path):
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    weather_pipeline.export_weather_to_parquet(weather_frame, fpath_parquet)
+    star_schema.export_star_schema(weather_frame, str(tmp_path / "star"))
+    assert_frame_equal(
+        star_schema.max_daily_average_temperature(str(tmp_path / "star")),
+        local_query.max_daily_average_temperature(fpath_parquet),
+        check_categorical=False,
+    )
+
+
+def test_weather_view_sql():
+    sql = star_schema.weather_view_sql("dfs.`/data/weather_star`")
+    assert "dfs.`/data/weather_star/observations.parquet` o" in sql
+    assert "dfs.`/data/weather_star/sites.parquet` s" in sql
@@ -0,0 +1,102 @@
+import pytest
+import numpy as np
+import pandas as pd
+import validators
+import weather_pipeline
+
+EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
+MISSING_DATA_PATH = "Data/CSVTestFiles/missing-data.csv"
+
+
+def pandas_schema_failures(frame_in):
+    """
+    Returns the set of (column, row) cell failures found by pandas_schema
+    """
+    return {
+        (error.column, error.row)
+        for error in weather_pipeline.build_pandas_schema().validate(frame_in)
+        if error.row != -1
+    }
+
+
+def vectorized_failures(frame_in):
+    """
+    Returns the set of (column, row) cell failures found by the vectorized engine
+    """
+    return {
+        (column, row)
+        for column, rule, failed in validators.rule_failures(frame_in)
+        if not isinstance(rule, validators.schema.IsDtype)
+        for row in frame_in.index[failed]
+    }
+
+
+@pytest.mark.parametrize("test_path", [EXAMPLE_INPUT_DATA_PATH, MISSING_DATA_PATH])
+def test_rule_failures_match_pandas_schema(test_path):
+    frame_in = weather_pipeline.import_monthly_weather_csv(test_path)
+    assert vectorized_failures(frame_in) == pandas_schema_failures(frame_in)
+
+
+@pytest.mark.parametrize(
+    "test_path, expected_summary",
+    [
+        (EXAMPLE_INPUT_DATA_PATH, []),
+        (
+            MISSING_DATA_PATH,
+            [
+                ("ForecastSiteCode", "InRange", 1, [3]),
+                ("ObservationDate", "DateFormat", 2, [3, 8]),
+                ("WindDirection", "InRange", 1, [3]),
+                ("WindGust", "InRange", 1, [3]),
+                ("ScreenTemperature", "InRange", 1, [3]),
+                ("ScreenTemperature", "IsDtype", 1, []),
+                ("Pressure", "InRange", 1, [3]),
+                ("SignificantWeatherCode", "InRange", 1, [3]),
+                ("Latitude", "InRange", 1, [3]),
+                ("Longitude", "InRange", 2, [3, 6]),
+                ("Longitude", "IsDtype", 1, []),
+            ],
+        ),
+    ],
+)
+def test_summarise_validation_errors(test_path, expected_summary):
+    frame_in = weather_pipeline.import_monthly_weather_csv(test_path)
+    assert [
+        summary[:4] for summary in validators.summarise_validation_errors(frame_in)
+    ] == expected_summary
+
+
+def test_summarise_validation_errors_column_count():
+    frame_in = weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+    summaries = validators.summarise_validation_errors(frame_in.iloc[:, :-1])
+    assert [summary.rule for summary in summaries] == ["ColumnCount"]
+
+
+def test_rejection_reasons():
+    frame_in = weather_pipeline.import_monthly_weather_csv(MISSING_DATA_PATH)
+    reasons = validators.rejection_reasons(frame_in)
+    assert list(pd.isna(reasons).nonzero()[0]) == [0, 1, 2, 4, 5, 7, 9, 10]
+    assert reasons[6] == "Longitude:InRange;Longitude:IsDtype"
+    assert reasons[8] == "ObservationDate:DateFormat"
+    # Every failing cell is named in its row's reasons
+    for column, row in vectorized_failures(frame_in):
+        assert f"{column}:" in reasons[row]
+
+
+def test_rejection_reasons_valid():
+    frame_in = weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+    assert pd.isna(validators.rejection_reasons(frame_in)).all()
+
+
+@pytest.mark.parametrize(
+    "values, dtype, expected_output",
+    [
+        ([1, 2], "int64", [False, False]),
+        ([1.0, None, 2.5, "x"], "int64", [False, True, True, True]),
+        ([1.5, None, "x", "2"], "float64", [False, False, True, False]),
+    ],
+)
+def test_row_dtype_failures(values, dtype, expected_output):
+    assert list(
+        validators.row_dtype_failures(pd.Series(values), np.dtype(dtype))
+    ) == expected_output
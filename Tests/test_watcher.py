@@ -0,0 +1,123 @@
+import os
+import shutil
+import threading
+import time
+import pandas as pd
+import instrumentation
+import manifest
+import watcher
+
+EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
+MISSING_DATA_PATH = "Data/CSVTestFiles/missing-data.csv"
+
+
+def wait_for(condition, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_folder_watcher_settles(tmp_path):
+    folder = watcher.FolderWatcher(str(tmp_path), settle_seconds=5)
+    fpath = str(tmp_path / "weather.20160201.csv")
+    shutil.copy(EXAMPLE_INPUT_DATA_PATH, fpath)
+    (tmp_path / "notes.txt").write_text("not a weather file")
+
+    assert folder.poll(now=0) == []
+    # Still being written
+    with open(fpath, "a") as f:
+        f.write("\n")
+    assert folder.poll(now=4) == []
+    assert folder.poll(now=8) == []
+    assert folder.poll(now=9) == [fpath]
+    # Submitted files are only returned again once they change
+    assert folder.poll(now=20) == []
+    os.utime(fpath, (1, 1))
+    assert folder.poll(now=21) == []
+    assert folder.poll(now=26) == [fpath]
+
+
+def test_folder_watcher_skips_submitted(tmp_path):
+    fpath = str(tmp_path / "weather.20160201.csv")
+    shutil.copy(EXAMPLE_INPUT_DATA_PATH, fpath)
+    stat = os.stat(fpath)
+    folder = watcher.FolderWatcher(
+        str(tmp_path), settle_seconds=0, submitted={fpath: (stat.st_size, stat.st_mtime)}
+    )
+    assert folder.poll(now=0) == []
+    assert folder.poll(now=1) == []
+
+
+def test_watch_service(tmp_path):
+    input_dir, output_dir = tmp_path / "input", str(tmp_path / "weather")
+    input_dir.mkdir()
+    service = watcher.WatchService(
+        str(input_dir),
+        output_dir,
+        poll_seconds=0.05,
+        settle_seconds=0.1,
+        batch_wait_seconds=0.2,
+        processes=1,
+    )
+    thread = threading.Thread(target=service.run, kwargs={"handle_signals": False})
+    thread.start()
+    try:
+        fpaths = [str(input_dir / f"weather.2016020{day}.csv") for day in (1, 2)]
+        for fpath in fpaths:
+            shutil.copy(EXAMPLE_INPUT_DATA_PATH, fpath)
+        wait_for(lambda: len(service.processed) == 2)
+        assert sorted(service.processed) == fpaths
+
+        # A failing file is skipped and the rest of its batch is written
+        fpath_bad = str(input_dir / "weather.20160301.csv")
+        shutil.copy(MISSING_DATA_PATH, fpath_bad)
+        fpath_new = str(input_dir / "weather.20160401.csv")
+        shutil.copy(EXAMPLE_INPUT_DATA_PATH, fpath_new)
+        wait_for(lambda: len(service.processed) == 3)
+        assert service.processed[-1] == fpath_new
+        assert service.failed == [fpath_bad]
+    finally:
+        service.stop()
+        thread.join(timeout=20)
+    assert not thread.is_alive()
+    # Stage records are cleared after each batch so a long run does not hold them all
+    assert instrumentation.METRICS == []
+
+    assert sorted(manifest.load_manifest(output_dir)) == sorted(fpaths + [fpath_new])
+    assert len(pd.read_parquet(output_dir)) == 3 * 12
+
+
+def test_watch_service_restart(tmp_path):
+    output_dir = str(tmp_path / "weather")
+    fpath = str(tmp_path / "weather.20160201.csv")
+    shutil.copy(EXAMPLE_INPUT_DATA_PATH, fpath)
+    manifest.run_incremental([fpath], output_dir, processes=1)
+
+    # Files already in the output manifest are not run again
+    service = watcher.WatchService(str(tmp_path), output_dir, settle_seconds=0)
+    assert service.watcher.poll(now=0) == []
+
+
+def test_watch_service_backpressure(tmp_path):
+    for day in range(1, 4):
+        shutil.copy(EXAMPLE_INPUT_DATA_PATH, tmp_path / f"weather.2016020{day}.csv")
+    service = watcher.WatchService(
+        str(tmp_path),
+        str(tmp_path / "weather"),
+        poll_seconds=0.05,
+        settle_seconds=0,
+        batch_files=1,
+        queue_size=1,
+    )
+    # Nothing takes batches off the queue so the scan waits with one batch queued
+    scanner = threading.Thread(target=service.scan)
+    scanner.start()
+    wait_for(service.batches.full)
+    time.sleep(0.3)
+    assert service.batches.qsize() == 1
+    assert scanner.is_alive()
+    service.stop()
+    scanner.join(timeout=5)
+    assert not scanner.is_alive()
+    assert service.batches.get_nowait() == [str(tmp_path / "weather.20160201.csv")]
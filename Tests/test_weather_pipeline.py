@@ -1,12 +1,15 @@
 import pytest
+import schema
 import weather_pipeline
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pandas.testing import assert_frame_equal
 from contextlib import contextmanager
 
 # exists in eval string
 # noinspection PyUnresolvedReferences
-from pydrill import exceptions
+from pydrill import client, exceptions
 
 EXAMPLE_INPUT_DATA_PATH = "Data/example-input-data.csv"
 PARQUET_FILE_DFS_ABS_PATH = (
@@ -14,6 +17,12 @@ PARQUET_FILE_DFS_ABS_PATH = (
 )
 
 
+requires_drill = pytest.mark.skipif(
+    not client.PyDrill(host="localhost", port=8047).is_active(),
+    reason="Apache Drill is not running on localhost:8047",
+)
+
+
 @contextmanager
 def not_raises(expected_exception):
     try:
@@ -28,7 +37,10 @@ def not_raises(expected_exception):
 
 # import_monthly_weather_csv unit tests
 
-df_func_example_out = pd.read_csv("Data/CSVTestFiles/test-out.csv")
+df_func_example_out = pd.read_csv(
+    "Data/CSVTestFiles/test-out.csv",
+    dtype=weather_pipeline.IMPORT_CATEGORICAL_DTYPES,
+)
 
 
 @pytest.mark.parametrize(
@@ -65,6 +77,67 @@ def test2_import_monthly_weather_csv(test_path, expected_exception):
         weather_pipeline.import_monthly_weather_csv(test_path)
 
 
+@pytest.mark.parametrize("chunksize", [1, 5, 100])
+def test_import_monthly_weather_csv_chunks(chunksize):
+    chunks = list(
+        weather_pipeline.import_monthly_weather_csv_chunks(
+            EXAMPLE_INPUT_DATA_PATH, chunksize
+        )
+    )
+    assert max(len(chunk) for chunk in chunks) <= chunksize
+    assert_frame_equal(
+        weather_pipeline.concat_weather_frames(chunks),
+        weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH),
+    )
+
+
+@pytest.mark.parametrize(
+    "test_path, expected_exception",
+    [
+        ("Data/CSVTestFiles/header-only.csv", pd.errors.EmptyDataError),
+        ("Data/CSVTestFiles/no-header.csv", weather_pipeline.DataValidationError),
+        (
+            "Data/CSVTestFiles/extra-column-names.csv",
+            weather_pipeline.DataValidationError,
+        ),
+    ],
+)
+def test2_import_monthly_weather_csv_chunks(test_path, expected_exception):
+    with pytest.raises(expected_exception):
+        list(weather_pipeline.import_monthly_weather_csv_chunks(test_path, 5))
+
+
+@pytest.mark.parametrize("engine", ["pyarrow", "pandas"])
+def test_import_typed_weather_csv(engine):
+    frame_out = weather_pipeline.import_typed_weather_csv(
+        EXAMPLE_INPUT_DATA_PATH, engine=engine
+    )
+    dtypes = {column: str(dtype) for column, dtype in schema.PANDAS_DTYPES.items()}
+    assert frame_out.dtypes.astype(str).to_dict() == dtypes
+    assert_frame_equal(
+        frame_out,
+        df_func_example_out.assign(
+            ObservationDate=lambda df: pd.to_datetime(df.ObservationDate)
+        ).astype(dtypes),
+        check_categorical=False,
+    )
+
+
+@pytest.mark.parametrize("engine", ["pyarrow", "pandas"])
+def test_transform_typed_weather_df(engine):
+    frame_in = weather_pipeline.import_typed_weather_csv(
+        EXAMPLE_INPUT_DATA_PATH, engine=engine
+    )
+    weather_pipeline.validate_weather_data(frame_in)
+    assert_frame_equal(
+        weather_pipeline.transform_weather_df(frame_in),
+        weather_pipeline.transform_weather_df(
+            weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+        ),
+        check_dtype=False,
+    )
+
+
 # Validation passes with standard data and picks up missing data
 
 df_example_data_for_validation = weather_pipeline.import_monthly_weather_csv(
@@ -75,6 +148,7 @@ df_missing_data = weather_pipeline.import_monthly_weather_csv(
 )
 
 
+@pytest.mark.parametrize("engine", ["vectorized", "pandas_schema"])
 @pytest.mark.parametrize(
     "frame_in, expected_exception",
     [
@@ -85,9 +159,32 @@ df_missing_data = weather_pipeline.import_monthly_weather_csv(
         (df_missing_data, "pytest.raises(weather_pipeline.DataValidationError)"),
     ],
 )
-def test_validate_weather_data(frame_in, expected_exception):
+def test_validate_weather_data(frame_in, expected_exception, engine):
     with eval(expected_exception):
-        weather_pipeline.validate_weather_data(frame_in)
+        weather_pipeline.validate_weather_data(frame_in, engine=engine)
+
+
+@pytest.mark.parametrize(
+    "import_csv, engine",
+    [
+        (weather_pipeline.import_monthly_weather_csv, "vectorized"),
+        (weather_pipeline.import_monthly_weather_csv, "pandas_schema"),
+        (weather_pipeline.import_monthly_weather_csv_chunks, "vectorized"),
+        (weather_pipeline.import_typed_weather_csv, "vectorized"),
+    ],
+)
+def test_validate_whitespace_only_region_country(tmp_path, import_csv, engine):
+    # Whitespace only text is empty, which Region and Country allow
+    lines = open(EXAMPLE_INPUT_DATA_PATH).read().splitlines()
+    lines[1] = lines[1].replace("Orkney & Shetland,SCOTLAND", "  ,   ")
+    fpath = tmp_path / "weather.csv"
+    fpath.write_text("\n".join(lines) + "\n")
+
+    frame_in = import_csv(str(fpath))
+    if import_csv is weather_pipeline.import_monthly_weather_csv_chunks:
+        frame_in = pd.concat(list(frame_in))
+    assert frame_in.Region.isnull().iloc[0] and frame_in.Country.isnull().iloc[0]
+    weather_pipeline.validate_weather_data(frame_in, engine=engine)
 
 
 @pytest.mark.parametrize(
@@ -104,6 +201,178 @@ def test_transform_weather_df(frame_in, expected_exception):
         weather_pipeline.transform_weather_df(frame_in)
 
 
+@pytest.mark.parametrize(
+    "import_csv",
+    [
+        weather_pipeline.import_monthly_weather_csv,
+        weather_pipeline.import_typed_weather_csv,
+    ],
+)
+def test_transform_weather_df_fast(import_csv):
+    frame_in = import_csv(EXAMPLE_INPUT_DATA_PATH)
+    assert_frame_equal(
+        weather_pipeline.transform_weather_df(frame_in, fast=True),
+        weather_pipeline.transform_weather_df(frame_in, fast=False),
+    )
+
+
+@pytest.mark.parametrize(
+    "site_codes, site_names, expected_output",
+    [
+        ([3002, 99214], ["BALTASOUND (3002)", "ST. HELIER (99214)"], ["Baltasound", "St. Helier"]),
+        ([3002, 3002, 3005], ["BALTASOUND (3002)"] * 2 + [None], ["Baltasound"] * 2 + [None]),
+    ],
+)
+def test_clean_site_names(site_codes, site_names, expected_output):
+    frame_in = pd.DataFrame({"ForecastSiteCode": site_codes, "SiteName": site_names})
+    assert [
+        None if pd.isna(name) else name
+        for name in weather_pipeline.clean_site_names(frame_in)
+    ] == expected_output
+
+
+@pytest.mark.parametrize(
+    "values, mapping, expected_output",
+    [
+        ([0, 16, 2, None], {0: "N", 2: "NE", 16: "N"}, ["N", "N", "NE", None]),
+        (["Orkney & Shetland", "Unknown"], {"Orkney & Shetland": "Scotland"}, ["Scotland", None]),
+    ],
+)
+def test_map_categories(values, mapping, expected_output):
+    mapped = weather_pipeline.map_categories(pd.Series(values), mapping)
+    assert isinstance(mapped.dtype, pd.CategoricalDtype)
+    assert mapped.astype(object).where(mapped.notna(), None).tolist() == expected_output
+
+
+def test_transform_weather_df_categories():
+    frame_out = weather_pipeline.transform_weather_df(df_example_data_for_validation)
+    for column in schema.CATEGORICAL_COLUMNS:
+        assert isinstance(frame_out[column].dtype, pd.CategoricalDtype)
+    assert list(frame_out.Region.cat.categories) == sorted(frame_out.Region.unique())
+    assert "Isle of Man" not in frame_out.Region.cat.categories
+
+
+def test_export_weather_to_parquet_dictionary(tmp_path):
+    fpath_parquet = tmp_path / "weather.parquet"
+    frame_in = weather_pipeline.transform_weather_df(df_example_data_for_validation)
+    weather_pipeline.export_weather_to_parquet(frame_in, str(fpath_parquet))
+    parquet_schema = pq.read_schema(fpath_parquet)
+    for column in schema.CATEGORICAL_COLUMNS:
+        assert pa.types.is_dictionary(parquet_schema.field(column).type)
+
+
+def test_quarantine_weather_data(tmp_path):
+    frame_in = weather_pipeline.import_monthly_weather_csv(
+        "Data/CSVTestFiles/missing-data.csv"
+    )
+    valid, rejected = weather_pipeline.quarantine_weather_data(frame_in, 0.5)
+    assert list(rejected.index) == [3, 6, 8]
+    assert valid.Longitude.dtype == float and valid.ScreenTemperature.dtype == float
+    # The rejected rows no longer stop the rest of the file being transformed
+    assert len(weather_pipeline.transform_weather_df(valid)) == 8
+
+    fpath_quarantine = str(tmp_path / "quarantine" / "missing-data.parquet")
+    weather_pipeline.export_quarantine(rejected, fpath_quarantine, "missing-data.csv")
+    quarantine = pd.read_parquet(fpath_quarantine)
+    assert quarantine.RejectReasons.to_list() == list(rejected.RejectReasons)
+    assert quarantine.ScreenTemperature[0] == "KIRKWALL (3017)"
+
+    weather_pipeline.export_quarantine(rejected.iloc[:0], fpath_quarantine)
+    assert not (tmp_path / "quarantine" / "missing-data.parquet").exists()
+
+
+@pytest.mark.parametrize(
+    "fpath, max_reject_rate, expected_exception",
+    [
+        ("Data/CSVTestFiles/missing-data.csv", 0.01, "pytest.raises(weather_pipeline.RejectRateError)"),
+        ("Data/CSVTestFiles/missing-data.csv", 0.3, "not_raises(weather_pipeline.RejectRateError)"),
+    ],
+)
+def test_quarantine_weather_data_errors(fpath, max_reject_rate, expected_exception):
+    frame_in = weather_pipeline.import_monthly_weather_csv(fpath)
+    with eval(expected_exception):
+        weather_pipeline.quarantine_weather_data(frame_in, max_reject_rate)
+
+
+def test_quarantine_weather_data_missing_column():
+    frame_in = weather_pipeline.import_monthly_weather_csv(EXAMPLE_INPUT_DATA_PATH)
+    with pytest.raises(weather_pipeline.DataValidationError):
+        weather_pipeline.quarantine_weather_data(frame_in.drop(columns="Country"), 1)
+
+
+def test_export_weather_chunks_to_parquet_categories(tmp_path):
+    fpath_parquet = tmp_path / "weather.parquet"
+    frame_in = weather_pipeline.transform_weather_df(df_example_data_for_validation)
+    # The second chunk has too many categories for the 8 bit codes of the first
+    many_sites = pd.concat([frame_in] * 20, ignore_index=True).assign(
+        SiteName=lambda df: pd.Categorical([f"Site {i}" for i in range(len(df))])
+    )
+    weather_pipeline.export_weather_chunks_to_parquet(
+        [frame_in, many_sites], str(fpath_parquet)
+    )
+    assert_frame_equal(
+        pd.read_parquet(fpath_parquet),
+        weather_pipeline.concat_weather_frames([frame_in, many_sites]).reset_index(
+            drop=True
+        ),
+        check_categorical=False,
+    )
+
+
+def test_export_weather_chunks_to_parquet(tmp_path):
+    fpath_parquet = tmp_path / "weather.parquet"
+    frame_in = weather_pipeline.transform_weather_df(df_example_data_for_validation)
+    weather_pipeline.export_weather_chunks_to_parquet(
+        (frame_in.iloc[start : start + 5] for start in range(0, len(frame_in), 5)),
+        str(fpath_parquet),
+    )
+    assert_frame_equal(
+        pd.read_parquet(fpath_parquet),
+        frame_in.reset_index(drop=True),
+        check_categorical=False,
+    )
+
+
+@pytest.mark.parametrize(
+    "partition_by_region, expected_partitions",
+    [
+        (False, {"Year=2016/Month=2"}),
+        (
+            True,
+            {
+                "Year=2016/Month=2/RegionPartition=Highland%20%26%20Eilean%20Siar",
+                "Year=2016/Month=2/RegionPartition=London%20%26%20South%20East%20England",
+                "Year=2016/Month=2/RegionPartition=North%20West%20England",
+                "Year=2016/Month=2/RegionPartition=Orkney%20%26%20Shetland",
+                "Year=2016/Month=2/RegionPartition=Yorkshire%20%26%20Humber",
+            },
+        ),
+    ],
+)
+def test_export_weather_to_parquet_partitioned(
+    tmp_path, partition_by_region, expected_partitions
+):
+    frame_in = weather_pipeline.transform_weather_df(df_example_data_for_validation)
+    weather_pipeline.export_weather_to_parquet(
+        frame_in,
+        str(tmp_path),
+        partitioned=True,
+        partition_by_region=partition_by_region,
+        compression="zstd",
+    )
+    assert {
+        fpath.parent.relative_to(tmp_path).as_posix()
+        for fpath in tmp_path.glob("**/*.parquet")
+    } == expected_partitions
+
+    frame_out = pd.read_parquet(tmp_path)[frame_in.columns]
+    assert_frame_equal(
+        frame_out.sort_values(["ObservationDateTime", "SiteName"]).reset_index(drop=True),
+        frame_in.sort_values(["ObservationDateTime", "SiteName"]).reset_index(drop=True),
+        check_categorical=False,
+    )
+
+
 @pytest.mark.parametrize(
     "drill_file_path, expected_exception",
     [
@@ -114,11 +383,37 @@ def test_transform_weather_df(frame_in, expected_exception):
         ),
     ],
 )
+@requires_drill
 def test_max_daily_average_temperature(drill_file_path, expected_exception):
     with eval(expected_exception):
         weather_pipeline.max_daily_average_temperature(drill_file_path)
 
 
+def test_max_daily_average_temperature_local(tmp_path, capsys):
+    fpath_parquet = str(tmp_path / "weather.parquet")
+    weather_pipeline.export_weather_to_parquet(
+        weather_pipeline.transform_weather_df(df_example_data_for_validation),
+        fpath_parquet,
+    )
+    weather_pipeline.max_daily_average_temperature(fpath_parquet, backend="local")
+    assert "South Uist Range" in capsys.readouterr().out
+
+
+def test_format_task_query_output_ties(capsys):
+    weather_pipeline.format_task_query_output(
+        pd.DataFrame(
+            {
+                "ObservationDate": ["2016-02-21", "2016-02-21"],
+                "Region": ["Highland & Eilean Siar", "Highland & Eilean Siar"],
+                "SiteName": ["South Uist Range", "Stornoway"],
+                "DailyAverageTemperature": [9.8, 9.8],
+            }
+        )
+    )
+    output = capsys.readouterr().out
+    assert "South Uist Range" in output and "Stornoway" in output
+
+
 WELL_FORMED_SQL = """select
                 ObservationDate,Region, SiteName,round(AVG(ScreenTemperature),2) as DailyAverageTemperature
             from
@@ -141,6 +436,7 @@ MALFORMED_SQL = """select
         (MALFORMED_SQL, "pytest.raises(exceptions.TransportError)",),
     ],
 )
+@requires_drill
 def test_query_parquet(sql, expected_exception):
     with eval(expected_exception):
         weather_pipeline.query_parquet(sql)
@@ -0,0 +1,162 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import local_query
+import weather_pipeline as wp
+
+SITE_DAY_KEYS = ["ObservationDate", "ForecastSiteCode", "Region", "SiteName"]
+
+# Sums and counts are kept so partial aggregates of the same site day can be combined
+SITE_DAY_COLUMNS = SITE_DAY_KEYS + [
+    "MeanTemperature",
+    "MinTemperature",
+    "MaxTemperature",
+    "ReadingCount",
+    "MaxWindGust",
+    "MeanPressure",
+    "TemperatureSum",
+    "TemperatureCount",
+    "PressureSum",
+    "PressureCount",
+]
+
+
+def partial_site_day_aggregates(frame_in: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregates transformed weather rows to sums, counts, minimums and maximums per site day
+    """
+    return (
+        frame_in.assign(Pressure=lambda df: df.Pressure.astype(float))
+        .groupby(SITE_DAY_KEYS, dropna=False, observed=True)
+        .agg(
+            MinTemperature=("ScreenTemperature", "min"),
+            MaxTemperature=("ScreenTemperature", "max"),
+            ReadingCount=("ScreenTemperature", "size"),
+            MaxWindGust=("WindGust", "max"),
+            TemperatureSum=("ScreenTemperature", "sum"),
+            TemperatureCount=("ScreenTemperature", "count"),
+            PressureSum=("Pressure", "sum"),
+            PressureCount=("Pressure", "count"),
+        )
+        .reset_index()
+    )
+
+
+def combine_site_day_aggregates(partials) -> pd.DataFrame:
+    """
+    Combines partial site day aggregates (eg of several chunks) and derives the means
+    """
+    return (
+        pd.concat(partials)
+        .groupby(SITE_DAY_KEYS, dropna=False, observed=True)
+        .agg(
+            MinTemperature=("MinTemperature", "min"),
+            MaxTemperature=("MaxTemperature", "max"),
+            ReadingCount=("ReadingCount", "sum"),
+            MaxWindGust=("MaxWindGust", "max"),
+            TemperatureSum=("TemperatureSum", "sum"),
+            TemperatureCount=("TemperatureCount", "sum"),
+            PressureSum=("PressureSum", "sum"),
+            PressureCount=("PressureCount", "sum"),
+        )
+        .reset_index()
+        .assign(
+            MeanTemperature=lambda df: (df.TemperatureSum / df.TemperatureCount).where(
+                df.TemperatureCount > 0
+            ),
+            MeanPressure=lambda df: (df.PressureSum / df.PressureCount).where(
+                df.PressureCount > 0
+            ),
+            MaxWindGust=lambda df: df.MaxWindGust.astype(pd.Int64Dtype()),
+        )[SITE_DAY_COLUMNS]
+    )
+
+
+def site_day_aggregates(frame_in: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns mean, min and max temperature, reading count, max wind gust
+    and mean pressure per site and day
+    """
+    return combine_site_day_aggregates([partial_site_day_aggregates(frame_in)])
+
+
+def site_day_keys(frame_in: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the distinct ObservationDate and ForecastSiteCode of weather rows
+    """
+    return frame_in[["ObservationDate", "ForecastSiteCode"]].drop_duplicates()
+
+
+@wp.log_error(wp.clogger)
+def update_site_day_aggregates(
+    site_days: pd.DataFrame,
+    fpath_aggregates: str,
+    replace_all: bool = False,
+    keys: pd.DataFrame = None,
+):
+    """
+    Replaces the site days present in site_days in the aggregate parquet table
+    leaving every other site day untouched, and creates the table if it does not exist
+    keys (ObservationDate and ForecastSiteCode) are the site days to replace when given,
+    so site days with no rows left are removed
+    replace_all discards every existing site day, for full pipeline runs
+    The table is rewritten through a temporary file so readers never see a partial write
+    """
+    if os.path.exists(fpath_aggregates) and not replace_all:
+        existing = pd.read_parquet(fpath_aggregates)
+        affected = pd.MultiIndex.from_frame(
+            site_day_keys(site_days if keys is None else keys)
+        )
+        unaffected = ~pd.MultiIndex.from_frame(
+            existing[["ObservationDate", "ForecastSiteCode"]]
+        ).isin(affected)
+        site_days = pd.concat([existing[unaffected], site_days])
+
+    fpath_tmp = f"{fpath_aggregates}.tmp"
+    pq.write_table(
+        pa.Table.from_pandas(
+            site_days.sort_values(SITE_DAY_KEYS)[SITE_DAY_COLUMNS], preserve_index=False
+        ),
+        fpath_tmp,
+    )
+    os.replace(fpath_tmp, fpath_aggregates)
+
+
+@wp.log_error(wp.clogger)
+def refresh_site_day_aggregates(
+    fpath_parquet: str, keys: pd.DataFrame, fpath_aggregates: str
+):
+    """
+    Recomputes the site days in keys from every row of the weather output at fpath_parquet
+    and replaces them in the aggregate table, for incremental runs
+    where the readings of a site day may be split across several output files
+    Only the dates of keys are read
+    """
+    if keys.empty:
+        return
+    keys = site_day_keys(keys)
+    frame_in = local_query.read_weather_columns(
+        fpath_parquet,
+        SITE_DAY_KEYS + ["ScreenTemperature", "WindGust", "Pressure"],
+        (ds.field("ObservationDate") >= keys.ObservationDate.min().to_pydatetime())
+        & (ds.field("ObservationDate") <= keys.ObservationDate.max().to_pydatetime()),
+    ).to_pandas()
+    site_days = site_day_aggregates(frame_in)
+    site_days = site_days[
+        pd.MultiIndex.from_frame(site_days[["ObservationDate", "ForecastSiteCode"]]).isin(
+            pd.MultiIndex.from_frame(keys)
+        )
+    ]
+    update_site_day_aggregates(site_days, fpath_aggregates, keys=keys)
+
+
+def max_daily_average_temperature(fpath_aggregates: str) -> pd.DataFrame:
+    """
+    Answers the hottest day query from the site day aggregate table
+    """
+    daily_averages = pq.read_table(
+        fpath_aggregates, columns=["ObservationDate", "Region", "SiteName", "MeanTemperature"]
+    ).rename_columns(["ObservationDate", "Region", "SiteName", "DailyAverageTemperature"])
+    return local_query.max_rounded_daily_average(daily_averages)
@@ -0,0 +1,536 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pyarrow import csv
+import backfill
+import catalog
+import dedupe
+import mappings
+import schema
+import validators
+import weather_pipeline as wp
+
+# Columns the pandas path holds as nullable integers, the other integers are numpy int64
+NULLABLE_INTEGER_COLUMNS = [
+    "WindDirection",
+    "WindSpeed",
+    "WindGust",
+    "Visibility",
+    "Pressure",
+    "SignificantWeatherCode",
+]
+
+# Integer columns without a dtype rule may hold whole floats (eg 8.0) like the pandas path
+FLOAT_READ_COLUMNS = [
+    column for column in NULLABLE_INTEGER_COLUMNS if column != "WindDirection"
+]
+
+# Types the weather columns are read with, text is trimmed and dates parsed after reading
+READ_TYPES = {
+    field.name: pa.string() if pa.types.is_dictionary(field.type) else field.type
+    for field in schema.ARROW_SCHEMA
+}
+READ_TYPES["ObservationDate"] = pa.string()
+READ_TYPES.update({column: pa.float64() for column in FLOAT_READ_COLUMNS})
+
+# The default null strings of pandas and pyarrow plus -99
+NULL_VALUES = csv.ConvertOptions().null_values + ["-99", "-99.0"]
+
+TEXT_COLUMNS = ["SiteName", "Region", "Country"]
+
+VISIBILITY_BINS = [0, 1000, 4000, 10000, 20000, 40000, np.inf]
+
+VISIBILITY_LABELS = ["Very poor", "Poor", "Moderate", "Good", "Very good", "Excellent"]
+
+# The column each mapped categorical is derived from
+MAPPED_SOURCE_COLUMNS = {
+    "Country": "Region",
+    "WindCompass": "WindDirection",
+    "WeatherType": "SignificantWeatherCode",
+}
+
+SORT_COLUMNS = ["ObservationDate", "ObservationTime", "Region", "SiteName"]
+
+# Rows read from all the sorted run files at a time when they have to be merged
+MERGE_ROWS = 500000
+
+
+def check_weather_header(names: list):
+    """
+    Checks the weather file has the expected columns, as check_weather_columns does
+    """
+    if len(names) < len(schema.COLUMN_NAMES):
+        raise wp.DataValidationError("Missing column names or too few row data values.")
+    elif len(names) > len(schema.COLUMN_NAMES):
+        raise wp.DataValidationError("Extra column names or too many row data values.")
+    elif names != schema.COLUMN_NAMES:
+        raise wp.DataValidationError("Unexpected column names.")
+
+
+def prepare_batch(batch: pa.RecordBatch) -> pa.RecordBatch:
+    """
+    Trims whitespace from the text columns and parses ObservationDate
+    Text which is only whitespace is null, as strip_categories makes it
+    Dates which do not match the date format are null
+    """
+    arrays = dict(zip(batch.schema.names, batch.columns))
+    for column in TEXT_COLUMNS:
+        trimmed = pc.utf8_trim_whitespace(arrays[column])
+        arrays[column] = pc.if_else(
+            pc.equal(trimmed, ""), pa.scalar(None, pa.string()), trimmed
+        )
+    arrays["ObservationDate"] = pc.strptime(
+        pc.utf8_trim_whitespace(arrays["ObservationDate"]),
+        format=schema.OBSERVATION_DATE_FORMAT,
+        unit="ns",
+        error_is_null=True,
+    )
+    return pa.RecordBatch.from_arrays(list(arrays.values()), names=list(arrays))
+
+
+def read_weather_batches(fpath: str, block_size: int = 1 << 24):
+    """
+    Streams a monthly weather .csv file as Arrow record batches of about block_size bytes
+    Columns are read straight into their types, -99 is null, text is trimmed
+    and ObservationDate parsed
+    """
+    try:
+        reader = csv.open_csv(
+            fpath,
+            read_options=csv.ReadOptions(block_size=block_size),
+            convert_options=csv.ConvertOptions(
+                column_types=READ_TYPES,
+                null_values=NULL_VALUES,
+                strings_can_be_null=True,
+            ),
+        )
+    except pa.ArrowInvalid as e:
+        if "Empty CSV file" in str(e):
+            raise pd.errors.EmptyDataError("No columns to parse from file") from e
+        # Values in the first block which cannot be read as their column's type
+        raise wp.DataValidationError(f"{fpath}: {e}") from e
+
+    check_weather_header(reader.schema.names)
+
+    rows = 0
+    while True:
+        try:
+            batch = reader.read_next_batch()
+        except StopIteration:
+            break
+        except pa.ArrowInvalid as e:
+            # Values which cannot be read as their column's type
+            raise wp.DataValidationError(f"{fpath}: {e}") from e
+        rows += batch.num_rows
+        if batch.num_rows:
+            yield prepare_batch(batch)
+
+    if rows == 0:
+        raise pd.errors.EmptyDataError("The file only has a header and no data.")
+
+
+def distinct_check(array, check) -> np.ndarray:
+    """
+    Evaluates an element-wise check once per distinct value of an Arrow array
+    and broadcasts the results back to every row, nulls are checked as np.nan
+    """
+    encoded = pc.dictionary_encode(array)
+    results = np.fromiter(
+        (check(value) for value in encoded.dictionary.to_pylist()),
+        dtype=bool,
+        count=len(encoded.dictionary),
+    )
+    results = np.append(results, check(np.nan))
+    indices = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+    return results[indices]
+
+
+def batch_rule_failures(batch: pa.RecordBatch):
+    """
+    Yields a (column, rule, failed row mask) tuple for every rule in the schema,
+    as validators.rule_failures does for a DataFrame
+    Dtype rules pass as the columns are read with their types and nulls fail the range rules
+    """
+    for column in schema.WEATHER_RULES:
+        array = batch.column(column.name)
+        is_null = array.is_null().to_numpy(zero_copy_only=False)
+        for rule in column.rules:
+            if isinstance(rule, schema.IsDtype):
+                continue
+            elif isinstance(rule, schema.InRange):
+                passed = pc.and_kleene(
+                    pc.greater_equal(array, rule.min), pc.less(array, rule.max)
+                )
+                failed = ~passed.fill_null(False).to_numpy(zero_copy_only=False)
+            elif isinstance(rule, schema.CanConvert):
+                if pa.types.is_floating(array.type):
+                    failed = ~pc.is_finite(array).fill_null(False).to_numpy(
+                        zero_copy_only=False
+                    )
+                else:
+                    failed = is_null.copy()
+            elif isinstance(rule, schema.MatchesPattern):
+                failed = ~distinct_check(array, validators._matches_pattern(rule.pattern))
+            elif isinstance(rule, schema.DateFormat):
+                failed = is_null.copy()
+            else:
+                raise TypeError(f"Unknown validation rule {rule!r}")
+
+            if column.allow_empty:
+                failed &= ~is_null
+            yield column.name, rule, failed
+
+
+def validate_weather_batch(batch: pa.RecordBatch, first_row: int = 0):
+    """
+    Validates a batch of weather rows against the schema rules
+    logging a summary per failing column and rule as validate_weather_data does
+    """
+    summaries = []
+    for column, rule, failed in batch_rule_failures(batch):
+        if failed.any():
+            failed_rows = (np.flatnonzero(failed)[: validators.SAMPLE_ROWS] + first_row)
+            summaries.append(
+                validators.ValidationSummary(
+                    column,
+                    type(rule).__name__,
+                    int(failed.sum()),
+                    failed_rows.tolist(),
+                    validators.describe_rule(rule),
+                )
+            )
+
+    if summaries:
+        if wp.clogger:
+            for summary in summaries:
+                wp.clogger.error(
+                    f"{summary.column} {summary.message}: {summary.count} "
+                    f"row(s) failed {summary.rule}, eg rows {summary.sample_rows}"
+                )
+        raise wp.DataValidationError(
+            "Data validation failed. Please refer to the log file for detailed information."
+        )
+
+
+def map_values(array, mapping: dict) -> pa.DictionaryArray:
+    """
+    Maps the distinct values of an Arrow array through a dict rather than every row
+    and returns a dictionary array, nulls and unmapped values become null
+    """
+    encoded = pc.dictionary_encode(array)
+    mapped = pa.array(
+        [mapping.get(value) for value in encoded.dictionary.to_pylist()], pa.string()
+    )
+    return pa.DictionaryArray.from_arrays(
+        pc.if_else(pc.is_null(pc.take(mapped, encoded.indices)), None, encoded.indices),
+        mapped,
+    )
+
+
+def clean_site_names(codes, names) -> pa.DictionaryArray:
+    """
+    Removes the site code suffix from each SiteName and transforms it into proper case
+    Each distinct trimmed name is title cased once
+    """
+    trimmed = pc.if_else(
+        pc.less(codes, 10000),
+        pc.utf8_slice_codeunits(names, 0, -7),
+        pc.utf8_slice_codeunits(names, 0, -8),
+    )
+    encoded = pc.dictionary_encode(trimmed)
+    titled = pa.array(
+        [name.title() for name in encoded.dictionary.to_pylist()], pa.string()
+    )
+    return pa.DictionaryArray.from_arrays(encoded.indices, titled)
+
+
+def visibility_descriptions(visibility) -> pa.DictionaryArray:
+    """
+    Bins Visibility into the ordered visibility descriptions as pd.cut does
+    """
+    values = visibility.to_numpy(zero_copy_only=False).astype(float)
+    codes = np.searchsorted(VISIBILITY_BINS, values, side="right") - 1
+    valid = ~np.isnan(values) & (codes >= 0) & (codes < len(VISIBILITY_LABELS))
+    return pa.DictionaryArray.from_arrays(
+        pa.array(np.where(valid, codes, 0).astype(np.int32), mask=~valid),
+        pa.array(VISIBILITY_LABELS),
+        ordered=True,
+    )
+
+
+def observation_datetimes(dates, times) -> pa.Array:
+    """
+    Replaces the hour of each ObservationDate with its ObservationTime
+    """
+    hour = 3600 * 10 ** 9
+    nanoseconds = pc.add(
+        pc.subtract(
+            dates.cast(pa.int64()), pc.multiply(pc.hour(dates).cast(pa.int64()), hour)
+        ),
+        pc.multiply(times, hour),
+    )
+    return nanoseconds.cast(pa.timestamp("ns"))
+
+
+def transform_weather_batch(batch: pa.RecordBatch) -> pa.RecordBatch:
+    """
+    Transforms a batch of validated weather rows as transform_weather_df does a DataFrame,
+    apart from deduplicating, encoding categories and sorting which need every row
+    """
+    arrays = dict(zip(batch.schema.names, batch.columns))
+    codes = arrays["ForecastSiteCode"]
+
+    region = pc.if_else(pc.equal(codes, 3204), "Isle of Man", arrays["Region"])
+    # Whole floats become integers, other floats fail as astype does in the pandas path
+    arrays.update(
+        {column: arrays[column].cast(pa.int64()) for column in FLOAT_READ_COLUMNS}
+    )
+    arrays.update(
+        ObservationDateTime=observation_datetimes(
+            arrays["ObservationDate"], arrays["ObservationTime"]
+        ),
+        SiteName=clean_site_names(codes, arrays["SiteName"]),
+        VisibilityDescription=visibility_descriptions(arrays["Visibility"]),
+        Region=pc.dictionary_encode(region),
+        Country=map_values(region, mappings.REGION_TO_COUNTRY),
+        WindCompass=map_values(arrays["WindDirection"], mappings.COMPASS_16_PT),
+        WeatherType=map_values(arrays["SignificantWeatherCode"], mappings.WEATHER_TYPES),
+    )
+    return pa.RecordBatch.from_arrays(list(arrays.values()), names=list(arrays))
+
+
+def encode_dictionary(column, source=None) -> pa.ChunkedArray:
+    """
+    Re-encodes a dictionary column with one dictionary of its used values in sorted order
+    so it sorts as the text does, as encode_categories does for a categorical
+    With no values the dictionary is typed as pandas types empty categories
+    (double when source, the mapped column, had values and otherwise null)
+    """
+    values = column.cast(pa.string()) if pa.types.is_dictionary(column.type) else column
+    categories = pc.unique(values).drop_null()
+    categories = categories.take(pc.sort_indices(categories))
+    if len(categories) == 0:
+        value_type = (
+            pa.float64()
+            if source is not None and source.null_count < len(source)
+            else pa.null()
+        )
+        return pa.chunked_array(
+            [
+                pa.DictionaryArray.from_arrays(
+                    pa.nulls(len(values), pa.int32()), pa.array([], value_type)
+                )
+            ]
+        )
+    return pa.chunked_array(
+        [
+            pa.DictionaryArray.from_arrays(
+                pc.index_in(chunk, value_set=categories).cast(pa.int32()), categories
+            )
+            for chunk in values.chunks
+        ],
+        pa.dictionary(pa.int32(), pa.string()),
+    )
+
+
+def dedupe_table(table: pa.Table, policy: str = "first") -> pa.Table:
+    """
+    Keeps one row per ForecastSiteCode and ObservationDateTime as dedupe_observations does
+    """
+    if table.num_rows == 0:
+        return table
+    keys = dedupe.observation_keys(table.select(dedupe.KEY_COLUMNS).to_pandas())
+    completeness = None
+    if policy == "most_complete":
+        completeness = sum(
+            column.is_valid().to_numpy(zero_copy_only=False).astype(int)
+            for column in table.columns
+        )
+    return table.filter(dedupe.keep_mask(keys, policy, completeness))
+
+
+def finish_weather_table(table: pa.Table, dedupe_policy: str = "first") -> pa.Table:
+    """
+    Deduplicates, encodes the categorical columns and sorts transformed weather rows
+    """
+    table = dedupe_table(table, dedupe_policy)
+
+    for column in schema.CATEGORICAL_COLUMNS:
+        if column == "VisibilityDescription":
+            continue
+        source = MAPPED_SOURCE_COLUMNS.get(column)
+        table = table.set_column(
+            table.schema.get_field_index(column),
+            column,
+            encode_dictionary(
+                table.column(column), None if source is None else table.column(source)
+            ),
+        )
+
+    # Categorical columns sort by their sorted dictionary indices with nulls last
+    sort_keys = pa.table(
+        {
+            column: table.column(column).combine_chunks().indices
+            if pa.types.is_dictionary(table.column(column).type)
+            else table.column(column)
+            for column in SORT_COLUMNS
+        }
+    )
+    order = pc.sort_indices(
+        sort_keys,
+        sort_keys=[(column, "ascending") for column in SORT_COLUMNS],
+        null_placement="at_end",
+    )
+    return table.take(order)
+
+
+def table_dtypes(table: pa.Table) -> dict:
+    """
+    Returns the pandas dtypes the pandas path gives the columns of a transformed table
+    """
+    empty = table.slice(0, 0).to_pandas()
+    return empty.astype(
+        {column: pd.Int64Dtype() for column in NULLABLE_INTEGER_COLUMNS}
+    ).dtypes.to_dict()
+
+
+def pandas_schema(table: pa.Table) -> pa.Schema:
+    """
+    Returns the schema of the table with the pandas metadata the pandas path writes,
+    so reading the parquet file back gives the same dtypes
+    """
+    return table.schema.with_metadata(backfill.output_schema(table_dtypes(table)).metadata)
+
+
+def transform_weather_file_batches(fpath: str, block_size: int = 1 << 24):
+    """
+    Imports, validates and transforms a weather file as Arrow record batches
+    """
+    first_row = 0
+    for batch in read_weather_batches(fpath, block_size):
+        validate_weather_batch(batch, first_row)
+        first_row += batch.num_rows
+        yield transform_weather_batch(batch)
+
+
+@wp.log_error(wp.clogger)
+def transform_weather_files_arrow(
+    fpaths: list, dedupe_policy: str = "first", block_size: int = 1 << 24
+) -> pa.Table:
+    """
+    Imports, validates and transforms weather files as Arrow record batches
+    and returns the same rows, columns and order as transforming and merging
+    the files with the pandas path does
+    Every row is held in memory, run_weather_files_arrow holds one file at a time
+    """
+    batches = [
+        batch
+        for fpath in fpaths
+        for batch in transform_weather_file_batches(fpath, block_size)
+    ]
+    return finish_weather_table(pa.Table.from_batches(batches), dedupe_policy)
+
+
+@wp.log_error(wp.clogger)
+def export_weather_table_to_parquet(
+    table: pa.Table,
+    fpath_parquet: str,
+    compression: str = "snappy",
+    row_group_size: int = 10000,
+):
+    """
+    Writes transformed weather rows to a parquet file one row group at a time
+    with the same schema and pandas metadata export_weather_to_parquet writes
+    and brings the catalog of the file up to date
+    """
+    writer_schema = pandas_schema(table)
+    with pq.ParquetWriter(fpath_parquet, writer_schema, compression=compression) as writer:
+        for batch in table.to_batches(max_chunksize=row_group_size):
+            writer.write_batch(batch, row_group_size=row_group_size)
+    catalog.update_catalog(fpath_parquet)
+
+
+def spill_weather_files(fpaths: list, spill_dir: str, dedupe_policy: str, block_size: int):
+    """
+    Transforms, deduplicates and sorts each weather file on its own and writes it
+    to a run file in spill_dir, holding one file in memory at a time
+    Returns the run files, the output dtypes (see backfill.merge_dtypes)
+    and whether the runs hold hours which overlap, so they have to be merged
+    """
+    fpaths_run, run_dtypes, overlap, latest = [], [], False, None
+    for fpath in fpaths:
+        table = finish_weather_table(
+            pa.Table.from_batches(list(transform_weather_file_batches(fpath, block_size))),
+            dedupe_policy,
+        )
+        run_dtypes.append(table_dtypes(table))
+
+        times = pc.min_max(table.column("ObservationDateTime"))
+        if times["min"].is_valid:
+            overlap = overlap or (latest is not None and times["min"].value <= latest)
+            latest = max(times["max"].value, latest or times["max"].value)
+
+        fpath_run = os.path.join(spill_dir, f"run-{len(fpaths_run):06d}.parquet")
+        pq.write_table(table, fpath_run)
+        fpaths_run.append(fpath_run)
+    return fpaths_run, backfill.merge_dtypes(run_dtypes), overlap
+
+
+def read_runs_in_order(fpaths_run: list, batch_rows: int):
+    """
+    Reads run files one after another in tables of batch_rows rows
+    """
+    for fpath_run in fpaths_run:
+        for batch in pq.ParquetFile(fpath_run).iter_batches(batch_size=batch_rows):
+            yield pa.Table.from_batches([batch])
+
+
+@wp.log_error(wp.clogger)
+def run_weather_files_arrow(
+    fpaths: list,
+    fpath_parquet: str,
+    dedupe_policy: str = "first",
+    block_size: int = 1 << 24,
+    spill_dir: str = None,
+    row_group_size: int = 10000,
+) -> int:
+    """
+    Runs the Arrow pipeline from the weather files to a parquet file
+    holding one file's rows in memory at a time
+    Each file is transformed, deduplicated and sorted on its own and spilled to a run file
+    in a temporary folder (in spill_dir when given). Runs of hours after those of the runs
+    before them are written in order, otherwise they are merged as a backfill merges
+    Text columns are written with the categories of the whole run
+    Returns the number of rows written
+    """
+    if len(fpaths) == 1:
+        table = transform_weather_files_arrow(fpaths, dedupe_policy, block_size)
+        export_weather_table_to_parquet(table, fpath_parquet, row_group_size=row_group_size)
+        return table.num_rows
+
+    with tempfile.TemporaryDirectory(prefix="arrow-", dir=spill_dir) as run_dir:
+        fpaths_run, dtypes, overlap = spill_weather_files(
+            fpaths, run_dir, dedupe_policy, block_size
+        )
+        output_schema = backfill.output_schema(dtypes)
+        tables = (
+            backfill.merge_sorted_runs(
+                fpaths_run, max(MERGE_ROWS // len(fpaths_run), 1), dedupe_policy
+            )
+            if overlap
+            else read_runs_in_order(fpaths_run, row_group_size)
+        )
+        rows = backfill.write_merged(
+            tables,
+            fpath_parquet,
+            output_schema,
+            lambda table: backfill.encode_output(table, output_schema, dtypes),
+            row_group_size,
+        )
+
+    catalog.update_catalog(fpath_parquet)
+    return rows
@@ -0,0 +1,349 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import weather_pipeline as wp
+import catalog
+import dedupe
+
+SORT_COLUMNS = ["ObservationDate", "ObservationTime", "Region", "SiteName"]
+
+# Run and row number of every row in the merge, the order the rows of the merged
+# frames of today's full runs are in, so duplicates and sort ties resolve the same way
+RUN_COLUMN = "_Run"
+ROW_COLUMN = "_Row"
+
+MEMORY_BUDGET_MB = 256
+
+# Peak memory per row of importing, validating and transforming a chunk, measured
+# with tracemalloc, and a generous bound on the rows of the merge
+ROW_BYTES = 512
+
+# Fewer rows than this per run in each merge batch and the runs are merged in several passes
+MIN_BATCH_ROWS = 1000
+
+
+def spill_sorted_runs(
+    fpaths: list, spill_dir: str, chunksize: int, dedupe_policy: str = "first"
+):
+    """
+    Imports, validates and transforms each weather file a chunk at a time
+    and writes every sorted chunk to its own parquet run file in spill_dir
+    Returns the run files in order and the dtypes of the output columns, where unordered
+    categoricals have the sorted union of the categories of every chunk
+    as concat_weather_frames gives them
+    """
+    fpaths_run, run_dtypes = [], []
+    for fpath in fpaths:
+        for raw_weather_chunk in wp.import_monthly_weather_csv_chunks(fpath, chunksize):
+            wp.validate_weather_data(raw_weather_chunk)
+            frame = wp.transform_weather_df(raw_weather_chunk, dedupe_policy=dedupe_policy)
+            run_dtypes.append(frame.dtypes.to_dict())
+
+            fpath_run = os.path.join(spill_dir, f"run-{len(fpaths_run):06d}.parquet")
+            pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), fpath_run)
+            fpaths_run.append(fpath_run)
+
+    return fpaths_run, merge_dtypes(run_dtypes)
+
+
+def merge_dtypes(run_dtypes: list) -> dict:
+    """
+    Returns the dtypes of the first run where unordered categoricals have the sorted union
+    of the categories of every run, as concat_weather_frames gives them
+    """
+    dtypes = dict(run_dtypes[0])
+    for column, dtype in dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and not dtype.ordered:
+            dtypes[column] = pd.CategoricalDtype(
+                pd.Index(
+                    np.concatenate([run[column].categories for run in run_dtypes])
+                )
+                .unique()
+                .sort_values()
+            )
+    return dtypes
+
+
+def read_run_batches(fpath_run: str, run: int, batch_rows: int):
+    """
+    Reads a run file in tables of batch_rows rows with dictionary columns as plain text,
+    numbering each row with the run and its row in the run
+    """
+    row = 0
+    for batch in pq.ParquetFile(fpath_run).iter_batches(batch_size=batch_rows):
+        arrays = [
+            array.dictionary_decode() if pa.types.is_dictionary(array.type) else array
+            for array in batch.columns
+        ]
+        arrays += [
+            pa.array(np.full(batch.num_rows, run, dtype=np.int64)),
+            pa.array(np.arange(row, row + batch.num_rows, dtype=np.int64)),
+        ]
+        row += batch.num_rows
+        yield pa.Table.from_arrays(
+            arrays, names=batch.schema.names + [RUN_COLUMN, ROW_COLUMN]
+        )
+
+
+def concat_runs(tables: list) -> pa.Table:
+    """
+    Concatenates tables of several runs, a column which is all null in one run
+    takes the type of the others
+    """
+    return pa.concat_tables(tables, promote_options="default")
+
+
+def dedupe_merged(table: pa.Table, policy: str = "first") -> pa.Table:
+    """
+    Keeps one row per ForecastSiteCode and ObservationDateTime of rows in run and row order
+    """
+    keys = dedupe.observation_keys(
+        table.select(dedupe.KEY_COLUMNS).to_pandas()
+    )
+    completeness = None
+    if policy == "most_complete":
+        completeness = np.zeros(table.num_rows, dtype=np.int64)
+        for name in table.column_names:
+            if name not in (RUN_COLUMN, ROW_COLUMN):
+                completeness += pc.is_valid(table.column(name)).to_numpy(
+                    zero_copy_only=False
+                )
+    return table.filter(pa.array(dedupe.keep_mask(keys, policy, completeness)))
+
+
+def sort_merged(table: pa.Table) -> pa.Table:
+    """
+    Sorts rows the way transform_weather_df does, ties in run and row order
+    """
+    return table.take(
+        pc.sort_indices(
+            table,
+            sort_keys=[(column, "ascending") for column in SORT_COLUMNS]
+            + [(RUN_COLUMN, "ascending"), (ROW_COLUMN, "ascending")],
+            null_placement="at_end",
+        )
+    )
+
+
+def merge_sorted_runs(fpaths_run: list, batch_rows: int, dedupe_policy: str = "first"):
+    """
+    k-way merges sorted run files into tables of sorted and deduplicated rows
+    Each run is read batch_rows rows at a time. Every row of an earlier
+    ObservationDateTime than the last row read of every unfinished run
+    is complete, so it is deduplicated, sorted and yielded
+    """
+    readers = [
+        read_run_batches(fpath_run, run, batch_rows)
+        for run, fpath_run in enumerate(fpaths_run)
+    ]
+    buffers = [None] * len(readers)
+    finished = [False] * len(readers)
+
+    def read_next(run: int):
+        table = next(readers[run], None)
+        if table is None:
+            finished[run] = True
+        elif buffers[run] is None or buffers[run].num_rows == 0:
+            buffers[run] = table
+        else:
+            buffers[run] = concat_runs([buffers[run], table])
+
+    def last_time(run: int):
+        return buffers[run].column("ObservationDateTime")[-1].value
+
+    for run in range(len(readers)):
+        read_next(run)
+
+    while True:
+        for run in range(len(readers)):
+            while not finished[run] and (buffers[run] is None or buffers[run].num_rows == 0):
+                read_next(run)
+
+        unfinished = [
+            run for run in range(len(readers)) if not finished[run] and buffers[run].num_rows
+        ]
+        if not unfinished and not any(
+            buffer is not None and buffer.num_rows for buffer in buffers
+        ):
+            return
+
+        bound = min(last_time(run) for run in unfinished) if unfinished else None
+
+        taken = []
+        for run, buffer in enumerate(buffers):
+            if buffer is None or buffer.num_rows == 0:
+                continue
+            if bound is None:
+                rows = buffer.num_rows
+            else:
+                rows = int(
+                    np.searchsorted(
+                        buffer.column("ObservationDateTime")
+                        .to_numpy()
+                        .astype("datetime64[ns]")
+                        .view(np.int64),
+                        bound,
+                        side="left",
+                    )
+                )
+            if rows:
+                taken.append(buffer.slice(0, rows))
+                buffers[run] = buffer.slice(rows)
+
+        if not taken:
+            # Every row read so far is of the earliest unfinished hour, read on until it ends
+            for run in unfinished:
+                if last_time(run) == bound:
+                    read_next(run)
+            continue
+
+        merged = dedupe_merged(concat_runs(taken), dedupe_policy)
+        yield sort_merged(merged)
+
+
+def run_schema(fpaths_run: list) -> pa.Schema:
+    """
+    Returns the schema of the merge of run files, with dictionary columns as plain text
+    """
+    schema = pa.unify_schemas(
+        [
+            pa.schema(
+                field.with_type(field.type.value_type)
+                if pa.types.is_dictionary(field.type)
+                else field
+                for field in pq.read_schema(fpath_run)
+            )
+            for fpath_run in fpaths_run
+        ]
+    )
+    return pa.schema(
+        field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+        for field in schema
+    )
+
+
+def output_schema(dtypes: dict) -> pa.Schema:
+    """
+    Returns the parquet schema, with pandas metadata, of a frame of the output dtypes
+    """
+    return pa.Schema.from_pandas(
+        pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()}),
+        preserve_index=False,
+    )
+
+
+def encode_output(table: pa.Table, schema: pa.Schema, dtypes: dict) -> pa.Table:
+    """
+    Casts merged rows to the output schema, text columns are dictionary encoded with
+    every category of the output so each row group has the same dictionary
+    """
+    arrays = []
+    for field in schema:
+        column = table.column(field.name)
+        if pa.types.is_dictionary(field.type):
+            dictionary = pa.array(
+                dtypes[field.name].categories.to_numpy(), type=field.type.value_type
+            )
+            indices = pc.index_in(
+                column.cast(field.type.value_type).combine_chunks(), value_set=dictionary
+            )
+            column = pa.DictionaryArray.from_arrays(
+                indices.cast(field.type.index_type), dictionary, ordered=field.type.ordered
+            )
+        else:
+            column = column.cast(field.type)
+        arrays.append(column)
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def write_merged(tables, fpath_parquet: str, schema: pa.Schema, encode, row_group_size: int):
+    """
+    Writes merged tables to a parquet file in row groups of row_group_size rows
+    encode converts each table to the schema
+    Returns the number of rows written
+    """
+    rows, pending = 0, []
+    with pq.ParquetWriter(fpath_parquet, schema) as writer:
+        for table in tables:
+            pending.append(table)
+            if sum(table.num_rows for table in pending) >= row_group_size:
+                table = encode(concat_runs(pending))
+                writer.write_table(table, row_group_size=row_group_size)
+                rows += table.num_rows
+                pending = []
+        if pending:
+            table = encode(concat_runs(pending))
+            writer.write_table(table, row_group_size=row_group_size)
+            rows += table.num_rows
+    return rows
+
+
+@wp.log_error(wp.clogger)
+def backfill_weather_files(
+    fpaths: list,
+    fpath_parquet: str,
+    memory_budget_mb: float = MEMORY_BUDGET_MB,
+    dedupe_policy: str = "first",
+    spill_dir: str = None,
+    row_group_size: int = 10000,
+) -> int:
+    """
+    Writes any number of weather files to one parquet file in the same order and with
+    the same rows as a full run, holding about memory_budget_mb at most
+    Files are transformed a chunk at a time and every sorted chunk spilled to a run file
+    in a temporary folder (in spill_dir when given), which are then merged
+    Runs are merged in several passes when there are too many to merge at once
+    The catalog of the output is brought up to date once it is written
+    Returns the number of rows written
+    """
+    if not fpaths:
+        raise ValueError("No weather files to backfill")
+
+    budget_rows = max(int(memory_budget_mb * 2 ** 20 // ROW_BYTES), MIN_BATCH_ROWS)
+    fan_in = max(2, budget_rows // (2 * MIN_BATCH_ROWS))
+    row_group_size = min(row_group_size, budget_rows)
+
+    with tempfile.TemporaryDirectory(prefix="backfill-", dir=spill_dir) as run_dir:
+        fpaths_run, dtypes = spill_sorted_runs(fpaths, run_dir, budget_rows, dedupe_policy)
+
+        merge_pass = 0
+        while len(fpaths_run) > fan_in:
+            merge_pass += 1
+            fpaths_merged = []
+            for start in range(0, len(fpaths_run), fan_in):
+                fpaths_group = fpaths_run[start : start + fan_in]
+                fpath_merged = os.path.join(
+                    run_dir, f"pass-{merge_pass}-{len(fpaths_merged):06d}.parquet"
+                )
+                schema = run_schema(fpaths_group)
+                write_merged(
+                    merge_sorted_runs(
+                        fpaths_group, max(budget_rows // (2 * fan_in), 1), dedupe_policy
+                    ),
+                    fpath_merged,
+                    schema,
+                    lambda table: table.select(schema.names).cast(schema),
+                    row_group_size,
+                )
+                for fpath_run in fpaths_group:
+                    os.remove(fpath_run)
+                fpaths_merged.append(fpath_merged)
+            fpaths_run = fpaths_merged
+
+        schema = output_schema(dtypes)
+        rows = write_merged(
+            merge_sorted_runs(
+                fpaths_run, max(budget_rows // (2 * len(fpaths_run)), 1), dedupe_policy
+            ),
+            fpath_parquet,
+            schema,
+            lambda table: encode_output(table, schema, dtypes),
+            row_group_size,
+        )
+
+    catalog.update_catalog(fpath_parquet)
+    return rows
@@ -0,0 +1,216 @@
+import json
+import os
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import local_query
+
+CATALOG_FILE_NAME = "_catalog.json"
+
+# Bump when the zone map of a file changes so catalogs of the old code are rebuilt
+CATALOG_VERSION = 1
+
+# Columns summarised in the zone map of every parquet file
+ZONE_MAP_COLUMNS = ["ObservationDate", "Region", "ForecastSiteCode", "ScreenTemperature"]
+
+
+def catalog_path(fpath_parquet: str) -> str:
+    """
+    Returns the catalog file of a weather parquet file, directory or dataset
+    It starts with _ so Drill and pyarrow datasets ignore it
+    """
+    if os.path.isdir(fpath_parquet):
+        return os.path.join(fpath_parquet, CATALOG_FILE_NAME)
+    dir_parquet, name = os.path.split(fpath_parquet)
+    return os.path.join(dir_parquet, f"_{name}.catalog.json")
+
+
+def catalog_key(fpath: str, fpath_parquet: str) -> str:
+    """
+    Returns the key of a parquet file in the catalog, its path relative to the dataset
+    """
+    if not os.path.isdir(fpath_parquet):
+        return os.path.basename(fpath)
+    return os.path.relpath(fpath, fpath_parquet).replace(os.sep, "/")
+
+
+def load_catalog(fpath_parquet: str) -> dict:
+    """
+    Returns the zone map of every parquet file keyed by catalog_key
+    or an empty catalog when none has been written (or it is of an older version)
+    """
+    fpath_catalog = catalog_path(fpath_parquet)
+    if not os.path.exists(fpath_catalog):
+        return {}
+    with open(fpath_catalog) as f:
+        catalog = json.load(f)
+    if catalog.get("version") != CATALOG_VERSION:
+        return {}
+    return catalog["files"]
+
+
+def save_catalog(catalog: dict, fpath_parquet: str):
+    """
+    Writes the catalog atomically so a reader never sees it half written
+    """
+    fpath_catalog = catalog_path(fpath_parquet)
+    fpath_tmp = f"{fpath_catalog}.tmp"
+    with open(fpath_tmp, "w") as f:
+        json.dump(
+            {"version": CATALOG_VERSION, "files": catalog}, f, indent=2, sort_keys=True
+        )
+    os.replace(fpath_tmp, fpath_catalog)
+
+
+def file_version(fpath: str) -> dict:
+    """
+    Returns the size and modified time a zone map was taken at
+    """
+    stat = os.stat(fpath)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def zone_map(fpath: str) -> dict:
+    """
+    Returns the row count, ObservationDate and ScreenTemperature ranges, Regions
+    and ForecastSiteCodes of a parquet file, reading only those columns
+    Ranges of a column with no values are None
+    """
+    table = pq.read_table(fpath, columns=ZONE_MAP_COLUMNS)
+
+    def value_range(column: str, convert=lambda value: value):
+        min_max = pc.min_max(table.column(column))
+        if not min_max["min"].is_valid:
+            return None, None
+        return convert(min_max["min"].as_py()), convert(min_max["max"].as_py())
+
+    min_date, max_date = value_range(
+        "ObservationDate", lambda value: pd.Timestamp(value).date().isoformat()
+    )
+    min_temperature, max_temperature = value_range("ScreenTemperature")
+    return dict(
+        file_version(fpath),
+        rows=table.num_rows,
+        min_date=min_date,
+        max_date=max_date,
+        regions=sorted(
+            pc.unique(table.column("Region").cast("string")).drop_null().to_pylist()
+        ),
+        site_codes=sorted(
+            pc.unique(table.column("ForecastSiteCode")).drop_null().to_pylist()
+        ),
+        min_temperature=min_temperature,
+        max_temperature=max_temperature,
+    )
+
+
+def is_current(fpath: str, entry: dict) -> bool:
+    """
+    True when a file has not changed since its zone map was taken
+    """
+    return entry is not None and {
+        "size": entry["size"],
+        "mtime_ns": entry["mtime_ns"],
+    } == file_version(fpath)
+
+
+def update_catalog(fpath_parquet: str) -> dict:
+    """
+    Brings the catalog of a weather parquet file, directory or dataset up to date
+    Only new or changed files are read and removed files are dropped
+    Returns the catalog
+    """
+    catalog = load_catalog(fpath_parquet)
+    updated = {}
+    for fpath in local_query.weather_dataset(fpath_parquet).files:
+        key = catalog_key(fpath, fpath_parquet)
+        entry = catalog.get(key)
+        updated[key] = entry if is_current(fpath, entry) else zone_map(fpath)
+    save_catalog(updated, fpath_parquet)
+    return updated
+
+
+def may_match(
+    entry: dict, start_date=None, end_date=None, regions: list = None, site_codes: list = None
+) -> bool:
+    """
+    False when no row of a file's zone map can be from start_date to end_date inclusive
+    and of the given regions and site codes
+    """
+    if entry["rows"] == 0:
+        return False
+    if start_date is not None and (
+        entry["max_date"] is None
+        or pd.Timestamp(entry["max_date"]) < pd.Timestamp(start_date).normalize()
+    ):
+        return False
+    if end_date is not None and (
+        entry["min_date"] is None or pd.Timestamp(entry["min_date"]) > pd.Timestamp(end_date)
+    ):
+        return False
+    if regions and not set(regions) & set(entry["regions"]):
+        return False
+    if site_codes and not set(site_codes) & set(entry["site_codes"]):
+        return False
+    return True
+
+
+def pruned_dataset(
+    fpath_parquet: str,
+    start_date=None,
+    end_date=None,
+    regions: list = None,
+    site_codes: list = None,
+) -> ds.Dataset:
+    """
+    Opens a weather parquet file, directory or dataset without the files whose zone map
+    shows they hold no rows from start_date to end_date inclusive of the given regions
+    and site codes
+    Files which are not in the catalog or changed since are always kept,
+    so a missing or stale catalog only makes queries slower
+    """
+    dataset = local_query.weather_dataset(fpath_parquet)
+    catalog = load_catalog(fpath_parquet)
+    if not catalog:
+        return dataset
+
+    fpaths = []
+    for fpath in dataset.files:
+        entry = catalog.get(catalog_key(fpath, fpath_parquet))
+        if not is_current(fpath, entry) or may_match(
+            entry, start_date, end_date, regions, site_codes
+        ):
+            fpaths.append(fpath)
+    if len(fpaths) == len(dataset.files):
+        return dataset
+
+    return ds.dataset(
+        fpaths,
+        schema=dataset.schema,
+        format="parquet",
+        partitioning="hive",
+        partition_base_dir=fpath_parquet if os.path.isdir(fpath_parquet) else None,
+    )
+
+
+def catalog_summary(fpath_parquet: str) -> pd.DataFrame:
+    """
+    Returns what is loaded in the weather output from its catalog alone, one row per file
+    with its row count, ObservationDate range and number of regions and sites
+    """
+    columns = ["File", "Rows", "MinDate", "MaxDate", "Regions", "Sites"]
+    return pd.DataFrame(
+        [
+            [
+                key,
+                entry["rows"],
+                entry["min_date"],
+                entry["max_date"],
+                len(entry["regions"]),
+                len(entry["site_codes"]),
+            ]
+            for key, entry in sorted(load_catalog(fpath_parquet).items())
+        ],
+        columns=columns,
+    )
@@ -0,0 +1,638 @@
+import argparse
+import logging
+import os
+import sys
+from contextlib import contextmanager
+
+# Only the standard library is imported here, each command imports the modules it needs
+# when it runs so a query or a validation dry run does not load pydrill or pandas_schema
+
+FILENAMES = ["Data/weather.20160201.csv", "Data/weather.20160301.csv"]
+
+PARQUET_OUTPUT_FILE_PATH = "Data/weather.parquet"
+
+# Folder watched for new monthly files by the watch command
+WATCH_INPUT_DIR = "Data"
+
+# Pre-aggregated site x day table written alongside the weather parquet output
+SITE_DAY_OUTPUT_FILE_PATH = "Data/weather_site_day.parquet"
+
+# Output folder of incremental runs, one parquet file per input file and a manifest
+PARQUET_OUTPUT_DIR = "Data/weather"
+
+# Rows of the same ForecastSiteCode and ObservationDateTime are resolved by keeping the
+# "first", "last" (eg the later delivery) or "most_complete" row
+DEDUPE_POLICIES = ["first", "last", "most_complete"]
+
+DEDUPE_POLICY = "first"
+
+# Memory a backfill holds at most, rows beyond it are spilled to sorted run files
+MEMORY_BUDGET_MB = 256
+
+# The run still fails when more than this share of a file's (or chunk's) rows is rejected
+MAX_REJECT_RATE = 0.01
+
+# "local" runs queries in process on the parquet output, "drill" runs the hottest day
+# query on Apache Drill, which must be running
+QUERY_BACKEND = "local"
+
+# Local query results are cached here keyed by the query and a fingerprint of the parquet
+# files, so they are reused until the pipeline writes new data
+QUERY_CACHE_DIR = "Data/query_cache"
+
+# Each pipeline stage call is written as a JSON line of wall time, CPU time,
+# peak memory increase and row counts, and totalled per stage in the run summary
+METRICS_OUTPUT_FILE_PATH = "Data/run_metrics.jsonl"
+
+RUN_SUMMARY_FILE_PATH = "Data/run_summary.json"
+
+# Warnings and errors of every module, the file is only created once something is logged
+ERROR_LOG_FILE_PATH = "error.log"
+
+# Weather station coordinates for reverse geo-coding and the addresses found
+CORDS_FILE_PATH = "Data/ForecastSiteCords.csv"
+
+ADDRESSES_FILE_PATH = "Data/ForecastSiteAddresses.csv"
+
+GEOCODE_CACHE_PATH = "Data/GeocodeCache.json"
+
+clogger = logging.getLogger(__name__)
+
+
+def configure_error_log(fpath: str) -> logging.Handler:
+    """
+    Writes the warnings and errors logged by any module to fpath
+    """
+    handler = logging.FileHandler(fpath, delay=True)
+    handler.setLevel(logging.WARNING)
+    logging.getLogger().addHandler(handler)
+    return handler
+
+
+def drill_path(fpath: str) -> str:
+    """
+    Returns the Drill dfs table of a local parquet file or folder
+    """
+    return f"dfs.`{os.path.abspath(fpath).replace(os.sep, '/')}`"
+
+
+@contextmanager
+def instrumented(args):
+    """
+    Records the pipeline stages run inside the block and writes the run summary at the end
+    """
+    import instrumentation
+
+    instrumentation.reset()
+    instrumentation.configure(args.metrics, args.profile_stage)
+    try:
+        yield
+    finally:
+        instrumentation.write_run_summary(args.run_summary)
+
+
+def stream_weather_chunks(args, site_day_partials: list):
+    """
+    Yields validated and transformed chunks of every weather file in turn
+    Duplicates are removed and rows sorted within each chunk only
+    With a quarantine dir, rejected rows of every chunk of a file are written once the file ends
+    Partial site day aggregates of each chunk are appended to site_day_partials
+    """
+    import pandas as pd
+    import aggregates
+    import weather_pipeline as wp
+
+    for fpath in args.files:
+        rejected_chunks = []
+        for raw_weather_chunk in wp.import_monthly_weather_csv_chunks(
+            fpath, args.chunksize
+        ):
+            if args.quarantine_dir:
+                raw_weather_chunk, rejected = wp.quarantine_weather_data(
+                    raw_weather_chunk, args.max_reject_rate
+                )
+                rejected_chunks.append(rejected)
+            else:
+                wp.validate_weather_data(raw_weather_chunk)
+
+            weather_chunk_out = wp.transform_weather_df(
+                raw_weather_chunk, dedupe_policy=args.dedupe_policy
+            )
+
+            site_day_partials.append(
+                aggregates.partial_site_day_aggregates(weather_chunk_out)
+            )
+
+            yield weather_chunk_out
+
+        if args.quarantine_dir:
+            wp.export_quarantine(
+                pd.concat(rejected_chunks),
+                wp.quarantine_path(fpath, args.quarantine_dir),
+                fpath,
+            )
+
+
+def run_ingest(args):
+    """
+    Imports, validates and transforms the weather files and writes the parquet output
+    and the site day aggregates
+    """
+    import pandas as pd
+    import aggregates
+    import weather_pipeline as wp
+
+    if args.incremental:
+        import manifest
+
+        manifest.run_incremental(
+            args.files,
+            args.output_dir,
+            args.processes,
+            args.site_day_output,
+            args.dedupe_policy,
+            args.dedupe_existing,
+            args.quarantine_dir,
+            args.max_reject_rate,
+            args.features,
+        )
+        return
+
+    if args.chunksize:
+        if args.features:
+            raise ValueError(
+                "Rolling features need every row of a site in one frame, "
+                "run without --chunksize or with --incremental"
+            )
+        site_day_partials = []
+        wp.export_weather_chunks_to_parquet(
+            stream_weather_chunks(args, site_day_partials), args.output
+        )
+        site_days = aggregates.combine_site_day_aggregates(site_day_partials)
+    elif args.arrow and not (args.quarantine_dir or args.star_schema_dir or args.features):
+        import arrow_pipeline
+
+        arrow_pipeline.run_weather_files_arrow(args.files, args.output, args.dedupe_policy)
+
+        site_days = aggregates.site_day_aggregates(
+            pd.read_parquet(
+                args.output,
+                columns=aggregates.SITE_DAY_KEYS
+                + ["ScreenTemperature", "WindGust", "Pressure"],
+            )
+        )
+    else:
+        import parallel
+
+        weather_frame_out = parallel.run_weather_files(
+            args.files,
+            args.processes,
+            args.dedupe_policy,
+            args.quarantine_dir,
+            args.max_reject_rate,
+        )
+        if args.features:
+            import features
+
+            weather_frame_out = features.add_rolling_features(weather_frame_out)
+
+        wp.export_weather_to_parquet(weather_frame_out, args.output)
+
+        if args.star_schema_dir:
+            import star_schema
+
+            star_schema.export_star_schema(weather_frame_out, args.star_schema_dir)
+
+        site_days = aggregates.site_day_aggregates(weather_frame_out)
+
+    aggregates.update_site_day_aggregates(
+        site_days, args.site_day_output, replace_all=True
+    )
+
+
+def run_query(args):
+    """
+    Runs a report on the parquet output and prints it
+    """
+    if args.backend == "drill":
+        if args.report != "hottest_day" or args.start or args.end or args.region:
+            raise ValueError("The drill backend only runs the unfiltered hottest_day query")
+
+        import weather_pipeline as wp
+
+        wp.max_daily_average_temperature(
+            args.drill_path or drill_path(args.parquet), "drill"
+        )
+        return
+
+    import reports
+
+    options = {} if args.top is None else {"top": args.top}
+    frame_out = reports.run_report(
+        args.report,
+        args.parquet,
+        args.start,
+        args.end,
+        args.region,
+        None if args.no_cache else args.cache_dir,
+        **options,
+    )
+
+    if args.report == "hottest_day":
+        import weather_pipeline as wp
+
+        wp.format_task_query_output(frame_out)
+    else:
+        print(frame_out.to_string(index=False))
+
+
+def ingest(args) -> int:
+    with instrumented(args):
+        run_ingest(args)
+    return 0
+
+
+def run(args) -> int:
+    """
+    Runs the whole pipeline, then the hottest day query on its output
+    """
+    args.report = "hottest_day"
+    args.parquet = args.output_dir if args.incremental else args.output
+    args.drill_path = None
+    args.start = args.end = args.region = args.top = None
+    with instrumented(args):
+        run_ingest(args)
+        run_query(args)
+    return 0
+
+
+def query(args) -> int:
+    run_query(args)
+    return 0
+
+
+def validate(args) -> int:
+    """
+    Checks every row of the weather files and prints the number rejected per rule
+    A file fails when it has rejected rows, or with a quarantine dir when more than
+    max_reject_rate of its rows are rejected, whose rows are then written there
+    A dry run writes nothing
+    Returns 1 when any file fails
+    """
+    import pandas as pd
+    import weather_pipeline as wp
+
+    failed = False
+    for fpath in args.files:
+        try:
+            frame_in = wp.import_monthly_weather_csv(fpath)
+            _, rejected = wp.quarantine_weather_data(
+                frame_in, args.max_reject_rate if args.quarantine_dir else 1.0
+            )
+        except (wp.DataValidationError, pd.errors.EmptyDataError) as e:
+            failed = True
+            print(f"{fpath}: failed, {e}")
+            continue
+
+        print(f"{fpath}: {len(frame_in)} rows, {len(rejected)} rejected")
+        reasons = rejected[wp.REJECT_REASON_COLUMN].value_counts()
+        for reason, count in reasons[reasons > 0].items():
+            print(f"    {reason}: {count}")
+
+        if args.quarantine_dir:
+            if not args.dry_run:
+                wp.export_quarantine(
+                    rejected, wp.quarantine_path(fpath, args.quarantine_dir), fpath
+                )
+        elif len(rejected):
+            failed = True
+
+    return 1 if failed else 0
+
+
+def export(args) -> int:
+    """
+    Writes other outputs from the weather parquet output
+    """
+    import pandas as pd
+
+    frame_in = pd.read_parquet(args.parquet)
+
+    if args.star_schema_dir:
+        import star_schema
+
+        star_schema.export_star_schema(frame_in, args.star_schema_dir)
+
+    if args.site_days:
+        import aggregates
+
+        aggregates.update_site_day_aggregates(
+            aggregates.site_day_aggregates(frame_in), args.site_days, replace_all=True
+        )
+
+    if args.cords:
+        import weather_pipeline as wp
+
+        wp.export_cords(frame_in, args.cords)
+
+    if args.csv:
+        frame_in.to_csv(args.csv, index=False)
+
+    return 0
+
+
+def show_catalog(args) -> int:
+    """
+    Prints what is loaded in the parquet output from its catalog, without reading the data
+    """
+    import catalog
+
+    if args.update:
+        catalog.update_catalog(args.parquet)
+    summary = catalog.catalog_summary(args.parquet)
+    if summary.empty:
+        print(f"No catalog of {args.parquet}, run with --update to build it")
+        return 1
+    print(summary.to_string(index=False))
+    print(
+        f"{summary.Rows.sum()} rows in {len(summary)} file(s) "
+        f"from {summary.MinDate.min()} to {summary.MaxDate.max()}"
+    )
+    return 0
+
+
+def backfill(args) -> int:
+    """
+    Writes the weather files to parquet in a bounded amount of memory
+    """
+    import pyarrow.parquet as pq
+    import aggregates
+    import backfill
+
+    with instrumented(args):
+        backfill.backfill_weather_files(
+            args.files,
+            args.output,
+            args.memory_budget_mb,
+            args.dedupe_policy,
+            args.spill_dir,
+        )
+
+        # Site days are aggregated a row group at a time
+        site_day_partials = [
+            aggregates.partial_site_day_aggregates(batch.to_pandas())
+            for batch in pq.ParquetFile(args.output).iter_batches(
+                columns=aggregates.SITE_DAY_KEYS
+                + ["ScreenTemperature", "WindGust", "Pressure"]
+            )
+        ]
+        aggregates.update_site_day_aggregates(
+            aggregates.combine_site_day_aggregates(site_day_partials),
+            args.site_day_output,
+            replace_all=True,
+        )
+    return 0
+
+
+def watch(args) -> int:
+    """
+    Runs new weather files dropped into the input folder until interrupted
+    """
+    import watcher
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    watcher.clogger.addHandler(handler)
+    watcher.clogger.setLevel(logging.INFO)
+
+    # Options not given keep the defaults of watcher.py
+    settings = {
+        "pattern": args.pattern,
+        "poll_seconds": args.poll_seconds,
+        "settle_seconds": args.settle_seconds,
+        "batch_files": args.batch_files,
+        "batch_wait_seconds": args.batch_wait_seconds,
+        "queue_size": args.queue_size,
+    }
+    service = watcher.WatchService(
+        args.input_dir,
+        args.output_dir,
+        processes=args.processes,
+        fpath_aggregates=args.site_day_output,
+        dedupe_policy=args.dedupe_policy,
+        dedupe_existing=args.dedupe_existing,
+        quarantine_dir=args.quarantine_dir,
+        max_reject_rate=args.max_reject_rate,
+        rolling_features=args.features,
+        **{name: value for name, value in settings.items() if value is not None},
+    )
+    with instrumented(args):
+        service.run()
+    return 0
+
+
+def geocode(args) -> int:
+    import geocoding
+
+    geocoding.transform_reverse_geocodes(
+        geocoding.get_reverse_geocodes(
+            args.cords, args.cache, rate=args.rate, max_in_flight=args.max_in_flight
+        ),
+        args.output,
+    )
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="GFWeatherPipeline",
+        description="Ingests monthly weather CSV files to parquet and queries the output",
+    )
+    parser.add_argument("--error-log", default=ERROR_LOG_FILE_PATH)
+    commands = parser.add_subparsers(dest="command")
+
+    files = argparse.ArgumentParser(add_help=False)
+    files.add_argument("files", nargs="*", default=FILENAMES, help="weather .csv files")
+
+    quarantine = argparse.ArgumentParser(add_help=False)
+    quarantine.add_argument(
+        "--quarantine-dir", help="write rejected rows here rather than failing the run"
+    )
+    quarantine.add_argument("--max-reject-rate", type=float, default=MAX_REJECT_RATE)
+
+    pipeline = argparse.ArgumentParser(add_help=False, parents=[files, quarantine])
+    pipeline.add_argument("--output", default=PARQUET_OUTPUT_FILE_PATH)
+    pipeline.add_argument("--site-day-output", default=SITE_DAY_OUTPUT_FILE_PATH)
+    pipeline.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only process new or changed files, one parquet file each in --output-dir",
+    )
+    pipeline.add_argument("--output-dir", default=PARQUET_OUTPUT_DIR)
+    pipeline.add_argument(
+        "--no-dedupe-existing",
+        dest="dedupe_existing",
+        action="store_false",
+        help="in incremental runs keep observations already written for other files",
+    )
+    pipeline.add_argument(
+        "--chunksize", type=int, help="stream each file through the pipeline in chunks"
+    )
+    pipeline.add_argument(
+        "--processes", type=int, help="worker processes, 1 runs the files serially"
+    )
+    pipeline.add_argument("--dedupe-policy", choices=DEDUPE_POLICIES, default=DEDUPE_POLICY)
+    pipeline.add_argument(
+        "--arrow", action="store_true", help="run on Arrow record batches end to end"
+    )
+    pipeline.add_argument(
+        "--features",
+        action="store_true",
+        help="add per site rolling window features (pressure tendency, 24h temperature, ...)",
+    )
+    pipeline.add_argument(
+        "--star-schema-dir", help="also write a sites dimension and observations fact table"
+    )
+    pipeline.add_argument("--metrics", default=METRICS_OUTPUT_FILE_PATH)
+    pipeline.add_argument("--run-summary", default=RUN_SUMMARY_FILE_PATH)
+    pipeline.add_argument(
+        "--profile-stage", help="profile a stage (eg transform_weather_df) with cProfile"
+    )
+
+    backend = argparse.ArgumentParser(add_help=False)
+    backend.add_argument("--backend", choices=["local", "drill"], default=QUERY_BACKEND)
+    backend.add_argument("--cache-dir", default=QUERY_CACHE_DIR)
+    backend.add_argument("--no-cache", action="store_true")
+
+    command = commands.add_parser(
+        "run",
+        parents=[pipeline, backend],
+        help="ingest the weather files and run the hottest day query (the default)",
+    )
+    command.set_defaults(func=run)
+
+    command = commands.add_parser(
+        "ingest", parents=[pipeline], help="write the weather files to parquet"
+    )
+    command.set_defaults(func=ingest)
+
+    command = commands.add_parser(
+        "validate", parents=[files, quarantine], help="check the weather files"
+    )
+    command.add_argument(
+        "--dry-run", action="store_true", help="report rejected rows without writing them"
+    )
+    command.set_defaults(func=validate)
+
+    command = commands.add_parser("export", help="write other outputs from the parquet output")
+    command.add_argument("--parquet", default=PARQUET_OUTPUT_FILE_PATH)
+    command.add_argument("--star-schema-dir")
+    command.add_argument("--site-days", help="site day aggregates parquet file")
+    command.add_argument("--cords", help="site coordinates .csv file for geocode")
+    command.add_argument("--csv", help="weather data .csv file")
+    command.set_defaults(func=export)
+
+    command = commands.add_parser(
+        "query", parents=[backend], help="run a report on the parquet output"
+    )
+    command.add_argument(
+        "report",
+        nargs="?",
+        default="hottest_day",
+        help="hottest_day, coldest_day, region_daily_stats, windiest_sites "
+        "or visibility_distribution",
+    )
+    command.add_argument("--parquet", default=PARQUET_OUTPUT_FILE_PATH)
+    command.add_argument("--drill-path", help="Drill table, by default the --parquet path")
+    command.add_argument("--start", help="first ObservationDate eg 2016-02-01")
+    command.add_argument("--end", help="last ObservationDate")
+    command.add_argument("--region", action="append", help="repeat for several regions")
+    command.add_argument("--top", type=int, help="number of sites of windiest_sites")
+    command.set_defaults(func=query)
+
+    command = commands.add_parser(
+        "catalog", help="show what is loaded in the parquet output from its catalog"
+    )
+    command.add_argument("--parquet", default=PARQUET_OUTPUT_FILE_PATH)
+    command.add_argument(
+        "--update", action="store_true", help="bring the catalog up to date first"
+    )
+    command.set_defaults(func=show_catalog)
+
+    command = commands.add_parser(
+        "backfill",
+        parents=[files],
+        help="write many weather files to parquet in a bounded amount of memory",
+    )
+    command.add_argument("--output", default=PARQUET_OUTPUT_FILE_PATH)
+    command.add_argument("--site-day-output", default=SITE_DAY_OUTPUT_FILE_PATH)
+    command.add_argument("--memory-budget-mb", type=float, default=MEMORY_BUDGET_MB)
+    command.add_argument(
+        "--spill-dir", help="folder of the temporary sorted runs, the system's by default"
+    )
+    command.add_argument("--dedupe-policy", choices=DEDUPE_POLICIES, default=DEDUPE_POLICY)
+    command.add_argument("--metrics", default=METRICS_OUTPUT_FILE_PATH)
+    command.add_argument("--run-summary", default=RUN_SUMMARY_FILE_PATH)
+    command.add_argument("--profile-stage")
+    command.set_defaults(func=backfill)
+
+    command = commands.add_parser(
+        "watch",
+        parents=[quarantine],
+        help="run new weather files dropped into a folder until interrupted",
+    )
+    command.add_argument("--input-dir", default=WATCH_INPUT_DIR)
+    command.add_argument("--pattern", help="file names to run, weather.*.csv by default")
+    command.add_argument("--output-dir", default=PARQUET_OUTPUT_DIR)
+    command.add_argument("--site-day-output", default=SITE_DAY_OUTPUT_FILE_PATH)
+    command.add_argument("--processes", type=int)
+    command.add_argument("--dedupe-policy", choices=DEDUPE_POLICIES, default=DEDUPE_POLICY)
+    command.add_argument("--no-dedupe-existing", dest="dedupe_existing", action="store_false")
+    command.add_argument("--features", action="store_true", help="add rolling window features")
+    command.add_argument("--poll-seconds", type=float)
+    command.add_argument(
+        "--settle-seconds", type=float, help="wait until a file has not changed for this long"
+    )
+    command.add_argument("--batch-files", type=int, help="files run together at most")
+    command.add_argument(
+        "--batch-wait-seconds", type=float, help="wait for more files to run together"
+    )
+    command.add_argument("--queue-size", type=int, help="batches waiting to run at most")
+    command.add_argument("--metrics", default=METRICS_OUTPUT_FILE_PATH)
+    command.add_argument("--run-summary", default=RUN_SUMMARY_FILE_PATH)
+    command.add_argument("--profile-stage")
+    command.set_defaults(func=watch)
+
+    command = commands.add_parser(
+        "geocode", help="reverse geocode the site coordinates with LocationIQ"
+    )
+    command.add_argument("--cords", default=CORDS_FILE_PATH)
+    command.add_argument("--output", default=ADDRESSES_FILE_PATH)
+    command.add_argument("--cache", default=GEOCODE_CACHE_PATH)
+    command.add_argument("--rate", type=float, default=2, help="requests per second")
+    command.add_argument("--max-in-flight", type=int, default=2)
+    command.set_defaults(func=geocode)
+
+    return parser
+
+
+def main(argv: list = None) -> int:
+    """
+    Runs a command, the whole pipeline when none is given
+    Returns the exit status
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args = parser.parse_args(argv + ["run"])
+
+    handler = configure_error_log(args.error_log)
+    try:
+        return args.func(args)
+    except Exception as e:
+        clogger.exception(e)
+        raise
+    finally:
+        logging.getLogger().removeHandler(handler)
+        handler.close()
@@ -0,0 +1,120 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Columns identifying one observation
+KEY_COLUMNS = ["ForecastSiteCode", "ObservationDateTime"]
+
+DEDUPE_POLICIES = ["first", "last", "most_complete"]
+
+
+def observation_keys(frame_in: pd.DataFrame) -> np.ndarray:
+    """
+    Returns a 64 bit hash of the ForecastSiteCode and ObservationDateTime of every row
+    """
+    # Hashes plain int64 values so nullable, numpy and parquet typed keys hash the same
+    key_frame = pd.DataFrame(
+        {
+            "ForecastSiteCode": pd.to_numeric(frame_in.ForecastSiteCode)
+            .fillna(-1)
+            .to_numpy(dtype=np.int64),
+            "ObservationDateTime": frame_in.ObservationDateTime.to_numpy(
+                dtype="datetime64[ns]"
+            ).view(np.int64),
+        }
+    )
+    return pd.util.hash_pandas_object(key_frame, index=False).to_numpy()
+
+
+def keep_mask(keys: np.ndarray, policy: str = "first", completeness=None) -> np.ndarray:
+    """
+    Returns a boolean mask keeping one row per key
+    first and last keep the first or last row of each key
+    most_complete keeps the row of each key with the fewest nulls, the first of equals
+    """
+    if policy == "first":
+        return ~pd.Series(keys).duplicated(keep="first").to_numpy()
+    elif policy == "last":
+        return ~pd.Series(keys).duplicated(keep="last").to_numpy()
+    elif policy != "most_complete":
+        raise ValueError(f"Unknown dedupe policy {policy}")
+
+    # Sorts rows by key then by most values, np.lexsort keeps ties in row order
+    order = np.lexsort((-np.asarray(completeness), keys))
+    sorted_keys = keys[order]
+    first_of_key = np.empty(len(keys), dtype=bool)
+    first_of_key[:1] = True
+    first_of_key[1:] = sorted_keys[1:] != sorted_keys[:-1]
+
+    mask = np.zeros(len(keys), dtype=bool)
+    mask[order[first_of_key]] = True
+    return mask
+
+
+def dedupe_observations(
+    frame_in: pd.DataFrame, policy: str = "first", existing_keys: np.ndarray = None
+) -> pd.DataFrame:
+    """
+    Keeps one row per ForecastSiteCode and ObservationDateTime, resolving rows of the same
+    site and hour which differ in any other column with the policy (first, last or
+    most_complete)
+    Rows whose key is in existing_keys (eg the keys of earlier output) are dropped
+    """
+    if frame_in.empty:
+        return frame_in
+
+    keys = observation_keys(frame_in)
+    completeness = (
+        frame_in.notna().sum(axis=1).to_numpy() if policy == "most_complete" else None
+    )
+    mask = keep_mask(keys, policy, completeness)
+
+    if existing_keys is not None and len(existing_keys):
+        mask &= ~np.isin(keys, existing_keys)
+
+    return frame_in[mask]
+
+
+def resolve_existing(frame_in: pd.DataFrame, existing: pd.DataFrame, policy: str = "first"):
+    """
+    Resolves observations of frame_in which are also in existing (eg earlier output)
+    with the policy, the rows of existing counting as the earlier ones
+    Completeness is counted over the columns of frame_in
+    Returns the rows of frame_in to keep and a boolean mask of the rows of existing to keep
+    """
+    completeness = None
+    if policy == "most_complete":
+        completeness = np.concatenate(
+            [
+                existing.reindex(columns=frame_in.columns).notna().sum(axis=1).to_numpy(),
+                frame_in.notna().sum(axis=1).to_numpy(),
+            ]
+        )
+    mask = keep_mask(
+        np.concatenate([observation_keys(existing), observation_keys(frame_in)]),
+        policy,
+        completeness,
+    )
+    return frame_in[mask[len(existing) :]], mask[: len(existing)]
+
+
+def read_existing_keys(fpath_parquet) -> np.ndarray:
+    """
+    Returns the observation keys of weather parquet output reading only its key columns
+    fpath_parquet is a parquet file or directory, or a list of parquet files
+    Output which does not exist yet has no keys
+    """
+    if isinstance(fpath_parquet, str):
+        exists = os.path.exists(fpath_parquet)
+    else:
+        fpath_parquet = [fpath for fpath in fpath_parquet if os.path.exists(fpath)]
+        exists = bool(fpath_parquet)
+
+    if not exists:
+        return np.array([], dtype=np.uint64)
+
+    import local_query
+
+    return observation_keys(
+        local_query.read_weather_columns(fpath_parquet, KEY_COLUMNS).to_pandas()
+    )
@@ -0,0 +1,209 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pydrill import client, exceptions
+
+DRILL_HOST = os.environ.get("PYDRILL_HOST", "localhost")
+DRILL_PORT = int(os.environ.get("PYDRILL_PORT", 8047))
+
+# Seconds to wait for a connection to Drill and for a query's results
+CONNECT_TIMEOUT = 2
+QUERY_TIMEOUT = 10
+
+# Number of queries in flight at once, each worker thread keeps its own HTTP session
+MAX_WORKERS = 4
+
+# Arrow types of the SQL types Drill reports in the metadata of a REST query result
+DRILL_ARROW_TYPES = {
+    "BIGINT": pa.int64(),
+    "INT": pa.int32(),
+    "INTEGER": pa.int32(),
+    "SMALLINT": pa.int16(),
+    "TINYINT": pa.int8(),
+    "DOUBLE": pa.float64(),
+    "FLOAT": pa.float32(),
+    "DECIMAL": pa.float64(),
+    "BOOLEAN": pa.bool_(),
+    "BIT": pa.bool_(),
+    "VARCHAR": pa.string(),
+    "CHARACTER VARYING": pa.string(),
+    "DATE": pa.date32(),
+    "TIMESTAMP": pa.timestamp("ms"),
+}
+
+
+def drill_arrow_type(sql_type: str) -> pa.DataType:
+    """
+    Returns the Arrow type of a Drill SQL type eg DECIMAL(10, 2) or VARCHAR(65535)
+    Types with no Arrow equivalent are kept as strings
+    """
+    return DRILL_ARROW_TYPES.get(sql_type.split("(")[0].strip().upper(), pa.string())
+
+
+def result_to_table(data: dict, schema: pa.Schema = None) -> pa.Table:
+    """
+    Converts the JSON of a Drill REST query result to an Arrow table in one pass per column
+    Column types are taken from schema when given, otherwise from the result's metadata
+    Drill returns values as strings or JSON numbers, both are cast to the column's type
+    """
+    rows = data.get("rows", [])
+    columns = data.get("columns") or (list(rows[0]) if rows else [])
+    metadata = data.get("metadata") or []
+
+    arrays = []
+    fields = []
+    for i, column in enumerate(columns):
+        if schema is not None and column in schema.names:
+            arrow_type = schema.field(column).type
+        elif i < len(metadata):
+            arrow_type = drill_arrow_type(metadata[i])
+        else:
+            arrow_type = pa.string()
+
+        values = [row.get(column) for row in rows]
+        try:
+            array = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            array = pa.array([None if value is None else str(value) for value in values])
+
+        if array.type != arrow_type:
+            if pa.types.is_null(array.type):
+                array = pa.nulls(len(values), arrow_type)
+            elif pa.types.is_string(arrow_type):
+                array = pa.array([None if value is None else str(value) for value in values])
+            else:
+                array = pc.cast(array, arrow_type)
+
+        arrays.append(array)
+        fields.append(pa.field(column, arrow_type))
+
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+class DrillClient:
+    """
+    A reusable Apache Drill REST client
+    Each thread keeps its own pydrill client, so its HTTP connections are reused
+    between queries, and Drill is checked to be running once rather than per query
+    submit and query_many run several queries at once on a thread pool
+    """
+
+    def __init__(
+        self,
+        host: str = DRILL_HOST,
+        port: int = DRILL_PORT,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        query_timeout: float = QUERY_TIMEOUT,
+        max_workers: int = MAX_WORKERS,
+    ):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.query_timeout = query_timeout
+        self.max_workers = max_workers
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._active = False
+        self._executor = None
+
+    def drill(self) -> client.PyDrill:
+        """
+        Returns this thread's pydrill client, created on first use
+        """
+        drill = getattr(self._local, "drill", None)
+        if drill is None:
+            # The (connect, read) timeout pair of requests made without their own,
+            # query passes it itself since pydrill's query always sets a timeout
+            drill = self._local.drill = client.PyDrill(
+                host=self.host,
+                port=self.port,
+                timeout=(self.connect_timeout, self.query_timeout),
+            )
+        return drill
+
+    def check_active(self):
+        """
+        Raises ImproperlyConfigured unless Drill is running, checking only until it is
+        """
+        if self._active:
+            return
+        with self._lock:
+            if not self._active and not self.drill().is_active(
+                timeout=self.connect_timeout
+            ):
+                raise exceptions.ImproperlyConfigured(
+                    "Apache Drill must be running to allow querying of parquet data"
+                )
+            self._active = True
+
+    def query(self, sql: str):
+        """
+        Runs a query and returns pydrill's result
+        """
+        self.check_active()
+        return self.drill().query(sql, timeout=(self.connect_timeout, self.query_timeout))
+
+    def query_table(self, sql: str, schema: pa.Schema = None) -> pa.Table:
+        """
+        Runs a query and returns its result as a typed Arrow table
+        """
+        return result_to_table(self.query(sql).data, schema)
+
+    def query_frame(self, sql: str, schema: pa.Schema = None) -> pd.DataFrame:
+        """
+        Runs a query and returns its result as a typed DataFrame
+        """
+        return self.query_table(sql, schema).to_pandas()
+
+    def submit(self, sql: str, schema: pa.Schema = None):
+        """
+        Starts a query on the thread pool and returns a Future of its Arrow table
+        Use asyncio.wrap_future to await it from a coroutine
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="drill"
+                )
+        return self._executor.submit(self.query_table, sql, schema)
+
+    def query_many(self, sqls: list, schema: pa.Schema = None) -> list:
+        """
+        Runs several queries at once and returns their Arrow tables in the same order
+        """
+        return [future.result() for future in [self.submit(sql, schema) for sql in sqls]]
+
+    def close(self):
+        """
+        Waits for submitted queries and stops the thread pool
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(host: str = DRILL_HOST, port: int = DRILL_PORT, **kwargs) -> DrillClient:
+    """
+    Returns the shared client of a Drill host and port, creating it on first use
+    kwargs (eg query_timeout) only apply when the client is created
+    """
+    with _clients_lock:
+        drill_client = _clients.get((host, port))
+        if drill_client is None:
+            drill_client = _clients[(host, port)] = DrillClient(host, port, **kwargs)
+        return drill_client
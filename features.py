@@ -0,0 +1,208 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.indexers import BaseIndexer
+import weather_pipeline as wp
+
+# Columns the rolling features are computed from, the only ones kept in the tail
+FEATURE_INPUT_COLUMNS = [
+    "ForecastSiteCode",
+    "ObservationDateTime",
+    "ScreenTemperature",
+    "WindGust",
+    "Pressure",
+]
+
+FEATURE_COLUMNS = [
+    "PressureTendency3h",
+    "MinTemperature24h",
+    "MaxTemperature24h",
+    "MeanTemperature24h",
+    "MaxWindGust6h",
+    "WindChill",
+]
+
+# Window lengths in hours, windows end at and include each row's hour
+PRESSURE_TENDENCY_HOURS = 3
+TEMPERATURE_WINDOW_HOURS = 24
+GUST_WINDOW_HOURS = 6
+
+# Hours of each site's rows carried to the next run, enough for the longest window
+TAIL_HOURS = max(PRESSURE_TENDENCY_HOURS, TEMPERATURE_WINDOW_HOURS, GUST_WINDOW_HOURS)
+
+# Wind chill is only defined at or below 10C and above 3 mph (4.8 km/h)
+WIND_CHILL_MAX_TEMPERATURE = 10
+WIND_CHILL_MIN_WIND_KMH = 4.8
+MPH_TO_KMH = 1.609344
+
+FEATURE_TAIL_FILE_NAME = "_feature_tail.parquet"
+
+# Sites are spaced this many hours apart in the sort key so windows never span two sites
+SITE_KEY_STRIDE = 1 << 32
+
+
+class HourWindowIndexer(BaseIndexer):
+    """
+    Rolling window bounds of precomputed start and end positions
+    """
+
+    def get_window_bounds(
+        self, num_values=0, min_periods=None, center=None, closed=None, step=None
+    ):
+        return self.start, self.end
+
+
+def site_hour_keys(frame_in: pd.DataFrame) -> np.ndarray:
+    """
+    Returns a sort key of each row's site and hour, consecutive hours of a site
+    are consecutive keys
+    """
+    site_ranks = pd.factorize(frame_in.ForecastSiteCode, sort=True)[0].astype(np.int64)
+    hours = (
+        frame_in.ObservationDateTime.to_numpy().astype("datetime64[h]").astype(np.int64)
+    )
+    return site_ranks * SITE_KEY_STRIDE + hours
+
+
+def hour_window(keys: np.ndarray, hours: int) -> HourWindowIndexer:
+    """
+    Returns the window of each row of sorted keys over its site's last hours hours
+    """
+    return HourWindowIndexer(
+        start=np.searchsorted(keys, keys - (hours - 1), side="left"),
+        end=np.arange(1, len(keys) + 1),
+    )
+
+
+def wind_chill(temperature: pd.Series, wind_speed: pd.Series) -> pd.Series:
+    """
+    Returns the wind chill index (JAG/TI) in degrees celsius of temperatures
+    and wind speeds in mph, the temperature itself where wind chill is not defined
+    """
+    wind_kmh = wind_speed.astype("float64") * MPH_TO_KMH
+    chill = (
+        13.12
+        + 0.6215 * temperature
+        - 11.37 * wind_kmh ** 0.16
+        + 0.3965 * temperature * wind_kmh ** 0.16
+    )
+    no_chill = (temperature > WIND_CHILL_MAX_TEMPERATURE) | (
+        wind_kmh <= WIND_CHILL_MIN_WIND_KMH
+    )
+    return chill.mask(no_chill, temperature)
+
+
+def feature_inputs(frame_in: pd.DataFrame, tail: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Returns the feature input columns of the tail then frame_in with readings as floats
+    """
+    return pd.concat(
+        [
+            frame[FEATURE_INPUT_COLUMNS].astype(
+                {"ScreenTemperature": "float64", "WindGust": "float64", "Pressure": "float64"}
+            )
+            for frame in ([frame_in] if tail is None else [tail, frame_in])
+        ],
+        ignore_index=True,
+    )
+
+
+@wp.log_error(wp.clogger)
+def add_rolling_features(frame_in: pd.DataFrame, tail: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Adds per site time window features to transformed weather data
+    PressureTendency3h is the change in Pressure since the site's reading 3 hours before
+    Min, Max and MeanTemperature24h are of ScreenTemperature over the site's last 24 hours
+    MaxWindGust6h is the highest WindGust over the site's last 6 hours
+    WindChill is of ScreenTemperature and WindSpeed
+    Rows are sorted by site and hour once and every window is computed on the whole frame
+    tail is the rows of earlier data (see feature_tail) used as history only,
+    rows of frame_in replace tail rows of the same site and hour
+    """
+    inputs = feature_inputs(frame_in, tail)
+    # Position of each row in frame_in, -1 for tail rows
+    inputs["_Position"] = np.concatenate(
+        [np.full(len(inputs) - len(frame_in), -1), np.arange(len(frame_in))]
+    )
+
+    keys = site_hour_keys(inputs)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    inputs = inputs.iloc[order].reset_index(drop=True)
+    # Keeps the last row of a site hour, frame_in's over the tail's
+    last = np.append(keys[1:] != keys[:-1], True)
+    keys, inputs = keys[last], inputs[last].reset_index(drop=True)
+
+    pressure = inputs.Pressure.to_numpy()
+    prior = np.searchsorted(keys, keys - PRESSURE_TENDENCY_HOURS)
+    prior_found = prior < len(keys)
+    prior_found[prior_found] = (
+        keys[prior[prior_found]] == keys[prior_found] - PRESSURE_TENDENCY_HOURS
+    )
+    tendency = np.full(len(keys), np.nan)
+    tendency[prior_found] = pressure[prior_found] - pressure[prior[prior_found]]
+
+    temperature_rolling = inputs.ScreenTemperature.rolling(
+        hour_window(keys, TEMPERATURE_WINDOW_HOURS), min_periods=1
+    )
+    features = pd.DataFrame(
+        {
+            "PressureTendency3h": tendency,
+            "MinTemperature24h": temperature_rolling.min(),
+            "MaxTemperature24h": temperature_rolling.max(),
+            "MeanTemperature24h": temperature_rolling.mean(),
+            "MaxWindGust6h": inputs.WindGust.rolling(
+                hour_window(keys, GUST_WINDOW_HOURS), min_periods=1
+            ).max(),
+        }
+    )
+
+    positions = inputs._Position.to_numpy()
+    features = features[positions >= 0]
+    features.index = positions[positions >= 0]
+    features = features.sort_index()
+
+    frame_out = frame_in.copy()
+    for column in features.columns:
+        frame_out[column] = features[column].to_numpy()
+    frame_out["WindChill"] = wind_chill(
+        frame_out.ScreenTemperature.astype("float64"), frame_out.WindSpeed
+    )
+    return frame_out
+
+
+def feature_tail(frame_in: pd.DataFrame, tail: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Returns the feature inputs of the last TAIL_HOURS hours of frame_in and the tail
+    before it, the history the features of the next run's rows need
+    """
+    inputs = feature_inputs(frame_in, tail)
+    latest = inputs.ObservationDateTime.max()
+    return (
+        inputs[inputs.ObservationDateTime > latest - pd.Timedelta(hours=TAIL_HOURS)]
+        .drop_duplicates(["ForecastSiteCode", "ObservationDateTime"], keep="last")
+        .sort_values(["ForecastSiteCode", "ObservationDateTime"])
+        .reset_index(drop=True)
+    )
+
+
+def load_feature_tail(output_dir: str) -> pd.DataFrame:
+    """
+    Returns the feature tail saved in the output directory, or None when there is none
+    """
+    fpath_tail = os.path.join(output_dir, FEATURE_TAIL_FILE_NAME)
+    if not os.path.exists(fpath_tail):
+        return None
+    return pd.read_parquet(fpath_tail)
+
+
+def save_feature_tail(tail: pd.DataFrame, output_dir: str):
+    """
+    Writes the feature tail atomically so an interrupted run never leaves it half written
+    """
+    fpath_tail = os.path.join(output_dir, FEATURE_TAIL_FILE_NAME)
+    fpath_tmp = f"{fpath_tail}.tmp"
+    pq.write_table(pa.Table.from_pandas(tail, preserve_index=False), fpath_tmp)
+    os.replace(fpath_tmp, fpath_tail)
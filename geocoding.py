@@ -1,35 +1,241 @@
 # using reverse geo-coding of longitude and latitude
+import asyncio
+import json
+import logging
+import os
+import threading
 import time
 import pandas as pd
-import locationiq.geocoder as gc
-import os
 import numpy as np
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from locationiq.geocoder import (
+    LocationIqError,
+    LocationIqInvalidRequest,
+    LocationIqNoPlacesFound,
+    LocationIqRequestLimitExeceeded,
+    LocationIqServerError,
+)
 from tqdm import tqdm
 
+LOCATIONIQ_REVERSE_URL = "https://locationiq.org/v1/reverse.php"
+
+GEOCODE_CACHE_PATH = "Data/GeocodeCache.json"
+
+# Errors retried with an exponential backoff and errors which skip a site
+RETRY_ERRORS = (LocationIqRequestLimitExeceeded, LocationIqServerError)
+SKIP_ERRORS = (LocationIqNoPlacesFound, LocationIqInvalidRequest)
+
+clogger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing rate requests per second on average in bursts of up to capacity
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class GeocodeCache:
+    """
+    Persistent reverse geocode addresses keyed by rounded latitude and longitude
+    Also serves as the checkpoint of an interrupted run
+    Places with no address are stored as None so they are not requested again
+    """
+
+    def __init__(self, fpath: str, places: int = 4):
+        self.fpath = fpath
+        self.places = places
+        self.unsaved = 0
+        self.addresses = {}
+        if fpath and os.path.exists(fpath):
+            with open(fpath) as f:
+                self.addresses = json.load(f)
+
+    def key(self, lat: float, lon: float) -> str:
+        return f"{lat:.{self.places}f},{lon:.{self.places}f}"
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.addresses
+
+    def get(self, key: str):
+        return self.addresses.get(key)
+
+    def set(self, key: str, address):
+        self.addresses[key] = address
+        self.unsaved += 1
+
+    def save(self):
+        """
+        Writes the cache atomically so an interrupted save never corrupts it
+        """
+        if not self.fpath or not self.unsaved:
+            return
+        fpath_tmp = f"{self.fpath}.tmp"
+        with open(fpath_tmp, "w") as f:
+            json.dump(self.addresses, f)
+        os.replace(fpath_tmp, self.fpath)
+        self.unsaved = 0
+
 
-def get_reverse_geocodes(fpath: str) -> pd.DataFrame:
+_sessions = threading.local()
+
+
+def request_reverse_geocode(
+    url: str, api_key: str, lat: float, lon: float, timeout: float
+) -> dict:
+    """
+    Requests the address of a latitude and longitude from LocationIQ
+    Raises the LocationIQ error matching the HTTP status of a failed request
+    """
+    if not hasattr(_sessions, "session"):
+        _sessions.session = requests.Session()
+
+    try:
+        response = _sessions.session.get(
+            url,
+            params={
+                "key": api_key,
+                "lat": lat,
+                "lon": lon,
+                "format": "json",
+                "addressdetails": 1,
+                "accept-language": "en",
+            },
+            timeout=timeout,
+        )
+    except requests.exceptions.RequestException as e:
+        raise LocationIqError.factory(500, e)
+
+    if response.status_code != 200:
+        raise LocationIqError.factory(response.status_code, response.text)
+
+    return response.json().get("address")
+
+
+async def reverse_geocode_coordinates(
+    coordinates: dict,
+    cache: GeocodeCache,
+    api_key: str,
+    url: str = LOCATIONIQ_REVERSE_URL,
+    rate: float = 2,
+    max_in_flight: int = 2,
+    max_retries: int = 5,
+    backoff: float = 1,
+    timeout: float = 10,
+    checkpoint_every: int = 10,
+):
+    """
+    Reverse geocodes the coordinates (a dict of cache key to latitude and longitude)
+    which are not already in the cache
+    Requests are rate limited by a token bucket with up to max_in_flight requests at once
+    Rate limit and server errors are retried with an exponential backoff
+    Sites with no places found or an invalid request are skipped
+    The cache is saved every checkpoint_every results and when the run stops for any reason
+    """
+    bucket = TokenBucket(rate, capacity=max_in_flight)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    loop = asyncio.get_running_loop()
+
+    async def reverse_geocode(key: str, lat: float, lon: float):
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                await bucket.acquire()
+                try:
+                    address = await loop.run_in_executor(
+                        executor, request_reverse_geocode, url, api_key, lat, lon, timeout
+                    )
+                    cache.set(key, address)
+                    return
+                except SKIP_ERRORS as e:
+                    # No places found is permanent so it is cached
+                    # an invalid request is requested again on the next run
+                    if isinstance(e, LocationIqNoPlacesFound):
+                        cache.set(key, None)
+                    else:
+                        clogger.warning(f"Skipped {key}: {e}")
+                    return
+                except RETRY_ERRORS as e:
+                    if attempt == max_retries:
+                        clogger.warning(f"Skipped {key} after {attempt} retries: {e}")
+                        return
+                    await asyncio.sleep(backoff * 2 ** attempt)
+
+    pending = {
+        key: (lat, lon) for key, (lat, lon) in coordinates.items() if key not in cache
+    }
+
+    with ThreadPoolExecutor(max_in_flight) as executor:
+        tasks = [
+            asyncio.ensure_future(reverse_geocode(key, lat, lon))
+            for key, (lat, lon) in pending.items()
+        ]
+        try:
+            for task in tqdm(
+                asyncio.as_completed(tasks),
+                desc="Retrieving address information",
+                leave=True,
+                unit="addresses",
+                total=len(tasks),
+            ):
+                await task
+                if cache.unsaved >= checkpoint_every:
+                    cache.save()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            cache.save()
+
+
+def get_reverse_geocodes(
+    fpath: str, cache_path: str = GEOCODE_CACHE_PATH, **kwargs
+) -> pd.DataFrame:
     """
     Returns address information for latitude and longitude data
+    Addresses are cached on disk by rounded latitude and longitude so reruns only
+    request new or moved sites and an interrupted run resumes where it stopped
+    kwargs are passed to reverse_geocode_coordinates
     """
     frame_codes = pd.read_csv(fpath, index_col=None)
-    geocoder = gc.LocationIQ(os.environ.get("APIKey"), "json")
-    results_list_dict = []
-
-    for index, row in tqdm(
-        frame_codes.iterrows(),
-        desc="Retrieving address information",
-        leave=True,
-        unit="addresses",
-        total=frame_codes.shape[0],
-    ):
-        dict_in = geocoder.reverse_geocode(row["Latitude"], row["Longitude"]).get(
-            "address"
-        )
-        dict_in["ForecastSiteCode"] = int(row["ForecastSiteCode"])
-        results_list_dict.append(dict_in)
-        time.sleep(0.9)  # Avoids reaching rate limit for LocationIQ geocoding service
+    cache = GeocodeCache(cache_path)
+    keys = [
+        cache.key(lat, lon) for lat, lon in zip(frame_codes.Latitude, frame_codes.Longitude)
+    ]
+
+    # Sites sharing rounded coordinates are requested once
+    coordinates = {}
+    for key, lat, lon in zip(keys, frame_codes.Latitude, frame_codes.Longitude):
+        coordinates.setdefault(key, (lat, lon))
 
-    frame_out = pd.DataFrame(results_list_dict)
+    kwargs.setdefault("api_key", os.environ.get("APIKey"))
+    asyncio.run(reverse_geocode_coordinates(coordinates, cache, **kwargs))
+
+    frame_out = pd.DataFrame(
+        [
+            dict(cache.get(key) or {}, ForecastSiteCode=int(code))
+            for key, code in zip(keys, frame_codes.ForecastSiteCode)
+        ]
+    )
 
     return frame_out
 
@@ -41,7 +247,9 @@ def get_column(frame_in: pd.DataFrame, col: str) -> pd.Series:
     return frame_in.reindex(columns=[col]).squeeze()
 
 
-def transform_reverse_geocodes(frame_in: pd.DataFrame()):
+def transform_reverse_geocodes(
+    frame_in: pd.DataFrame(), fpath: str = "Data/ForecastSiteAddresses.csv"
+):
     """
     Transforms and writes to CSV pertinent geo-code address information
     """
@@ -65,14 +273,8 @@ def transform_reverse_geocodes(frame_in: pd.DataFrame()):
         .rename(columns={"state": "Country", "postcode": "Postcode"})
     )
 
-    frame_out.to_csv("Data/ForecastSiteAddresses.csv", index=False)
-
+    frame_out.to_csv(fpath, index=False)
 
-transform_reverse_geocodes(get_reverse_geocodes("Data/ForecastSiteCords.csv"))
 
-# TODO: Error handling re below codes, etc
-# LocationIqNoPlacesFound if there are no matching results
-# LocationIqInvalidKey If the provided api_key is invalid.
-# LocationIqInvalidRequest If you go past your rate limit.
-# LocationIqRequestLimitExeceeded If you go past ratelimits.
-# LocationIqServerError occurs basically when there's server error
+if __name__ == "__main__":
+    transform_reverse_geocodes(get_reverse_geocodes("Data/ForecastSiteCords.csv"))
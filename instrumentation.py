@@ -0,0 +1,298 @@
+import cProfile
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+metrics_logger = logging.getLogger("metrics")
+
+# Records of every instrumented call in this process in the order they finished,
+# long running services clear them (see clear_metrics) so they do not grow without bound
+METRICS = []
+
+# Per stage totals of the cleared records, still counted by run_summary
+_cleared_summary = {}
+
+_settings = {"profile_stage": None, "profile_path": None, "metrics_handler": None}
+_profilers = {}
+_local = threading.local()
+
+
+def configure(
+    metrics_path: str = None,
+    profile_stage: str = None,
+    profile_path: str = None,
+    trace_memory: bool = False,
+):
+    """
+    Sets up the instrumentation of the stages decorated with log_error
+    metrics_path writes one JSON metrics record per stage call to a file
+    profile_stage names one stage (eg transform_weather_df) to run under cProfile,
+    its cumulative stats are written to profile_path (default <stage>.prof)
+    trace_memory measures peak memory with tracemalloc, which is exact for Python and numpy
+    allocations but slows the run, rather than with the process's maximum resident set size
+    The metrics file of an earlier call is closed, so configuring again never writes twice
+    """
+    close_metrics_file()
+    if metrics_path:
+        handler = logging.FileHandler(metrics_path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        metrics_logger.addHandler(handler)
+        metrics_logger.setLevel(logging.INFO)
+        _settings["metrics_handler"] = handler
+
+    _settings["profile_stage"] = profile_stage
+    _settings["profile_path"] = profile_path or f"{profile_stage}.prof"
+
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def close_metrics_file():
+    """
+    Stops writing metrics records to the file configure opened
+    """
+    handler = _settings["metrics_handler"]
+    if handler is not None:
+        metrics_logger.removeHandler(handler)
+        handler.close()
+        metrics_logger.setLevel(logging.NOTSET)
+        _settings["metrics_handler"] = None
+
+
+def start_worker():
+    """
+    Sets up a worker process, whose stage records are sent back to the parent process
+    (see add_records) rather than written to a metrics file inherited from it
+    """
+    close_metrics_file()
+    reset()
+
+
+def clear_metrics():
+    """
+    Clears the recorded metrics, keeping their totals in the run summary
+    The metrics file and stage profiles are kept
+    """
+    for record in METRICS:
+        add_to_summary(_cleared_summary, record)
+    METRICS.clear()
+
+
+def reset():
+    """
+    Clears the recorded metrics, their run summary totals and stage profiles
+    """
+    METRICS.clear()
+    _cleared_summary.clear()
+    _profilers.clear()
+
+
+def count_rows(value):
+    """
+    Returns the number of rows of a DataFrame, Series or Arrow table
+    or the total rows of a list of them, otherwise None
+    """
+    if hasattr(value, "num_rows"):
+        return value.num_rows
+    if hasattr(value, "shape") and hasattr(value, "index"):
+        return len(value)
+    if isinstance(value, (list, tuple)) and value:
+        counts = [count_rows(item) for item in value]
+        if all(count is not None for count in counts):
+            return sum(counts)
+    return None
+
+
+def count_input_rows(args, kwargs):
+    """
+    Returns the rows of the first tabular argument of a call
+    """
+    for value in list(args) + list(kwargs.values()):
+        rows = count_rows(value)
+        if rows is not None:
+            return rows
+    return None
+
+
+def max_rss_mb():
+    """
+    Returns the peak resident set size of this process in MB where the platform reports it
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB and macOS bytes
+    return max_rss / 2 ** 20 if max_rss > 2 ** 32 else max_rss / 2 ** 10
+
+
+class StageTimer:
+    """
+    Measures the wall time, CPU time and peak memory increase of one stage call
+    Nested stages (eg transform_weather_df inside run_weather_files) are measured separately
+    and also count towards the stage which called them
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+
+        self.tracing = tracemalloc.is_tracing()
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = current
+        else:
+            self.start_memory = max_rss_mb()
+        self.peak = 0
+        stack.append(self)
+
+        self.profiler = None
+        if self.stage == _settings["profile_stage"] and not any(
+            timer.profiler for timer in stack[:-1]
+        ):
+            self.profiler = _profilers.setdefault(self.stage, cProfile.Profile())
+            self.profiler.enable()
+
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall_seconds = time.perf_counter() - self.start_wall
+        self.cpu_seconds = time.process_time() - self.start_cpu
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(_settings["profile_path"])
+
+        stack = _local.stack
+        stack.pop()
+        if self.tracing and tracemalloc.is_tracing():
+            peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            self.memory_delta_mb = (peak - self.start_memory) / 2 ** 20
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+        elif self.start_memory is not None:
+            self.memory_delta_mb = max_rss_mb() - self.start_memory
+        else:
+            self.memory_delta_mb = None
+
+        return False
+
+
+def record_stage(timer: StageTimer, rows_in, rows_out, error: Exception = None) -> dict:
+    """
+    Stores the metrics of a stage call and emits them as a JSON line on the metrics logger
+    """
+    record = {
+        "stage": timer.stage,
+        "wall_seconds": round(timer.wall_seconds, 6),
+        "cpu_seconds": round(timer.cpu_seconds, 6),
+        "peak_memory_delta_mb": None
+        if timer.memory_delta_mb is None
+        else round(timer.memory_delta_mb, 3),
+        "memory_source": "tracemalloc" if timer.tracing else "max_rss",
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "error": None if error is None else type(error).__name__,
+    }
+    add_records([record])
+    return record
+
+
+def add_records(records: list):
+    """
+    Stores stage records, eg of a worker process, and emits them on the metrics logger
+    """
+    for record in records:
+        METRICS.append(record)
+        if metrics_logger.isEnabledFor(logging.INFO):
+            metrics_logger.info(json.dumps(record))
+
+
+def add_to_summary(summary: dict, record: dict):
+    """
+    Adds a stage record to the per stage totals of a run summary
+    """
+    stage = summary.setdefault(
+        record["stage"],
+        {
+            "calls": 0,
+            "errors": 0,
+            "wall_seconds": 0.0,
+            "cpu_seconds": 0.0,
+            "max_peak_memory_delta_mb": None,
+            "rows_in": None,
+            "rows_out": None,
+        },
+    )
+    stage["calls"] += 1
+    stage["errors"] += record["error"] is not None
+    stage["wall_seconds"] = round(stage["wall_seconds"] + record["wall_seconds"], 6)
+    stage["cpu_seconds"] = round(stage["cpu_seconds"] + record["cpu_seconds"], 6)
+    if record["peak_memory_delta_mb"] is not None:
+        stage["max_peak_memory_delta_mb"] = max(
+            stage["max_peak_memory_delta_mb"] or 0, record["peak_memory_delta_mb"]
+        )
+    for rows in ["rows_in", "rows_out"]:
+        if record[rows] is not None:
+            stage[rows] = (stage[rows] or 0) + record[rows]
+
+
+def run_summary(records: list = None) -> dict:
+    """
+    Totals the recorded metrics per stage in the order each stage first ran,
+    including the records cleared by clear_metrics
+    """
+    if records is not None:
+        summary = {}
+    else:
+        records = METRICS
+        summary = {stage: dict(totals) for stage, totals in _cleared_summary.items()}
+    for record in records:
+        add_to_summary(summary, record)
+    return summary
+
+
+def format_run_summary(summary: dict = None) -> str:
+    """
+    Formats the run summary as a table with one line per stage
+    """
+    summary = run_summary() if summary is None else summary
+    lines = [
+        f"{'stage':<34} {'calls':>5} {'wall s':>9} {'cpu s':>9} "
+        f"{'mem MB':>8} {'rows in':>10} {'rows out':>10}"
+    ]
+    for stage, totals in summary.items():
+        memory = totals["max_peak_memory_delta_mb"]
+        lines.append(
+            f"{stage:<34} {totals['calls']:>5} {totals['wall_seconds']:>9.3f} "
+            f"{totals['cpu_seconds']:>9.3f} "
+            f"{'' if memory is None else f'{memory:.1f}':>8} "
+            f"{'' if totals['rows_in'] is None else totals['rows_in']:>10} "
+            f"{'' if totals['rows_out'] is None else totals['rows_out']:>10}"
+        )
+    return "\n".join(lines)
+
+
+def write_run_summary(fpath: str, summary: dict = None):
+    """
+    Writes the run summary as JSON
+    """
+    with open(fpath, "w") as f:
+        json.dump(run_summary() if summary is None else summary, f, indent=2)
@@ -0,0 +1,109 @@
+import decimal
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+DAILY_AVERAGE_COLUMNS = ["ObservationDate", "Region", "SiteName", "ScreenTemperature"]
+
+
+def weather_dataset(fpath_parquet) -> ds.Dataset:
+    """
+    Opens a weather parquet file, directory or Hive partitioned dataset
+    Files starting with _ or . (eg the incremental manifest) are ignored
+    A dataset already opened (eg pruned with the catalog) is returned as it is
+    """
+    if isinstance(fpath_parquet, ds.Dataset):
+        return fpath_parquet
+    return ds.dataset(fpath_parquet, format="parquet", partitioning="hive")
+
+
+def read_weather_columns(fpath_parquet: str, columns: list, filter=None):
+    """
+    Reads only the requested columns of the weather parquet output as an Arrow table
+    filter is a pyarrow.dataset expression used to prune partitions and row groups
+    """
+    return weather_dataset(fpath_parquet).to_table(columns=columns, filter=filter)
+
+
+def round_half_up(value: float, places: int = 2) -> float:
+    """
+    Rounds a float the way Drill's ROUND does (HALF_UP on the exact binary value)
+    """
+    return float(
+        decimal.Decimal(value).quantize(
+            decimal.Decimal(1).scaleb(-places), rounding=decimal.ROUND_HALF_UP
+        )
+    )
+
+
+def daily_average_temperature(fpath_parquet: str, filter=None):
+    """
+    Returns an Arrow table of the unrounded average ScreenTemperature
+    of every ObservationDate, Region and SiteName
+    """
+    daily_averages = (
+        read_weather_columns(fpath_parquet, DAILY_AVERAGE_COLUMNS, filter)
+        .group_by(["ObservationDate", "Region", "SiteName"])
+        .aggregate([("ScreenTemperature", "mean")])
+    )
+    return daily_averages.rename_columns(
+        [
+            "DailyAverageTemperature" if column == "ScreenTemperature_mean" else column
+            for column in daily_averages.column_names
+        ]
+    )
+
+
+def max_daily_average_temperature(fpath_parquet: str, filter=None) -> pd.DataFrame:
+    """
+    Returns the site days with the maximum daily average temperature
+    matching the Drill task query, with the average rounded to 2 places
+    """
+    return max_rounded_daily_average(daily_average_temperature(fpath_parquet, filter))
+
+
+def max_rounded_daily_average(daily_averages) -> pd.DataFrame:
+    """
+    Returns the rows of an Arrow table of site day averages whose
+    DailyAverageTemperature rounded to 2 places equals the rounded maximum
+    """
+    return extreme_rounded_daily_average(daily_averages, largest=True)
+
+
+def min_rounded_daily_average(daily_averages) -> pd.DataFrame:
+    """
+    Returns the rows of an Arrow table of site day averages whose
+    DailyAverageTemperature rounded to 2 places equals the rounded minimum
+    """
+    return extreme_rounded_daily_average(daily_averages, largest=False)
+
+
+def extreme_rounded_daily_average(daily_averages, largest: bool = True) -> pd.DataFrame:
+    """
+    Returns the site days whose DailyAverageTemperature rounded to 2 places
+    equals the rounded maximum (or minimum when largest is False)
+    """
+    averages = daily_averages["DailyAverageTemperature"]
+    extreme_average = (pc.max(averages) if largest else pc.min(averages)).as_py()
+
+    columns = ["ObservationDate", "Region", "SiteName", "DailyAverageTemperature"]
+    if extreme_average is None:
+        return pd.DataFrame(columns=columns)
+
+    extreme_rounded = round_half_up(extreme_average)
+
+    # Rounding is monotonic so only averages within 0.01 of the extreme can round to it
+    candidates = daily_averages.filter(
+        pc.greater_equal(averages, extreme_average - 0.01)
+        if largest
+        else pc.less_equal(averages, extreme_average + 0.01)
+    ).to_pandas()
+    candidates["DailyAverageTemperature"] = candidates.DailyAverageTemperature.map(
+        round_half_up
+    )
+
+    return (
+        candidates.loc[candidates.DailyAverageTemperature == extreme_rounded, columns]
+        .sort_values(["ObservationDate", "Region", "SiteName"])
+        .reset_index(drop=True)
+    )
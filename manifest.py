@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import weather_pipeline as wp
+import parallel
+import aggregates
+import catalog
+import dedupe
+import features
+import local_query
+
+MANIFEST_FILE_NAME = "_manifest.json"
+
+
+def file_hash(fpath: str, block_size: int = 1 << 20) -> str:
+    """
+    Returns the sha256 hex digest of a file's content
+    """
+    digest = hashlib.sha256()
+    with open(fpath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(output_dir: str) -> dict:
+    """
+    Returns the manifest of processed files keyed by input path
+    or an empty manifest when the output has not been written yet
+    """
+    fpath_manifest = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    if not os.path.exists(fpath_manifest):
+        return {}
+    with open(fpath_manifest) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, output_dir: str):
+    """
+    Writes the manifest atomically so an interrupted run never leaves it half written
+    """
+    fpath_manifest = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    fpath_tmp = f"{fpath_manifest}.tmp"
+    with open(fpath_tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(fpath_tmp, fpath_manifest)
+
+
+def output_part_path(fpath: str, output_dir: str) -> str:
+    """
+    Returns the parquet file in the output directory holding the rows of an input file
+    """
+    return os.path.join(
+        output_dir, f"{os.path.splitext(os.path.basename(fpath))[0]}.parquet"
+    )
+
+
+def changed_files(fpaths: list, manifest: dict) -> dict:
+    """
+    Returns the new or changed input files mapped to their size, mtime and content hash
+    Files whose size and mtime match the manifest are not re-hashed
+    Files which were only touched keep their entry with the new mtime
+    """
+    changed = {}
+    for fpath in fpaths:
+        stat = os.stat(fpath)
+        entry = manifest.get(fpath)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime
+            and os.path.exists(entry["output"])
+        ):
+            continue
+
+        sha256 = file_hash(fpath)
+        if (
+            entry is not None
+            and entry["sha256"] == sha256
+            and os.path.exists(entry["output"])
+        ):
+            entry["mtime"] = stat.st_mtime
+            continue
+
+        changed[fpath] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+
+    return changed
+
+
+def dedupe_against_output(
+    frame_in: pd.DataFrame, part_keys: dict, manifest: dict, policy: str = "first"
+) -> pd.DataFrame:
+    """
+    Resolves the observations of frame_in already in other output files with the policy,
+    the output counting as the earlier delivery
+    With first the rows already written are kept and only output keys are compared
+    Otherwise each output file holding a conflicting observation is read and, when the
+    policy prefers rows of frame_in, rewritten without the rows it loses
+    part_keys maps each output file to its observation keys and is kept up to date,
+    as are the row counts of the manifest
+    Returns the rows of frame_in to write
+    """
+    keys = dedupe.observation_keys(frame_in)
+    for fpath_part, existing_keys in part_keys.items():
+        conflicts = np.isin(keys, existing_keys)
+        if not conflicts.any():
+            continue
+        if policy == "first":
+            frame_in, keys = frame_in[~conflicts], keys[~conflicts]
+            continue
+
+        existing = pd.read_parquet(fpath_part)
+        frame_in, existing_mask = dedupe.resolve_existing(frame_in, existing, policy)
+        keys = dedupe.observation_keys(frame_in)
+        if existing_mask.all():
+            continue
+
+        existing = existing[existing_mask]
+        wp.export_weather_to_parquet(existing, fpath_part, update_catalog=False)
+        part_keys[fpath_part] = dedupe.observation_keys(existing)
+        for entry in manifest.values():
+            if entry["output"] == fpath_part:
+                entry["rows"] = len(existing)
+    return frame_in
+
+
+@wp.log_error(wp.clogger)
+def run_incremental(
+    fpaths: list,
+    output_dir: str,
+    processes: int = None,
+    fpath_aggregates: str = None,
+    dedupe_policy: str = "first",
+    dedupe_existing: bool = False,
+    quarantine_dir: str = None,
+    max_reject_rate: float = wp.MAX_REJECT_RATE,
+    rolling_features: bool = False,
+) -> list:
+    """
+    Processes only the new or changed weather files and writes each one to its own
+    parquet file in the output directory, leaving the output of unchanged files untouched
+    The manifest in the output directory records each processed file's size, mtime,
+    content hash and output file, and the catalog the zone map of each output file
+    When fpath_aggregates is given the site days of the processed files are
+    recomputed from the whole output and replaced in the site day aggregate table
+    With dedupe_existing, observations already in the output of other files are resolved
+    with dedupe_policy, the output counting as the earlier delivery (see
+    dedupe_against_output), so an overlapping delivery only adds the site hours which
+    are new and with last or most_complete can replace rows already written
+    With quarantine_dir, rows failing validation are quarantined rather than failing the file
+    With rolling_features, per site window features are added to each file's rows
+    using the tail of the files before it, kept in the output directory between runs,
+    so files are best given in time order
+    Returns the input files that were processed
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+
+    changed = changed_files(fpaths, manifest)
+    fpaths_changed = list(changed)
+
+    part_keys = {}
+    if dedupe_existing:
+        part_keys = {
+            entry["output"]: dedupe.read_existing_keys(entry["output"])
+            for fpath, entry in manifest.items()
+            if fpath not in changed
+        }
+
+    tail = features.load_feature_tail(output_dir) if rolling_features else None
+
+    # Site days of the processed files and of the output they replace
+    site_day_keys = []
+    if fpath_aggregates:
+        site_day_keys = [
+            aggregates.site_day_keys(
+                local_query.read_weather_columns(
+                    manifest[fpath]["output"], ["ObservationDate", "ForecastSiteCode"]
+                ).to_pandas()
+            )
+            for fpath in fpaths_changed
+            if fpath in manifest and os.path.exists(manifest[fpath]["output"])
+        ]
+
+    for fpath, frame in zip(
+        fpaths_changed,
+        parallel.map_weather_files(
+            fpaths_changed, processes, dedupe_policy, quarantine_dir, max_reject_rate
+        ),
+    ):
+        if dedupe_existing:
+            frame = dedupe_against_output(frame, part_keys, manifest, dedupe_policy)
+
+        if rolling_features:
+            frame = features.add_rolling_features(frame, tail)
+            tail = features.feature_tail(frame, tail)
+
+        fpath_output = output_part_path(fpath, output_dir)
+        wp.export_weather_to_parquet(frame, fpath_output, update_catalog=False)
+        if dedupe_existing:
+            part_keys[fpath_output] = dedupe.observation_keys(frame)
+        manifest[fpath] = dict(changed[fpath], output=fpath_output, rows=len(frame))
+        if fpath_aggregates:
+            site_day_keys.append(aggregates.site_day_keys(frame))
+
+    if site_day_keys:
+        # Recomputed from every output file as a site day's readings may be in several
+        aggregates.refresh_site_day_aggregates(
+            output_dir, pd.concat(site_day_keys), fpath_aggregates
+        )
+
+    if tail is not None:
+        features.save_feature_tail(tail, output_dir)
+    catalog.update_catalog(output_dir)
+    save_manifest(manifest, output_dir)
+
+    return fpaths_changed
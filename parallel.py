@@ -0,0 +1,147 @@
+import os
+import pandas as pd
+import weather_pipeline as wp
+import dedupe
+import instrumentation
+from concurrent.futures import ProcessPoolExecutor
+
+
+class WeatherFileError(Exception):
+    """
+    Exception raised when a weather file fails to import, validate or transform.
+    """
+
+    def __init__(self, fpath: str, message: str):
+        super().__init__(fpath, message)
+        self.fpath = fpath
+
+    def __str__(self):
+        return f"{self.args[0]}: {self.args[1]}"
+
+
+def process_weather_file(
+    fpath: str,
+    dedupe_policy: str = "first",
+    quarantine_dir: str = None,
+    max_reject_rate: float = wp.MAX_REJECT_RATE,
+) -> pd.DataFrame:
+    """
+    Imports, validates and transforms a single monthly weather file
+    With quarantine_dir, rows failing validation are written to a quarantine parquet file
+    of the same name in that folder and the rest of the file carries on
+    Any error is re-raised as a WeatherFileError naming the file
+    """
+    try:
+        raw_weather_frame = wp.import_monthly_weather_csv(fpath)
+
+        if quarantine_dir:
+            raw_weather_frame, rejected = wp.quarantine_weather_data(
+                raw_weather_frame, max_reject_rate
+            )
+            wp.export_quarantine(
+                rejected, wp.quarantine_path(fpath, quarantine_dir), fpath
+            )
+        else:
+            wp.validate_weather_data(raw_weather_frame)
+
+        return wp.transform_weather_df(raw_weather_frame, dedupe_policy=dedupe_policy)
+
+    except Exception as e:
+        raise WeatherFileError(fpath, f"{type(e).__name__}: {e}") from e
+
+
+def process_weather_file_in_worker(fpath: str, **options) -> tuple:
+    """
+    Runs process_weather_file in a worker process and returns the transformed frame
+    with the stage records of the call, which only the worker records
+    A WeatherFileError carries the records of the stages run before it in records
+    """
+    try:
+        return process_weather_file(fpath, **options), list(instrumentation.METRICS)
+    except WeatherFileError as e:
+        e.records = list(instrumentation.METRICS)
+        raise
+    finally:
+        instrumentation.clear_metrics()
+
+
+def merge_weather_frames(frames, dedupe_policy: str = "first") -> pd.DataFrame:
+    """
+    Merges transformed weather frames into the same output a single transform of all files produces
+    Observations of the same site and hour in several frames are resolved with dedupe_policy
+    where last prefers the later frame (eg a later delivery)
+    """
+    return (
+        wp.concat_weather_frames(frames)
+        .pipe(dedupe.dedupe_observations, dedupe_policy)
+        .sort_values(["ObservationDate", "ObservationTime", "Region", "SiteName"])
+    )
+
+
+def map_weather_files(
+    fpaths: list,
+    processes: int = None,
+    dedupe_policy: str = "first",
+    quarantine_dir: str = None,
+    max_reject_rate: float = wp.MAX_REJECT_RATE,
+) -> list:
+    """
+    Imports, validates and transforms each weather file across a process pool
+    Returns the transformed frames in the order of fpaths
+    Runs serially in this process when processes is 1 or there is only one file
+    processes defaults to the number of CPUs
+    """
+    processes = processes or os.cpu_count() or 1
+    options = dict(
+        dedupe_policy=dedupe_policy,
+        quarantine_dir=quarantine_dir,
+        max_reject_rate=max_reject_rate,
+    )
+
+    if processes == 1 or len(fpaths) <= 1:
+        return [process_weather_file(fpath, **options) for fpath in fpaths]
+
+    # Stage records of the workers are added to this process's in the order of fpaths
+    with ProcessPoolExecutor(
+        max_workers=min(processes, len(fpaths)), initializer=instrumentation.start_worker
+    ) as executor:
+        futures = [
+            executor.submit(process_weather_file_in_worker, fpath, **options)
+            for fpath in fpaths
+        ]
+
+        frames, errors = [], []
+        for future in futures:
+            try:
+                frame, records = future.result()
+                frames.append(frame)
+                instrumentation.add_records(records)
+            except WeatherFileError as e:
+                instrumentation.add_records(getattr(e, "records", []))
+                wp.clogger.error(e)
+                errors.append(e)
+
+    if errors:
+        raise errors[0]
+
+    return frames
+
+
+@wp.log_error(wp.clogger)
+def run_weather_files(
+    fpaths: list,
+    processes: int = None,
+    dedupe_policy: str = "first",
+    quarantine_dir: str = None,
+    max_reject_rate: float = wp.MAX_REJECT_RATE,
+) -> pd.DataFrame:
+    """
+    Runs the per-file pipeline for each weather file across a process pool
+    and merges the results in the order of fpaths
+    """
+    return merge_weather_frames(
+        map_weather_files(
+            fpaths, processes, dedupe_policy, quarantine_dir, max_reject_rate
+        ),
+        dedupe_policy,
+    )
@@ -0,0 +1,274 @@
+import datetime
+import glob
+import hashlib
+import json
+import os
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import catalog
+import local_query
+
+SITE_KEYS = ["ForecastSiteCode", "SiteName", "Region"]
+
+# Bump when a report's output changes so cached results of the old code are not reused
+CACHE_VERSION = 1
+
+
+def report_filter(start_date=None, end_date=None, regions: list = None):
+    """
+    Builds a pyarrow.dataset expression keeping ObservationDates from start_date
+    to end_date inclusive and the given regions, or None when no filter is given
+    Dates are ISO strings, dates or timestamps
+    """
+    conditions = []
+    if start_date is not None:
+        conditions.append(
+            ds.field("ObservationDate") >= pd.Timestamp(start_date).to_pydatetime()
+        )
+    if end_date is not None:
+        conditions.append(
+            ds.field("ObservationDate") <= pd.Timestamp(end_date).to_pydatetime()
+        )
+    if regions:
+        conditions.append(ds.field("Region").isin(list(regions)))
+
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def text_order(series: pd.Series) -> pd.Series:
+    """
+    Sort key ordering unordered categoricals by their text rather than their category codes,
+    which depend on the order the parquet files of a dataset were read in
+    """
+    if series.dtype == "category" and not series.cat.ordered:
+        return series.astype(str)
+    return series
+
+
+def hottest_day(fpath_parquet: str, filter=None) -> pd.DataFrame:
+    """
+    Returns the site days with the maximum daily average temperature rounded to 2 places
+    """
+    return local_query.max_daily_average_temperature(fpath_parquet, filter)
+
+
+def coldest_day(fpath_parquet: str, filter=None) -> pd.DataFrame:
+    """
+    Returns the site days with the minimum daily average temperature rounded to 2 places
+    """
+    return local_query.min_rounded_daily_average(
+        local_query.daily_average_temperature(fpath_parquet, filter)
+    )
+
+
+def region_daily_stats(fpath_parquet: str, filter=None) -> pd.DataFrame:
+    """
+    Returns the mean, minimum and maximum temperature, reading count,
+    maximum wind gust and mean pressure of every ObservationDate and Region
+    """
+    columns = ["ObservationDate", "Region"]
+    stats = (
+        local_query.read_weather_columns(
+            fpath_parquet, columns + ["ScreenTemperature", "WindGust", "Pressure"], filter
+        )
+        .group_by(columns)
+        .aggregate(
+            [
+                ("ScreenTemperature", "mean"),
+                ("ScreenTemperature", "min"),
+                ("ScreenTemperature", "max"),
+                ("ScreenTemperature", "count", pc.CountOptions(mode="all")),
+                ("WindGust", "max"),
+                ("Pressure", "mean"),
+            ]
+        )
+        .to_pandas()
+    )
+    return (
+        stats.rename(
+            columns={
+                "ScreenTemperature_mean": "MeanTemperature",
+                "ScreenTemperature_min": "MinTemperature",
+                "ScreenTemperature_max": "MaxTemperature",
+                "ScreenTemperature_count": "ReadingCount",
+                "WindGust_max": "MaxWindGust",
+                "Pressure_mean": "MeanPressure",
+            }
+        )[
+            columns
+            + [
+                "MeanTemperature",
+                "MinTemperature",
+                "MaxTemperature",
+                "ReadingCount",
+                "MaxWindGust",
+                "MeanPressure",
+            ]
+        ]
+        .sort_values(columns, key=text_order)
+        .reset_index(drop=True)
+    )
+
+
+def windiest_sites(fpath_parquet: str, filter=None, top: int = 10) -> pd.DataFrame:
+    """
+    Returns the top sites by maximum wind gust, then by mean wind speed
+    Sites with no gust readings come last
+    """
+    sites = (
+        local_query.read_weather_columns(
+            fpath_parquet, SITE_KEYS + ["WindGust", "WindSpeed"], filter
+        )
+        .group_by(SITE_KEYS)
+        .aggregate([("WindGust", "max"), ("WindSpeed", "mean")])
+        .to_pandas()
+        .rename(columns={"WindGust_max": "MaxWindGust", "WindSpeed_mean": "MeanWindSpeed"})
+    )
+    return (
+        sites[SITE_KEYS + ["MaxWindGust", "MeanWindSpeed"]]
+        .sort_values(
+            ["MaxWindGust", "MeanWindSpeed", "ForecastSiteCode"],
+            ascending=[False, False, True],
+            na_position="last",
+        )
+        .head(top)
+        .reset_index(drop=True)
+    )
+
+
+def visibility_distribution(fpath_parquet: str, filter=None) -> pd.DataFrame:
+    """
+    Returns the number and share of readings of each VisibilityDescription
+    in order from worst to best visibility, readings with no visibility come last
+    """
+    counts = (
+        local_query.read_weather_columns(fpath_parquet, ["VisibilityDescription"], filter)
+        .group_by(["VisibilityDescription"])
+        .aggregate([("VisibilityDescription", "count", pc.CountOptions(mode="all"))])
+        .to_pandas()
+        .rename(columns={"VisibilityDescription_count": "ReadingCount"})
+    )
+    total = counts.ReadingCount.sum()
+    counts["Share"] = counts.ReadingCount / total if total else 0.0
+    return (
+        counts[["VisibilityDescription", "ReadingCount", "Share"]]
+        .sort_values("VisibilityDescription", na_position="last")
+        .reset_index(drop=True)
+    )
+
+
+REPORTS = {
+    "hottest_day": hottest_day,
+    "coldest_day": coldest_day,
+    "region_daily_stats": region_daily_stats,
+    "windiest_sites": windiest_sites,
+    "visibility_distribution": visibility_distribution,
+}
+
+
+def data_fingerprint(fpath_parquet: str) -> str:
+    """
+    Returns a sha256 hex digest of the path, size and modified time of every parquet file
+    of the weather output, so it changes whenever the pipeline writes new data
+    """
+    stats = []
+    for fpath in sorted(local_query.weather_dataset(fpath_parquet).files):
+        stat = os.stat(fpath)
+        stats.append([fpath, stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps(stats).encode()).hexdigest()
+
+
+def cache_key(report: str, params: dict, fingerprint: str) -> str:
+    """
+    Returns the cache key of a report run with the given parameters on the fingerprinted data
+    """
+    key = {
+        "version": CACHE_VERSION,
+        "report": report,
+        "params": params,
+        "fingerprint": fingerprint,
+    }
+    return hashlib.sha256(
+        json.dumps(key, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def run_report(
+    report: str,
+    fpath_parquet: str,
+    start_date=None,
+    end_date=None,
+    regions: list = None,
+    cache_dir: str = None,
+    **options,
+) -> pd.DataFrame:
+    """
+    Runs a report (see REPORTS) on the weather parquet file, directory or dataset
+    keeping ObservationDates from start_date to end_date inclusive and the given regions
+    options are passed to the report (eg top for windiest_sites)
+    Files whose zone map in the catalog shows they cannot match are not read
+    With cache_dir results are cached on disk keyed by the report, its parameters and the
+    fingerprint of the parquet files, so a repeated query on unchanged data is read back
+    rather than run and any new output invalidates it
+    """
+    if report not in REPORTS:
+        raise ValueError(f"Unknown report {report}")
+
+    params = {
+        "start_date": None if start_date is None else pd.Timestamp(start_date).isoformat(),
+        "end_date": None if end_date is None else pd.Timestamp(end_date).isoformat(),
+        "regions": None if not regions else sorted(regions),
+        "options": options,
+    }
+
+    def run():
+        return REPORTS[report](
+            catalog.pruned_dataset(fpath_parquet, start_date, end_date, regions),
+            report_filter(start_date, end_date, regions),
+            **options,
+        )
+
+    if cache_dir is None:
+        return run()
+
+    fpath_cache = os.path.join(
+        cache_dir,
+        f"{report}-{cache_key(report, params, data_fingerprint(fpath_parquet))}.parquet",
+    )
+    if os.path.exists(fpath_cache):
+        # Marks the entry as used for clear_cache
+        os.utime(fpath_cache)
+        return pd.read_parquet(fpath_cache)
+
+    frame_out = run()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fpath_tmp = f"{fpath_cache}.tmp"
+    frame_out.to_parquet(fpath_tmp, index=False)
+    os.replace(fpath_tmp, fpath_cache)
+    return frame_out
+
+
+def clear_cache(cache_dir: str, older_than: datetime.timedelta = None) -> int:
+    """
+    Deletes cached report results, only those not used for older_than when given
+    Entries of data which has since changed are never read again but stay until cleared
+    Returns the number of entries deleted
+    """
+    deleted = 0
+    for fpath_cache in glob.glob(os.path.join(cache_dir, "*.parquet")):
+        if older_than is not None and (
+            datetime.datetime.now()
+            - datetime.datetime.fromtimestamp(os.path.getmtime(fpath_cache))
+            < older_than
+        ):
+            continue
+        os.remove(fpath_cache)
+        deleted += 1
+    return deleted
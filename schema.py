@@ -0,0 +1,120 @@
+import re
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from collections import namedtuple
+
+COLUMN_NAMES = [
+    "ForecastSiteCode",
+    "ObservationTime",
+    "ObservationDate",
+    "WindDirection",
+    "WindSpeed",
+    "WindGust",
+    "Visibility",
+    "ScreenTemperature",
+    "Pressure",
+    "SignificantWeatherCode",
+    "SiteName",
+    "Latitude",
+    "Longitude",
+    "Region",
+    "Country",
+]
+
+OBSERVATION_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+NULL_VALUES = ["", "-99", "-99.0"]
+
+# Final types of the weather columns when they are read with an explicit schema
+ARROW_SCHEMA = pa.schema(
+    [
+        ("ForecastSiteCode", pa.int64()),
+        ("ObservationTime", pa.int64()),
+        ("ObservationDate", pa.timestamp("ns")),
+        ("WindDirection", pa.int64()),
+        ("WindSpeed", pa.int64()),
+        ("WindGust", pa.int64()),
+        ("Visibility", pa.int64()),
+        ("ScreenTemperature", pa.float64()),
+        ("Pressure", pa.int64()),
+        ("SignificantWeatherCode", pa.int64()),
+        ("SiteName", pa.dictionary(pa.int32(), pa.string())),
+        ("Latitude", pa.float64()),
+        ("Longitude", pa.float64()),
+        ("Region", pa.dictionary(pa.int32(), pa.string())),
+        ("Country", pa.dictionary(pa.int32(), pa.string())),
+    ]
+)
+
+PANDAS_DTYPES = {
+    "ForecastSiteCode": pd.Int64Dtype(),
+    "ObservationTime": pd.Int64Dtype(),
+    "ObservationDate": np.dtype("datetime64[ns]"),
+    "WindDirection": pd.Int64Dtype(),
+    "WindSpeed": pd.Int64Dtype(),
+    "WindGust": pd.Int64Dtype(),
+    "Visibility": pd.Int64Dtype(),
+    "ScreenTemperature": np.dtype(float),
+    "Pressure": pd.Int64Dtype(),
+    "SignificantWeatherCode": pd.Int64Dtype(),
+    "SiteName": pd.CategoricalDtype(),
+    "Latitude": np.dtype(float),
+    "Longitude": np.dtype(float),
+    "Region": pd.CategoricalDtype(),
+    "Country": pd.CategoricalDtype(),
+}
+
+# Low cardinality text columns held as pandas categoricals and parquet dictionaries
+CATEGORICAL_COLUMNS = [
+    "SiteName",
+    "Region",
+    "Country",
+    "WindCompass",
+    "WeatherType",
+    "VisibilityDescription",
+]
+
+STRING_CHECK_REGEX = re.compile(r"^(?=[A-Za-z0-9 &,./\-()\"']{1,50}$)")
+
+# Rule types shared by the pandas_schema and vectorized validation engines
+InRange = namedtuple("InRange", ["min", "max"])  # min inclusive, max exclusive
+IsDtype = namedtuple("IsDtype", ["dtype"])
+CanConvert = namedtuple("CanConvert", ["type"])
+MatchesPattern = namedtuple("MatchesPattern", ["pattern"])
+DateFormat = namedtuple("DateFormat", ["date_format"])
+
+ColumnRules = namedtuple("ColumnRules", ["name", "rules", "allow_empty"])
+
+WEATHER_RULES = [
+    ColumnRules(
+        "ForecastSiteCode",
+        [InRange(1000, 100000), IsDtype(np.dtype("int64"))],
+        False,
+    ),
+    ColumnRules(
+        "ObservationTime", [InRange(0, 24), IsDtype(np.dtype("int64"))], False
+    ),
+    ColumnRules("ObservationDate", [DateFormat(OBSERVATION_DATE_FORMAT)], False),
+    # 16 points of the compass (N is 0 and 16 since it is 0 and 360 degrees)
+    ColumnRules(
+        "WindDirection", [InRange(0, 17), IsDtype(np.dtype("int64"))], False
+    ),
+    ColumnRules("WindSpeed", [InRange(0, 255), CanConvert(int)], True),
+    ColumnRules("WindGust", [InRange(0, 255), CanConvert(int)], True),
+    ColumnRules("Visibility", [CanConvert(int), InRange(0, 125000)], True),
+    ColumnRules(
+        "ScreenTemperature", [InRange(-50, 50), IsDtype(np.dtype(float))], True
+    ),
+    ColumnRules("Pressure", [InRange(870, 1085), CanConvert(int)], True),
+    ColumnRules("SignificantWeatherCode", [InRange(0, 31)], True),
+    ColumnRules("SiteName", [MatchesPattern(STRING_CHECK_REGEX)], False),
+    # Signed latitude range
+    ColumnRules("Latitude", [InRange(-90, 90), IsDtype(np.dtype(float))], False),
+    # Signed longitude range
+    ColumnRules(
+        "Longitude", [InRange(-180, 80), IsDtype(np.dtype(float))], False
+    ),
+    ColumnRules("Region", [MatchesPattern(STRING_CHECK_REGEX)], True),
+    ColumnRules("Country", [MatchesPattern(STRING_CHECK_REGEX)], True),
+]
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+ADDRESS_COLUMNS = ["Locality", "Postcode", "AddressRegion"]
+
+
+def unit_vectors(latitude, longitude) -> np.ndarray:
+    """
+    Converts signed degree coordinates to points on the unit sphere
+    so the straight line (chord) distance between points orders the same as haversine distance
+    """
+    lat = np.radians(np.asarray(latitude, dtype=float))
+    lon = np.radians(np.asarray(longitude, dtype=float))
+    return np.column_stack(
+        [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]
+    )
+
+
+def chord_to_haversine_km(chord) -> np.ndarray:
+    """
+    Converts a chord length on the unit sphere to the great circle distance in km
+    """
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+class SiteIndex:
+    """
+    Offline nearest neighbour index of forecast sites with known addresses
+    Sites within max_distance_km of a known site inherit that site's address
+    """
+
+    def __init__(self, sites: pd.DataFrame, max_distance_km: float = 10):
+        self.sites = sites.reset_index(drop=True)
+        self.max_distance_km = max_distance_km
+        self.tree = cKDTree(unit_vectors(self.sites.Latitude, self.sites.Longitude))
+
+    @classmethod
+    def from_csv(
+        cls,
+        fpath_cords: str = "Data/ForecastSiteCords.csv",
+        fpath_addresses: str = "Data/ForecastSiteAddresses.csv",
+        max_distance_km: float = 10,
+    ):
+        """
+        Builds the index from the exported site coordinates and their reverse geocoded addresses
+        """
+        sites = pd.read_csv(fpath_cords).merge(
+            pd.read_csv(fpath_addresses, dtype={"Postcode": str})
+            .rename(columns={"Region": "AddressRegion"})
+            .drop_duplicates("ForecastSiteCode"),
+            on="ForecastSiteCode",
+        )
+        return cls(sites, max_distance_km)
+
+    def nearest(self, latitude, longitude):
+        """
+        Returns the great circle distance in km to and the index of the nearest known site
+        of each coordinate
+        """
+        chord, index = self.tree.query(unit_vectors(latitude, longitude))
+        return chord_to_haversine_km(chord), index
+
+    def lookup(self, latitude, longitude) -> pd.DataFrame:
+        """
+        Returns the address of the nearest known site and its distance for each coordinate
+        Addresses are null where the nearest site is further than max_distance_km
+        """
+        distance, index = self.nearest(latitude, longitude)
+        addresses = self.sites.loc[index, ADDRESS_COLUMNS].reset_index(drop=True)
+        return addresses.where(
+            pd.Series(distance <= self.max_distance_km), None
+        ).assign(AddressDistance=np.round(distance, 3))
+
+    def enrich(self, frame_in: pd.DataFrame) -> pd.DataFrame:
+        """
+        Attaches Locality, Postcode, AddressRegion and the distance to the site the address
+        came from to every row, querying the index once per distinct site coordinate
+        """
+        site_cords = (
+            frame_in[["ForecastSiteCode", "Latitude", "Longitude"]]
+            .drop_duplicates()
+            .dropna(subset=["Latitude", "Longitude"])
+        )
+        site_addresses = pd.concat(
+            [
+                site_cords.reset_index(drop=True),
+                self.lookup(site_cords.Latitude, site_cords.Longitude),
+            ],
+            axis=1,
+        )
+        frame_out = frame_in.drop(
+            columns=ADDRESS_COLUMNS + ["AddressDistance"], errors="ignore"
+        ).merge(
+            site_addresses, on=["ForecastSiteCode", "Latitude", "Longitude"], how="left"
+        )
+        frame_out.index = frame_in.index
+        return frame_out
@@ -0,0 +1,222 @@
+import os
+import textwrap
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import local_query
+import mappings
+import schema
+import spatial_index
+import weather_pipeline as wp
+
+SITES_FILE_NAME = "sites.parquet"
+OBSERVATIONS_FILE_NAME = "observations.parquet"
+
+# Columns fixed for each ForecastSiteCode held once per site in the sites dimension
+SITE_COLUMNS = [
+    "ForecastSiteCode",
+    "SiteName",
+    "Latitude",
+    "Longitude",
+    "Region",
+    "Country",
+]
+
+# Columns of the observations fact table
+# ObservationDate and ObservationTime are derived from ObservationDateTime when joining
+OBSERVATION_COLUMNS = [
+    "ForecastSiteCode",
+    "ObservationDateTime",
+    "WindDirection",
+    "WindSpeed",
+    "WindGust",
+    "Visibility",
+    "ScreenTemperature",
+    "Pressure",
+    "SignificantWeatherCode",
+    "VisibilityDescription",
+    "WindCompass",
+    "WeatherType",
+]
+
+# Column order of the transformed weather data rebuilt by joining the two tables
+WEATHER_COLUMNS = schema.COLUMN_NAMES + [
+    "ObservationDateTime",
+    "VisibilityDescription",
+    "WindCompass",
+    "WeatherType",
+]
+
+
+def site_columns(frame_in: pd.DataFrame) -> list:
+    """
+    Returns the per site columns of a transformed weather DataFrame
+    including the address columns attached by a spatial_index.SiteIndex
+    """
+    return SITE_COLUMNS + [
+        column
+        for column in spatial_index.ADDRESS_COLUMNS + ["AddressDistance"]
+        if column in frame_in
+    ]
+
+
+def apply_site_fixes(sites: pd.DataFrame) -> pd.DataFrame:
+    """
+    Corrects the sites dimension once per site rather than once per observation
+    Sets the Isle of Man region and derives Country from Region
+    """
+    return sites.assign(
+        Region=lambda df: wp.replace_site_region(df, 3204, "Isle of Man"),
+        Country=lambda df: wp.map_categories(df.Region, mappings.REGION_TO_COUNTRY),
+    ).pipe(wp.encode_categories)
+
+
+def build_sites(frame_in: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the sites dimension with one row per ForecastSiteCode
+    A site whose details changed takes the details of its latest observation
+    """
+    return (
+        frame_in.sort_values("ObservationDateTime", kind="stable")
+        .drop_duplicates("ForecastSiteCode", keep="last")[site_columns(frame_in)]
+        .pipe(apply_site_fixes)
+        .sort_values("ForecastSiteCode")
+        .reset_index(drop=True)
+    )
+
+
+def build_observations(frame_in: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the observations fact table holding the site code, timestamp and measurements
+    """
+    return frame_in[OBSERVATION_COLUMNS].reset_index(drop=True)
+
+
+def split_weather_frame(frame_in: pd.DataFrame):
+    """
+    Splits transformed weather data into the sites dimension and observations fact table
+    """
+    return build_sites(frame_in), build_observations(frame_in)
+
+
+def join_observations(observations: pd.DataFrame, sites: pd.DataFrame) -> pd.DataFrame:
+    """
+    Joins observations to their sites and rebuilds ObservationDate and ObservationTime
+    Returns the columns of the transformed weather data in the order of the observations
+    """
+    frame_out = observations.merge(sites, on="ForecastSiteCode", how="left").assign(
+        ObservationDate=lambda df: df.ObservationDateTime.dt.normalize(),
+        ObservationTime=lambda df: df.ObservationDateTime.dt.hour.astype("int64"),
+    )
+    extra_columns = [column for column in sites if column not in WEATHER_COLUMNS]
+    return frame_out[
+        [column for column in WEATHER_COLUMNS + extra_columns if column in frame_out]
+    ]
+
+
+@wp.log_error(wp.clogger)
+def export_star_schema(frame_in: pd.DataFrame, output_dir: str, **kwargs):
+    """
+    Writes transformed weather data as a sites dimension and an observations fact table
+    kwargs are passed to export_weather_to_parquet for the observations
+    The tables are not catalogued, the observations have no Region for a zone map
+    and are read through read_star_schema rather than the reports
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    sites, observations = split_weather_frame(frame_in)
+    wp.export_weather_to_parquet(
+        sites, os.path.join(output_dir, SITES_FILE_NAME), update_catalog=False
+    )
+    wp.export_weather_to_parquet(
+        observations,
+        os.path.join(output_dir, OBSERVATIONS_FILE_NAME),
+        update_catalog=False,
+        **kwargs,
+    )
+
+
+def read_star_schema(output_dir: str, columns: list = None, filter=None) -> pd.DataFrame:
+    """
+    Reads the sites and observations tables and joins them into transformed weather data
+    columns limits the observation columns read and filter is a pyarrow.dataset expression
+    on the observations
+    """
+    columns = ["ForecastSiteCode", "ObservationDateTime"] + [
+        column
+        for column in columns or OBSERVATION_COLUMNS
+        if column not in ("ForecastSiteCode", "ObservationDateTime")
+    ]
+    observations = local_query.read_weather_columns(
+        os.path.join(output_dir, OBSERVATIONS_FILE_NAME), columns, filter
+    ).to_pandas()
+    sites = pd.read_parquet(os.path.join(output_dir, SITES_FILE_NAME))
+    return join_observations(observations, sites)
+
+
+def max_daily_average_temperature(output_dir: str, filter=None) -> pd.DataFrame:
+    """
+    Answers the hottest day query from the star schema
+    Only the site code, timestamp and temperature are read from the observations
+    and the site days are joined to the sites dimension after aggregating
+    """
+    observations = local_query.read_weather_columns(
+        os.path.join(output_dir, OBSERVATIONS_FILE_NAME),
+        ["ForecastSiteCode", "ObservationDateTime", "ScreenTemperature"],
+        filter,
+    )
+    site_days = (
+        observations.append_column(
+            "ObservationDate",
+            pc.floor_temporal(observations["ObservationDateTime"], unit="day"),
+        )
+        .group_by(["ObservationDate", "ForecastSiteCode"])
+        .aggregate([("ScreenTemperature", "mean")])
+    )
+    sites = local_query.read_weather_columns(
+        os.path.join(output_dir, SITES_FILE_NAME),
+        ["ForecastSiteCode", "Region", "SiteName"],
+    )
+    daily_averages = site_days.join(sites, "ForecastSiteCode")
+    return local_query.max_rounded_daily_average(
+        pa.table(
+            {
+                "ObservationDate": daily_averages["ObservationDate"],
+                "Region": daily_averages["Region"],
+                "SiteName": daily_averages["SiteName"],
+                "DailyAverageTemperature": daily_averages["ScreenTemperature_mean"],
+            }
+        )
+    )
+
+
+def weather_view_sql(dfs_dir: str, view_name: str = "dfs.tmp.weather") -> str:
+    """
+    SQL creating a Drill view that joins the star schema back into the wide weather table
+    dfs_dir is the dfs path of the star schema directory eg dfs.`/data/weather_star`
+    """
+    site_columns_sql = ", ".join(f"s.{column}" for column in SITE_COLUMNS[1:])
+    observation_columns_sql = ", ".join(f"o.{column}" for column in OBSERVATION_COLUMNS)
+    dfs_root = dfs_dir.rstrip("`")
+    return textwrap.dedent(
+        f"""create or replace view {view_name} as
+        select
+            {observation_columns_sql},
+            cast(o.ObservationDateTime as date) as ObservationDate,
+            extract(hour from o.ObservationDateTime) as ObservationTime,
+            {site_columns_sql}
+        from
+            {dfs_root}/{OBSERVATIONS_FILE_NAME}` o
+        join
+            {dfs_root}/{SITES_FILE_NAME}` s
+        on
+            o.ForecastSiteCode = s.ForecastSiteCode"""
+    )
+
+
+@wp.log_error(wp.clogger)
+def create_weather_view(dfs_dir: str, view_name: str = "dfs.tmp.weather"):
+    """
+    Creates the Drill view of the star schema so existing queries can run against view_name
+    Note: drill must be running on the specified host
+    """
+    return wp.query_parquet(weather_view_sql(dfs_dir, view_name))
@@ -0,0 +1,259 @@
+import datetime
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from pandas.api.types import (
+    is_categorical_dtype,
+    is_datetime64_any_dtype,
+    is_numeric_dtype,
+)
+import schema
+
+ValidationSummary = namedtuple(
+    "ValidationSummary", ["column", "rule", "count", "sample_rows", "message"]
+)
+
+SAMPLE_ROWS = 5
+
+
+def describe_rule(rule) -> str:
+    """
+    Returns a human readable description of a validation rule failure
+    """
+    if isinstance(rule, schema.InRange):
+        return f"was not in the range [{rule.min}, {rule.max})"
+    elif isinstance(rule, schema.IsDtype):
+        return f"does not have a dtype that is a subclass of {rule.dtype}"
+    elif isinstance(rule, schema.CanConvert):
+        return f"cannot be converted to type {rule.type.__name__}"
+    elif isinstance(rule, schema.MatchesPattern):
+        return f'does not match the pattern "{rule.pattern.pattern}"'
+    elif isinstance(rule, schema.DateFormat):
+        return f'does not match the date format string "{rule.date_format}"'
+    raise TypeError(f"Unknown validation rule {rule!r}")
+
+
+def map_unique_values(series: pd.Series, check) -> np.ndarray:
+    """
+    Evaluates an element-wise check once per distinct value in the series
+    and broadcasts the boolean results back to every row
+    Null values are checked as np.nan
+    """
+    codes, uniques = pd.factorize(series)
+    results = np.fromiter(
+        (check(value) for value in uniques), dtype=bool, count=len(uniques)
+    )
+    # Null rows are factorized to -1 which selects the appended null result
+    results = np.append(results, check(np.nan))
+    return results[codes]
+
+
+def _is_empty(series: pd.Series) -> np.ndarray:
+    if (
+        is_categorical_dtype(series)
+        or is_numeric_dtype(series)
+        or series.dtype != np.dtype("O")
+    ):
+        return series.isnull().to_numpy()
+    return ~map_unique_values(
+        series, lambda value: isinstance(value, str) and len(value) > 0
+    )
+
+
+def _can_convert(type_):
+    def check(value):
+        try:
+            type_(value)
+            return True
+        except Exception:
+            return False
+
+    return check
+
+
+def _matches_pattern(pattern):
+    return lambda value: pattern.search(str(value)) is not None
+
+
+def _valid_date(date_format):
+    def check(value):
+        try:
+            datetime.datetime.strptime(str(value), date_format)
+            return True
+        except ValueError:
+            return False
+
+    return check
+
+
+def _is_dtype(series: pd.Series, dtype: np.dtype) -> bool:
+    try:
+        return np.issubdtype(series.dtype, dtype)
+    except TypeError:
+        # Extension dtypes (eg nullable integers) are compared by their numpy type
+        numpy_dtype = getattr(series.dtype, "numpy_dtype", None)
+        return numpy_dtype is not None and np.issubdtype(numpy_dtype, dtype)
+
+
+def rule_passes(series: pd.Series, rule) -> np.ndarray:
+    """
+    Returns a boolean array which is True for each row of the series that passes the rule
+    """
+    if isinstance(rule, schema.InRange):
+        numeric = pd.to_numeric(series, errors="coerce")
+        passed = (numeric >= rule.min) & (numeric < rule.max)
+        return passed.fillna(False).to_numpy(dtype=bool)
+    elif isinstance(rule, schema.IsDtype):
+        return np.full(len(series), _is_dtype(series, rule.dtype))
+    elif isinstance(rule, schema.CanConvert):
+        if is_numeric_dtype(series) and not is_categorical_dtype(series):
+            if rule.type is int:
+                # int() only raises for NaN and infinite numeric values
+                values = series.to_numpy(dtype=float, na_value=np.nan)
+                return np.isfinite(values)
+        return map_unique_values(series, _can_convert(rule.type))
+    elif isinstance(rule, schema.MatchesPattern):
+        return map_unique_values(series, _matches_pattern(rule.pattern))
+    elif isinstance(rule, schema.DateFormat):
+        if is_datetime64_any_dtype(series):
+            # Timestamps were already parsed with the date format on import
+            return series.notnull().to_numpy()
+        return map_unique_values(series, _valid_date(rule.date_format))
+    raise TypeError(f"Unknown validation rule {rule!r}")
+
+
+def rule_failures(frame_in: pd.DataFrame, rules=None):
+    """
+    Yields a (column, rule, failed row mask) tuple for every rule in the schema
+    Each column is checked in one pass rather than cell by cell
+    """
+    for column in schema.WEATHER_RULES if rules is None else rules:
+        if column.name not in frame_in:
+            continue
+        series = frame_in[column.name]
+        empty = _is_empty(series) if column.allow_empty else None
+        for rule in column.rules:
+            failed = ~rule_passes(series, rule)
+            if empty is not None and not isinstance(rule, schema.IsDtype):
+                failed &= ~empty
+            yield column.name, rule, failed
+
+
+def row_dtype_failures(series: pd.Series, dtype: np.dtype) -> np.ndarray:
+    """
+    Returns a boolean array which is True for each row whose value stops the column
+    having the dtype, ie non-null values which are not numbers (or not whole numbers
+    for an integer dtype) and for an integer dtype also nulls
+    """
+    if _is_dtype(series, dtype):
+        return np.zeros(len(series), dtype=bool)
+    numeric = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    if np.issubdtype(dtype, np.integer):
+        return ~(np.isfinite(numeric) & (numeric == np.round(numeric)))
+    return np.isnan(numeric) & series.notnull().to_numpy()
+
+
+def row_rule_failures(frame_in: pd.DataFrame, rules=None):
+    """
+    Yields a (column, rule, failed row mask) tuple for every rule in the schema
+    A dtype mismatch fails only the rows whose values cause it, rather than the column
+    """
+    for column, rule, failed in rule_failures(frame_in, rules):
+        if isinstance(rule, schema.IsDtype):
+            failed = row_dtype_failures(frame_in[column], rule.dtype)
+        yield column, rule, failed
+
+
+def rejection_reasons(frame_in: pd.DataFrame, rules=None) -> pd.Categorical:
+    """
+    Returns the reason codes of every row failing a rule eg "WindGust:InRange",
+    joined with ; where a row fails several, and null for valid rows
+    Rows are grouped by the combination of rules they fail so each reason string is built once
+    """
+    codes, masks = [], []
+    for column, rule, failed in row_rule_failures(frame_in, rules):
+        if failed.any():
+            codes.append(f"{column}:{type(rule).__name__}")
+            masks.append(failed)
+
+    if not masks:
+        return pd.Categorical.from_codes(np.full(len(frame_in), -1), categories=[])
+
+    failures = np.column_stack(masks)
+    rejected = failures.any(axis=1)
+    # Each row's failed rules as one bit pattern, factorized to one category per combination
+    patterns, combinations = pd.factorize(
+        [row.tobytes() for row in np.packbits(failures[rejected], axis=1)]
+    )
+    categories = []
+    for combination in combinations:
+        failed_rules = np.unpackbits(np.frombuffer(combination, dtype=np.uint8))
+        categories.append(
+            ";".join(code for code, failed in zip(codes, failed_rules) if failed)
+        )
+
+    reason_codes = np.full(len(frame_in), -1)
+    reason_codes[rejected] = patterns
+    return pd.Categorical.from_codes(reason_codes, categories=categories)
+
+
+def structural_errors(frame_in: pd.DataFrame, rules=None) -> list:
+    """
+    Returns a ValidationSummary for a wrong number of columns or each missing column,
+    errors which no row by row check can recover from
+    """
+    rules = schema.WEATHER_RULES if rules is None else rules
+
+    if len(frame_in.columns) != len(rules):
+        return [
+            ValidationSummary(
+                None,
+                "ColumnCount",
+                1,
+                [],
+                f"Invalid number of columns. The schema specifies {len(rules)}, "
+                f"but the data frame has {len(frame_in.columns)}",
+            )
+        ]
+
+    return [
+        ValidationSummary(
+            column.name,
+            "MissingColumn",
+            1,
+            [],
+            f"The column {column.name} exists in the schema but not in the data frame",
+        )
+        for column in rules
+        if column.name not in frame_in
+    ]
+
+
+def summarise_validation_errors(
+    frame_in: pd.DataFrame, rules=None, sample_rows: int = SAMPLE_ROWS
+) -> list:
+    """
+    Validates the weather DataFrame against the schema rules
+    Returns one ValidationSummary per failing (column, rule) pair with the
+    failure count and a sample of failing row indexes
+    """
+    summaries = structural_errors(frame_in, rules)
+    if summaries and summaries[0].rule == "ColumnCount":
+        return summaries
+
+    for column, rule, failed in rule_failures(frame_in, rules):
+        if not failed.any():
+            continue
+        if isinstance(rule, schema.IsDtype):
+            # A dtype mismatch is a single column level error
+            count, failed_rows = 1, []
+        else:
+            count = int(failed.sum())
+            failed_rows = frame_in.index[failed][:sample_rows].to_list()
+        summaries.append(
+            ValidationSummary(
+                column, type(rule).__name__, count, failed_rows, describe_rule(rule)
+            )
+        )
+
+    return summaries
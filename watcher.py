@@ -0,0 +1,223 @@
+import fnmatch
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+import instrumentation
+import manifest
+import parallel
+
+# Monthly files dropped into the input folder
+WATCH_PATTERN = "weather.*.csv"
+
+# Seconds between scans of the input folder
+POLL_SECONDS = 1
+
+# A file is picked up once its size and modified time have not changed for this long,
+# so files still being copied in are left alone
+SETTLE_SECONDS = 2
+
+# Files ready at about the same time are run together, up to these limits,
+# waiting at most BATCH_WAIT_SECONDS after the first one for others to arrive
+BATCH_FILES = 8
+BATCH_BYTES = 256 * 2 ** 20
+BATCH_WAIT_SECONDS = 1
+
+# Batches waiting to run, the scan waits (and files wait on disk) while it is full
+QUEUE_SIZE = 4
+
+clogger = logging.getLogger(__name__)
+
+
+class FolderWatcher:
+    """
+    Finds the files of a folder which are new or changed since they were last submitted
+    and have finished writing
+    """
+
+    def __init__(
+        self,
+        input_dir: str,
+        pattern: str = WATCH_PATTERN,
+        settle_seconds: float = SETTLE_SECONDS,
+        submitted: dict = None,
+    ):
+        self.input_dir = input_dir
+        self.pattern = pattern
+        self.settle_seconds = settle_seconds
+        # Path to the size and modified time last submitted
+        self.submitted = dict(submitted or {})
+        # Path to the size and modified time last seen and when they were first seen
+        self.pending = {}
+
+    def poll(self, now: float = None) -> list:
+        """
+        Returns the files which are ready in name order and marks them as submitted
+        """
+        now = time.monotonic() if now is None else now
+        ready = []
+        seen = set()
+        for name in sorted(os.listdir(self.input_dir)):
+            if not fnmatch.fnmatch(name, self.pattern):
+                continue
+            fpath = os.path.join(self.input_dir, name)
+            try:
+                stat = os.stat(fpath)
+            except FileNotFoundError:
+                continue
+            version = (stat.st_size, stat.st_mtime)
+            seen.add(fpath)
+
+            if self.submitted.get(fpath) == version:
+                self.pending.pop(fpath, None)
+                continue
+
+            last_version, since = self.pending.get(fpath, (None, now))
+            if last_version != version:
+                self.pending[fpath] = (version, now)
+            elif now - since >= self.settle_seconds:
+                del self.pending[fpath]
+                self.submitted[fpath] = version
+                ready.append(fpath)
+
+        # Files removed before they settled
+        for fpath in set(self.pending) - seen:
+            del self.pending[fpath]
+
+        return ready
+
+
+class WatchService:
+    """
+    Watches a folder for weather files and runs them through the incremental pipeline
+    in micro-batches, so new data is in the output dataset seconds after it lands
+    A scan thread batches ready files onto a bounded queue and the calling thread runs them
+    Files already in the manifest of the output are not run again unless they change
+    kwargs are passed to manifest.run_incremental (eg processes or dedupe_policy)
+    """
+
+    def __init__(
+        self,
+        input_dir: str,
+        output_dir: str,
+        pattern: str = WATCH_PATTERN,
+        poll_seconds: float = POLL_SECONDS,
+        settle_seconds: float = SETTLE_SECONDS,
+        batch_files: int = BATCH_FILES,
+        batch_bytes: int = BATCH_BYTES,
+        batch_wait_seconds: float = BATCH_WAIT_SECONDS,
+        queue_size: int = QUEUE_SIZE,
+        **kwargs,
+    ):
+        self.output_dir = output_dir
+        self.poll_seconds = poll_seconds
+        self.batch_files = batch_files
+        self.batch_bytes = batch_bytes
+        self.batch_wait_seconds = batch_wait_seconds
+        self.options = kwargs
+
+        submitted = {
+            fpath: (entry["size"], entry["mtime"])
+            for fpath, entry in manifest.load_manifest(output_dir).items()
+        }
+        self.watcher = FolderWatcher(input_dir, pattern, settle_seconds, submitted)
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.stopping = threading.Event()
+        self.processed = []
+        self.failed = []
+
+    def stop(self, *args):
+        """
+        Stops scanning and returns from run once the batch being run is written
+        Batches still queued are not run, their files are picked up on the next start
+        Takes the arguments of a signal handler
+        """
+        self.stopping.set()
+
+    def put_batch(self, batch: list) -> bool:
+        """
+        Queues a batch, waiting while the queue is full
+        Returns False when stopped first
+        """
+        while not self.stopping.is_set():
+            try:
+                self.batches.put(batch, timeout=self.poll_seconds)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scan(self):
+        """
+        Polls the input folder and queues ready files in batches until stopped
+        """
+        batch, batch_bytes, batch_started = [], 0, None
+        while not self.stopping.is_set():
+            now = time.monotonic()
+            for fpath in self.watcher.poll(now):
+                if batch_started is None:
+                    batch_started = now
+                batch.append(fpath)
+                batch_bytes += self.watcher.submitted[fpath][0]
+
+                if len(batch) >= self.batch_files or batch_bytes >= self.batch_bytes:
+                    if not self.put_batch(batch):
+                        return
+                    batch, batch_bytes, batch_started = [], 0, None
+
+            if batch and now - batch_started >= self.batch_wait_seconds:
+                if not self.put_batch(batch):
+                    return
+                batch, batch_bytes, batch_started = [], 0, None
+                # Scan again straight away for files which arrived meanwhile
+                continue
+
+            self.stopping.wait(self.poll_seconds)
+
+    def run_batch(self, batch: list) -> list:
+        """
+        Runs a batch through the incremental pipeline and returns the files written
+        A failing file is logged and left out, and only retried once it changes
+        """
+        processed = []
+        while batch:
+            try:
+                processed += manifest.run_incremental(batch, self.output_dir, **self.options)
+                break
+            except parallel.WeatherFileError as e:
+                clogger.error(f"Skipped {e}")
+                self.failed.append(e.fpath)
+                batch = [fpath for fpath in batch if fpath != e.fpath]
+        return processed
+
+    def run(self, handle_signals: bool = True):
+        """
+        Runs until stop is called, or SIGINT or SIGTERM is received with handle_signals
+        """
+        if handle_signals:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, self.stop)
+
+        scanner = threading.Thread(target=self.scan, name="watch-scan", daemon=True)
+        scanner.start()
+        try:
+            while not self.stopping.is_set():
+                try:
+                    batch = self.batches.get(timeout=self.poll_seconds)
+                except queue.Empty:
+                    continue
+                started = time.perf_counter()
+                processed = self.run_batch(batch)
+                self.processed += processed
+                clogger.info(
+                    f"Wrote {len(processed)} of {len(batch)} file(s) "
+                    f"in {time.perf_counter() - started:.1f}s"
+                )
+                # Each batch's stage records are written to the metrics file configured
+                # and kept as totals in the run summary, so they are not held in memory
+                instrumentation.clear_metrics()
+        finally:
+            self.stopping.set()
+            scanner.join()
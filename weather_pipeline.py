@@ -1,246 +1,596 @@
+import os
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+from pyarrow import csv
 import logging
 import functools
 import textwrap
+import instrumentation
+import dedupe
 import mappings
-import re
-from pandas_schema import Column, Schema, validation
-from pydrill import client, exceptions
+import schema
+import validators
+from pandas.api.types import is_datetime64_any_dtype
 
+# Errors are written to error.log by the handler the command line sets up when it runs,
+# importing the module has no side effects
 clogger = logging.getLogger(__name__)
-fh = logging.FileHandler("error.log")
-clogger.addHandler(fh)
 
 
 def log_error(logger):
     """
     Decorator function to log errors generically
+    Also records the wall time, CPU time, peak memory increase and input and output rows
+    of every call as a stage in instrumentation.METRICS
     """
 
     def decorated(f):
         @functools.wraps(f)
         def wrapped(*args, **kwargs):
+            result, error = None, None
+            timer = instrumentation.StageTimer(f.__name__)
             try:
-                return f(*args, **kwargs)
+                with timer:
+                    result = f(*args, **kwargs)
+                return result
             except Exception as e:
+                error = e
                 if logger:
                     logger.exception(e)
                 raise
             finally:
-                logging.shutdown()
+                instrumentation.record_stage(
+                    timer,
+                    instrumentation.count_input_rows(args, kwargs),
+                    instrumentation.count_rows(result),
+                    error,
+                )
 
         return wrapped
 
     return decorated
 
 
+def strip_categories(series: pd.Series) -> pd.Series:
+    """
+    Removes leading and trailing whitespace from the categories of a categorical series
+    so each distinct value is only stripped once
+    Values which are only whitespace become null, so validation treats them as empty
+    """
+    stripped = series.cat.categories.str.strip()
+    if stripped.is_unique:
+        series = series.cat.rename_categories(stripped)
+    else:
+        series = series.map(dict(zip(series.cat.categories, stripped))).astype("category")
+    if "" in series.cat.categories:
+        series = series.cat.remove_categories([""])
+    return series
+
+
+def strip_whitespace(frame_in: pd.DataFrame) -> pd.DataFrame:
+    """
+    Removes leading and trailing whitespace from the string columns only
+    """
+    string_columns = frame_in.select_dtypes(include="object").columns
+    categorical_columns = [
+        column
+        for column in frame_in.select_dtypes(include="category").columns
+        if frame_in[column].cat.categories.dtype == np.dtype("O")
+    ]
+    return frame_in.assign(
+        **{column: frame_in[column].str.strip() for column in string_columns},
+        **{column: strip_categories(frame_in[column]) for column in categorical_columns},
+    )
+
+
+def check_weather_columns(frame_in: pd.DataFrame):
+    """
+    Checks the imported weather data has data and the expected columns
+    """
+    if frame_in.empty:
+        raise pd.errors.EmptyDataError("The file only has a header and no data.")
+    elif len(frame_in.columns.to_list()) < len(schema.COLUMN_NAMES):
+        raise DataValidationError("Missing column names or too few row data values.")
+    elif len(frame_in.columns.to_list()) > len(schema.COLUMN_NAMES):
+        raise DataValidationError("Extra column names or too many row data values.")
+    elif frame_in.columns.to_list() != schema.COLUMN_NAMES:
+        raise DataValidationError("Unexpected column names.")
+
+
+# Text columns of the weather files read straight into categoricals
+IMPORT_CATEGORICAL_DTYPES = {
+    column: "category"
+    for column in schema.CATEGORICAL_COLUMNS
+    if column in schema.COLUMN_NAMES
+}
+
+
+@log_error(clogger)
 def import_monthly_weather_csv(fpath: str) -> pd.DataFrame:
     """
     Imports a monthly weather .csv file into a DataFrame
     Converts -99 to null
+    Reads the text columns as categoricals
     Removes leading and trailing whitespace
     """
-    try:
+    frame_out = strip_whitespace(
+        pd.read_csv(f"{fpath}", na_values=-99, dtype=IMPORT_CATEGORICAL_DTYPES)
+    )
 
-        frame_out = pd.read_csv(f"{fpath}", na_values=-99).applymap(
-            lambda x: x.strip() if isinstance(x, str) else x
-        )
+    check_weather_columns(frame_out)
 
-        column_names = [
-            "ForecastSiteCode",
-            "ObservationTime",
-            "ObservationDate",
-            "WindDirection",
-            "WindSpeed",
-            "WindGust",
-            "Visibility",
-            "ScreenTemperature",
-            "Pressure",
-            "SignificantWeatherCode",
-            "SiteName",
-            "Latitude",
-            "Longitude",
-            "Region",
-            "Country",
-        ]
+    return frame_out
 
-        if frame_out.empty:
-            raise pd.errors.EmptyDataError("The file only has a header and no data.")
-        elif len(frame_out.columns.to_list()) < len(column_names):
-            raise DataValidationError(
-                "Missing column names or too few row data values."
+
+@log_error(clogger)
+def import_typed_weather_csv(fpath: str, engine: str = "pyarrow") -> pd.DataFrame:
+    """
+    Imports a monthly weather .csv file into a DataFrame using the explicit column schema
+    so each column is parsed straight into its final type
+    (nullable integers, timestamps and categorical strings)
+    The pyarrow engine parses the file with pyarrow's multithreaded CSV reader
+    Converts -99 to null
+    Removes leading and trailing whitespace
+    """
+    if engine == "pyarrow":
+        table = csv.read_csv(
+            f"{fpath}",
+            read_options=csv.ReadOptions(use_threads=True),
+            convert_options=csv.ConvertOptions(
+                column_types=schema.ARROW_SCHEMA,
+                null_values=schema.NULL_VALUES,
+                strings_can_be_null=True,
+                timestamp_parsers=[schema.OBSERVATION_DATE_FORMAT],
+            ),
+        )
+        frame_out = table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+    elif engine == "pandas":
+        frame_out = pd.read_csv(
+            f"{fpath}",
+            na_values=schema.NULL_VALUES,
+            dtype={
+                column: dtype
+                for column, dtype in schema.PANDAS_DTYPES.items()
+                if column != "ObservationDate"
+            },
+        )
+        if "ObservationDate" in frame_out:
+            frame_out["ObservationDate"] = pd.to_datetime(
+                frame_out.ObservationDate, format=schema.OBSERVATION_DATE_FORMAT
             )
-        elif len(frame_out.columns.to_list()) > len(column_names):
-            raise DataValidationError("Extra column names or too many row data values.")
-        elif frame_out.columns.to_list() != column_names:
-            raise DataValidationError("Unexpected column names.")
 
-        return frame_out
+    else:
+        raise ValueError(f"Unknown csv engine {engine}")
+
+    frame_out = strip_whitespace(frame_out)
+
+    check_weather_columns(frame_out)
+
+    return frame_out
+
+
+def import_monthly_weather_csv_chunks(fpath: str, chunksize: int = 100000):
+    """
+    Streams a monthly weather .csv file as a generator of DataFrames of at most chunksize rows
+    Header and column checks are run once on the first chunk
+    Converts -99 to null
+    Reads the text columns as categoricals
+    Removes leading and trailing whitespace
+    """
+    try:
+
+        first_chunk = True
+        for chunk in pd.read_csv(
+            f"{fpath}",
+            na_values=-99,
+            dtype=IMPORT_CATEGORICAL_DTYPES,
+            chunksize=chunksize,
+        ):
+            chunk = strip_whitespace(chunk)
+            if first_chunk:
+                check_weather_columns(chunk)
+                first_chunk = False
+            yield chunk
+
+        if first_chunk:
+            raise pd.errors.EmptyDataError("The file only has a header and no data.")
 
     except Exception as e:
         if clogger:
             clogger.exception(e)
-            logging.shutdown()
         raise
 
 
-@log_error(clogger)
-def validate_weather_data(frame_in: pd.DataFrame):
+def build_pandas_schema():
     """
-    Uses a schema to validate the input weather dataframe columns
+    Builds a pandas_schema Schema from the shared weather validation rules
+    pandas_schema is only imported when this engine is used
     """
-
-    string_check_regex = re.compile(r"^(?=[A-Za-z0-9 &,./\-()\"']{1,50}$)")
-
-    weather_file_schema = Schema(
+    from pandas_schema import Column, Schema, validation
+
+    pandas_schema_validations = {
+        schema.InRange: lambda rule: validation.InRangeValidation(rule.min, rule.max),
+        schema.IsDtype: lambda rule: validation.IsDtypeValidation(rule.dtype),
+        schema.CanConvert: lambda rule: validation.CanConvertValidation(rule.type),
+        schema.MatchesPattern: lambda rule: validation.MatchesPatternValidation(
+            rule.pattern
+        ),
+        schema.DateFormat: lambda rule: validation.DateFormatValidation(
+            rule.date_format
+        ),
+    }
+
+    return Schema(
         [
             Column(
-                "ForecastSiteCode",
-                [
-                    validation.InRangeValidation(1000, 100000),
-                    validation.IsDtypeValidation(np.dtype("int64")),
-                ],
-            ),
-            Column(
-                "ObservationTime",
-                [
-                    validation.InRangeValidation(0, 24),
-                    validation.IsDtypeValidation(np.dtype("int64")),
-                ],
-            ),
-            Column(
-                "ObservationDate",
-                [validation.DateFormatValidation("%Y-%m-%dT%H:%M:%S")],
-            ),
-            Column(
-                "WindDirection",
-                [
-                    validation.InRangeValidation(0, 17),
-                    validation.IsDtypeValidation(np.dtype("int64")),
-                ],
-            ),  # 16 points of the compass (N is 0 and 16 since it is 0 and 360 degrees)
-            Column(
-                "WindSpeed",
-                [
-                    validation.InRangeValidation(0, 255),
-                    validation.CanConvertValidation(int),
-                ],
-                allow_empty=True,
-            ),
-            Column(
-                "WindGust",
-                [
-                    validation.InRangeValidation(0, 255),
-                    validation.CanConvertValidation(int),
-                ],
-                allow_empty=True,
-            ),
-            Column(
-                "Visibility",
-                [
-                    validation.CanConvertValidation(int),
-                    validation.InRangeValidation(0, 125000),
-                ],
-                allow_empty=True,
-            ),
-            Column(
-                "ScreenTemperature",
-                [
-                    validation.InRangeValidation(-50, 50),
-                    validation.IsDtypeValidation(np.dtype(float)),
-                ],
-                allow_empty=True,
-            ),
-            Column(
-                "Pressure",
-                [
-                    validation.InRangeValidation(870, 1085),
-                    validation.CanConvertValidation(int),
-                ],
-                allow_empty=True,
-            ),
-            Column(
-                "SignificantWeatherCode",
-                [validation.InRangeValidation(0, 31)],
-                allow_empty=True,
-            ),
-            Column(
-                "SiteName", [validation.MatchesPatternValidation(string_check_regex)],
-            ),
-            Column(
-                "Latitude",
-                [
-                    validation.InRangeValidation(-90, 90),
-                    validation.IsDtypeValidation(np.dtype(float)),
-                ],
-            ),  # Signed latitude range
-            Column(
-                "Longitude",
-                [
-                    validation.InRangeValidation(-180, 80),
-                    validation.IsDtypeValidation(np.dtype(float)),
-                ],
-            ),  # Signed longitude range
-            Column(
-                "Region",
-                [validation.MatchesPatternValidation(string_check_regex)],
-                allow_empty=True,
-            ),
-            Column(
-                "Country",
-                [validation.MatchesPatternValidation(string_check_regex)],
-                allow_empty=True,
-            ),
+                column.name,
+                [pandas_schema_validations[type(rule)](rule) for rule in column.rules],
+                allow_empty=column.allow_empty,
+            )
+            for column in schema.WEATHER_RULES
         ]
     )
 
-    errors = weather_file_schema.validate(frame_in)
-    if len(errors) > 0:
+
+@log_error(clogger)
+def validate_weather_data(frame_in: pd.DataFrame, engine: str = "vectorized"):
+    """
+    Validates the input weather dataframe columns against the schema rules
+    The vectorized engine checks each column in one pass and logs a compact
+    summary per failing column and rule
+    The pandas_schema engine checks cell by cell and logs every failing cell
+    """
+    if engine == "vectorized":
+        summaries = validators.summarise_validation_errors(frame_in)
+        if len(summaries) > 0:
+            if clogger:
+                for summary in summaries:
+                    clogger.error(
+                        f"{summary.column} {summary.message}: {summary.count} "
+                        f"row(s) failed {summary.rule}, eg rows {summary.sample_rows}"
+                    )
+            raise DataValidationError(
+                "Data validation failed. Please refer to the log file for detailed information."
+            )
+
+    elif engine == "pandas_schema":
+        errors = build_pandas_schema().validate(frame_in)
+        if len(errors) > 0:
+            if clogger:
+                for error in errors:
+                    clogger.exception(error)
+            raise DataValidationError(
+                "Data validation failed. Please refer to the log file for detailed information."
+            )
+
+    else:
+        raise ValueError(f"Unknown validation engine {engine}")
+
+
+class DataValidationError(Exception):
+    """
+    Exception raised when data validation produces errors.
+    """
+
+
+class RejectRateError(DataValidationError):
+    """
+    Exception raised when quarantine rejects more rows than the maximum reject rate.
+    """
+
+
+# Share of a batch's rows quarantine may reject before the batch fails
+MAX_REJECT_RATE = 0.01
+
+REJECT_REASON_COLUMN = "RejectReasons"
+
+
+def restore_column_types(frame_in: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts columns which were read as text because of rejected values back to numbers
+    and to the dtype their rules require, once the rejected rows are removed
+    """
+    frame_out = frame_in
+    for column in schema.WEATHER_RULES:
+        if column.name not in frame_out:
+            continue
+        series = frame_out[column.name]
+        if series.dtype == np.dtype("O") and any(
+            isinstance(rule, schema.InRange) for rule in column.rules
+        ):
+            series = pd.to_numeric(series)
+        for rule in column.rules:
+            if isinstance(rule, schema.IsDtype) and series.dtype != rule.dtype:
+                series = series.astype(rule.dtype)
+        if series is not frame_out[column.name]:
+            frame_out = frame_out.assign(**{column.name: series})
+    return frame_out
+
+
+@log_error(clogger)
+def quarantine_weather_data(
+    frame_in: pd.DataFrame, max_reject_rate: float = MAX_REJECT_RATE
+):
+    """
+    Validates the input weather dataframe row by row rather than failing it as a whole
+    Returns the valid rows, with the column types restored, and the rejected rows
+    with the rules each one failed in the RejectReasons column
+    Logs one line per reason with its row count
+    Raises DataValidationError for missing or extra columns and RejectRateError when
+    more than max_reject_rate of the rows are rejected
+    """
+    summaries = validators.structural_errors(frame_in)
+    if summaries:
         if clogger:
-            for error in errors:
-                clogger.exception(error)
+            for summary in summaries:
+                clogger.error(summary.message)
         raise DataValidationError(
             "Data validation failed. Please refer to the log file for detailed information."
         )
 
+    reasons = validators.rejection_reasons(frame_in)
+    rejected = ~pd.isna(reasons)
 
-class DataValidationError(Exception):
+    if rejected.any() and clogger:
+        for reason, count in pd.Series(reasons[rejected]).value_counts().items():
+            clogger.warning(f"Quarantined {count} row(s) failing {reason}")
+
+    reject_rate = rejected.mean() if len(frame_in) else 0.0
+    if reject_rate > max_reject_rate:
+        raise RejectRateError(
+            f"{rejected.sum()} of {len(frame_in)} rows ({reject_rate:.2%}) failed "
+            f"validation, more than the maximum reject rate of {max_reject_rate:.2%}"
+        )
+
+    return (
+        restore_column_types(frame_in[~rejected]),
+        frame_in[rejected].assign(**{REJECT_REASON_COLUMN: reasons[rejected]}),
+    )
+
+
+@log_error(clogger)
+def export_quarantine(rejected: pd.DataFrame, fpath_quarantine: str, source: str = None):
     """
-    Exception raised when data validation produces errors.
+    Writes rejected rows to a quarantine parquet file with their values as text,
+    as they were read, alongside the reject reasons, source file and row number
+    Removes an earlier quarantine file when there are no rejected rows
     """
+    import pyarrow.parquet as pq
+
+    if rejected.empty:
+        if os.path.exists(fpath_quarantine):
+            os.remove(fpath_quarantine)
+        return
+
+    reasons = rejected[REJECT_REASON_COLUMN].astype(str)
+    frame_out = (
+        rejected.drop(columns=REJECT_REASON_COLUMN)
+        .astype("string")
+        .assign(
+            **{
+                REJECT_REASON_COLUMN: reasons,
+                "SourceFile": source,
+                "SourceRow": rejected.index.to_numpy(),
+            }
+        )
+    )
+
+    os.makedirs(os.path.dirname(fpath_quarantine) or ".", exist_ok=True)
+    fpath_tmp = f"{fpath_quarantine}.tmp"
+    pq.write_table(pa.Table.from_pandas(frame_out, preserve_index=False), fpath_tmp)
+    os.replace(fpath_tmp, fpath_quarantine)
+
+
+def quarantine_path(fpath: str, quarantine_dir: str) -> str:
+    """
+    Returns the quarantine parquet file of an input file
+    """
+    return os.path.join(
+        quarantine_dir, f"{os.path.splitext(os.path.basename(fpath))[0]}.parquet"
+    )
 
 
 @log_error(clogger)
-def export_cords(frame_in: pd.DataFrame):
+def export_cords(frame_in: pd.DataFrame, fpath: str = "Data/ForecastSiteCords.csv"):
     """
     Optional pipeline function
     Exports weather station codes and latitude and longitude for reverse geo-coding
     Recommended to run after data validation to avoid data errors
     """
     frame_in[["ForecastSiteCode", "Latitude", "Longitude"]].drop_duplicates().to_csv(
-        "Data/ForecastSiteCords.csv", index=False
+        fpath, index=False
+    )
+
+
+def build_observation_datetime(frame_in: pd.DataFrame) -> pd.Series:
+    """
+    Merges date and time into one field using standard ISO format
+    Typed imports already hold ObservationDate as a timestamp so the hour is added directly
+    """
+    if is_datetime64_any_dtype(frame_in.ObservationDate):
+        # Replaces the hour of the date like the string path does
+        return (
+            frame_in.ObservationDate
+            - pd.to_timedelta(frame_in.ObservationDate.dt.hour, unit="h")
+            + pd.to_timedelta(frame_in.ObservationTime.astype(float), unit="h")
+        )
+
+    return (
+        frame_in.ObservationDate.str.slice(0, 11)
+        + frame_in.ObservationTime.apply(str).str.zfill(2)
+        + frame_in.ObservationDate.str.slice(13,)
+    )
+
+
+def parse_observation_dates(frame_in: pd.DataFrame) -> pd.Series:
+    """
+    Parses ObservationDate once per distinct date rather than once per row
+    """
+    if is_datetime64_any_dtype(frame_in.ObservationDate):
+        return frame_in.ObservationDate
+
+    codes, dates = pd.factorize(frame_in.ObservationDate)
+    parsed = pd.to_datetime(dates, format=schema.OBSERVATION_DATE_FORMAT)
+    return pd.Series(
+        parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=frame_in.index
+    )
+
+
+def clean_site_name(site_code, site_name):
+    """
+    Removes the site code suffix from a site name and transforms it into proper case
+    """
+    suffix_length = 7 if site_code < 10000 else 8
+    return site_name[:-suffix_length].title()
+
+
+def clean_site_names(frame_in: pd.DataFrame) -> pd.Categorical:
+    """
+    Cleans SiteName once per distinct ForecastSiteCode and SiteName rather than once per row
+    """
+    code_codes, site_codes = pd.factorize(frame_in.ForecastSiteCode)
+    name_codes, site_names = pd.factorize(frame_in.SiteName)
+    codes, pairs = pd.factorize(
+        code_codes.astype(np.int64) * (len(site_names) + 1) + name_codes
+    )
+
+    cleaned = np.empty(len(pairs) + 1, dtype=object)
+    cleaned[:] = np.nan
+    for i, pair in enumerate(pairs):
+        code_code, name_code = divmod(pair, len(site_names) + 1)
+        if code_code >= 0 and 0 <= name_code < len(site_names):
+            cleaned[i] = clean_site_name(site_codes[code_code], site_names[name_code])
+
+    cleaned = pd.Categorical(cleaned)
+    return pd.Categorical.from_codes(cleaned.codes[codes], cleaned.categories)
+
+
+def map_categories(series: pd.Series, mapping: dict) -> pd.Series:
+    """
+    Maps the distinct values of a series through a dict rather than every row
+    and returns a categorical series, nulls and unmapped values become null
+    """
+    series = series.astype("category")
+    mapped = pd.Categorical(
+        [mapping.get(category, np.nan) for category in series.cat.categories]
+    )
+    codes = np.append(mapped.codes, -1)[series.cat.codes]
+    return pd.Series(
+        pd.Categorical.from_codes(codes, mapped.categories), index=series.index
+    )
+
+
+def replace_site_region(frame_in: pd.DataFrame, site_code: int, region: str) -> pd.Series:
+    """
+    Sets the Region of every row of a site, keeping a categorical Region categorical
+    """
+    regions = frame_in.Region
+    if not isinstance(regions.dtype, pd.CategoricalDtype):
+        return pd.Series(
+            np.where(frame_in.ForecastSiteCode == site_code, region, regions),
+            index=frame_in.index,
+        )
+
+    if region not in regions.cat.categories:
+        regions = regions.cat.add_categories([region])
+    return regions.mask(frame_in.ForecastSiteCode == site_code, region)
+
+
+def encode_categories(frame_in: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the low cardinality text columns to categoricals with sorted categories
+    so they sort as the text does, ordered categoricals keep their order
+    """
+    encoded = {}
+    for column in schema.CATEGORICAL_COLUMNS:
+        if column not in frame_in:
+            continue
+        series = frame_in[column]
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            encoded[column] = series.astype("category")
+        elif not series.cat.ordered:
+            series = series.cat.remove_unused_categories()
+            encoded[column] = series.cat.reorder_categories(
+                series.cat.categories.sort_values()
+            )
+    return frame_in.assign(**encoded)
+
+
+def concat_weather_frames(frames) -> pd.DataFrame:
+    """
+    Concatenates weather DataFrames keeping categorical columns categorical
+    by giving every frame the sorted union of their categories
+    """
+    frames = list(frames)
+    categorical_columns = [
+        column
+        for column in frames[0].columns
+        if all(
+            isinstance(frame[column].dtype, pd.CategoricalDtype)
+            and not frame[column].cat.ordered
+            for frame in frames
+        )
+    ]
+    categories = {
+        column: pd.Index(
+            np.concatenate([frame[column].cat.categories for frame in frames])
+        )
+        .unique()
+        .sort_values()
+        for column in categorical_columns
+    }
+    return pd.concat(
+        frame.assign(
+            **{
+                column: frame[column].cat.set_categories(categories[column])
+                for column in categorical_columns
+            }
+        )
+        for frame in frames
+    )
+
+
+def astype_changed(frame_in: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    """
+    Casts only the columns which do not already have the requested dtype
+    """
+    return frame_in.astype(
+        {column: dtype for column, dtype in dtypes.items() if frame_in[column].dtype != dtype}
     )
 
 
 @log_error(clogger)
-def transform_weather_df(frame_in: pd.DataFrame) -> pd.DataFrame:
+def transform_weather_df(
+    frame_in: pd.DataFrame,
+    site_index=None,
+    fast: bool = True,
+    dedupe_policy: str = "first",
+) -> pd.DataFrame:
     """
     Merges date and time into one field using standard ISO format
     Transforms SiteName into proper case
     Uses mappings to populate country with more accurate and complete data
     (eg Glasgow and Strathclyde are not in England!)
     Enriches data with categorical and human readable information
+    Mappings are applied once per category and the text columns are held as categoricals
     Corrects wrongly inferred types
-    Removes row duplicates
+    Removes duplicate observations of the same site and hour
+    keeping the first, last or most_complete row (dedupe_policy)
+    Optionally attaches the address of the nearest known site from a spatial_index.SiteIndex
+    fast parses each distinct date and cleans each distinct site name once
+    and adds the hour as an offset rather than slicing and parsing every row as a string
     """
+    if fast:
+        frame_in = frame_in.assign(ObservationDate=parse_observation_dates)
 
     frame_out = (
         frame_in.assign(
-            ObservationDateTime=lambda df: df.ObservationDate.str.slice(0, 11)
-            + df.ObservationTime.apply(str).str.zfill(2)
-            + df.ObservationDate.str.slice(13,),
-            SiteName=lambda df: np.where(
+            ObservationDateTime=build_observation_datetime,
+            SiteName=clean_site_names
+            if fast
+            else lambda df: np.where(
                 df.ForecastSiteCode < 10000,
                 df.SiteName.str[:-7].str.title(),
                 df.SiteName.str[:-8].str.title(),
@@ -260,55 +610,186 @@ def transform_weather_df(frame_in: pd.DataFrame) -> pd.DataFrame:
                 include_lowest=True,
                 right=False,
             ),
-            Region=lambda df: np.where(
-                df.ForecastSiteCode == 3204, "Isle of Man", df.Region
-            ),
+            Region=lambda df: replace_site_region(df, 3204, "Isle of Man"),
             # Corrects capitalised and blank countries
-            Country=lambda df: df.Region.map(
-                mappings.REGION_TO_COUNTRY, na_action="ignore"
-            ),
+            Country=lambda df: map_categories(df.Region, mappings.REGION_TO_COUNTRY),
             # Enriches data with human readable information
-            WindCompass=lambda df: df.WindDirection.map(
-                mappings.COMPASS_16_PT, na_action="ignore"
+            WindCompass=lambda df: map_categories(
+                df.WindDirection, mappings.COMPASS_16_PT
             ),
-            WeatherType=lambda df: df.SignificantWeatherCode.map(
-                mappings.WEATHER_TYPES, na_action="ignore"
+            WeatherType=lambda df: map_categories(
+                df.SignificantWeatherCode, mappings.WEATHER_TYPES
             ),
         )
-        .drop_duplicates()
-        .astype(
+        .pipe(dedupe.dedupe_observations, dedupe_policy)
+        .pipe(encode_categories)
+        .pipe(
+            astype_changed,
             {
-                "ObservationDate": np.dtype("M"),
-                "ObservationDateTime": np.dtype("M"),
+                "ObservationDate": np.dtype("datetime64[ns]"),
+                "ObservationDateTime": np.dtype("datetime64[ns]"),
                 "Pressure": pd.Int64Dtype(),
                 "WindDirection": pd.Int64Dtype(),
                 "WindSpeed": pd.Int64Dtype(),
                 "SignificantWeatherCode": pd.Int64Dtype(),
                 "WindGust": pd.Int64Dtype(),
                 "Visibility": pd.Int64Dtype(),
-            }
+            },
         )
         .sort_values(["ObservationDate", "ObservationTime", "Region", "SiteName"])
     )
+
+    if site_index is not None:
+        frame_out = site_index.enrich(frame_out)
+
     return frame_out
 
 
+# Derived partition keys of a partitioned weather dataset
+# Region is partitioned on a copy so the Region column stays in the data files
+PARTITION_COLUMNS = ["Year", "Month", "RegionPartition"]
+
+
 @log_error(clogger)
-def export_weather_to_parquet(frame_in: pd.DataFrame, fpath_parquet: str):
+def export_weather_to_parquet(
+    frame_in: pd.DataFrame,
+    fpath_parquet: str,
+    partitioned: bool = False,
+    partition_by_region: bool = False,
+    compression: str = "snappy",
+    row_group_size: int = 10000,
+    update_catalog: bool = True,
+):
     """
     Exports weather data to a parquet file
+    When partitioned, writes a Hive style dataset directory split by Year and Month
+    of ObservationDate and optionally by Region, so queries can prune whole files
+    Rows are sorted within each partition and every row group carries column statistics
+    Only the partitions present in the data are replaced in an existing dataset
+    The catalog of the file or dataset is brought up to date unless update_catalog is False
+    (eg for a file of a dataset whose catalog is updated once all its files are written)
     """
-    frame_in.to_parquet(
-        fpath_parquet, index=False, engine="pyarrow", row_group_size=10000
+    import pyarrow.dataset as ds
+    import catalog
+
+    if not partitioned:
+        frame_in.to_parquet(
+            fpath_parquet,
+            index=False,
+            engine="pyarrow",
+            row_group_size=row_group_size,
+            compression=compression,
+        )
+        if update_catalog:
+            catalog.update_catalog(fpath_parquet)
+        return
+
+    partition_cols = PARTITION_COLUMNS[: 3 if partition_by_region else 2]
+    frame_out = frame_in.assign(
+        Year=lambda df: df.ObservationDate.dt.year,
+        Month=lambda df: df.ObservationDate.dt.month,
+        RegionPartition=lambda df: df.Region,
+    ).sort_values(
+        partition_cols + ["ObservationDate", "ObservationTime", "Region", "SiteName"]
+    )[list(frame_in.columns) + partition_cols]
+
+    table = pa.Table.from_pandas(frame_out, preserve_index=False)
+    ds.write_dataset(
+        table,
+        fpath_parquet,
+        format="parquet",
+        partitioning=ds.partitioning(
+            pa.schema([table.schema.field(column) for column in partition_cols]),
+            flavor="hive",
+        ),
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+        file_options=ds.ParquetFileFormat().make_write_options(
+            compression=compression
+        ),
+        max_rows_per_group=row_group_size,
+        min_rows_per_group=min(row_group_size, len(table)),
     )
+    if update_catalog:
+        catalog.update_catalog(fpath_parquet)
+
+
+def writer_field(field: pa.Field) -> pa.Field:
+    """
+    Returns the field of a parquet writer schema which fits the same column of every chunk
+    Columns that are entirely null in the first chunk are text columns
+    Dictionaries use 32 bit indices as later chunks may have more categories
+    """
+    if field.type == pa.null():
+        return field.with_type(pa.string())
+    if pa.types.is_dictionary(field.type):
+        value_type = field.type.value_type
+        return field.with_type(
+            pa.dictionary(
+                pa.int32(),
+                pa.string() if value_type == pa.null() else value_type,
+                field.type.ordered,
+            )
+        )
+    return field
 
 
 @log_error(clogger)
-def max_daily_average_temperature(drill_file_path: str):
+def export_weather_chunks_to_parquet(frames, fpath_parquet: str):
+    """
+    Exports an iterable of weather DataFrames to a single parquet file
+    Each DataFrame is written as it arrives so only one chunk is held in memory
+    The file schema is taken from the first DataFrame
+    The catalog of the file is brought up to date once it is written
+    """
+    import pyarrow.parquet as pq
+    import catalog
+
+    writer = None
+    try:
+        for frame in frames:
+            if writer is None:
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                writer_schema = pa.schema(
+                    writer_field(field) for field in table.schema
+                ).with_metadata(table.schema.metadata)
+                writer = pq.ParquetWriter(fpath_parquet, writer_schema)
+                table = table.cast(writer_schema)
+            else:
+                table = pa.Table.from_pandas(
+                    frame, schema=writer.schema, preserve_index=False
+                )
+            writer.write_table(table, row_group_size=10000)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is not None:
+        catalog.update_catalog(fpath_parquet)
+
+
+@log_error(clogger)
+def max_daily_average_temperature(
+    file_path: str, backend: str = "drill", cache_dir: str = None
+):
     """
     SQL Query text designed to answer task questions
     Passes the sql string and the DataFrame to another function to execute in drill
+    The local backend instead runs the same query in process on the parquet file
+    or dataset at file_path, reading only the columns it needs
+    and caching the result in cache_dir when given
     """
+    if backend == "local":
+        import reports
+
+        format_task_query_output(
+            reports.run_report("hottest_day", file_path, cache_dir=cache_dir)
+        )
+        return
+    elif backend != "drill":
+        raise ValueError(f"Unknown query backend {backend}")
+
+    drill_file_path = file_path
     sql = textwrap.dedent(
         f"""select
             *
@@ -333,7 +814,7 @@ def max_daily_average_temperature(drill_file_path: str):
                                         ObservationDate,Region,SiteName))"""
     )
 
-    query_out = query_parquet(sql)
+    query_out = query_parquet_frame(sql)
     format_task_query_output(query_out)
 
 
@@ -342,34 +823,57 @@ def query_parquet(sql: str):
     """
     Uses Apache Drill to interrogate the weather parquet file
     with a specified SQL query
+    The shared Drill client reuses its connection between queries
     Note: drill must be running on the specified host
     """
-    drill = client.PyDrill(host="localhost", port=8047)
+    import drill_client
 
-    if not drill.is_active():
-        raise exceptions.ImproperlyConfigured(
-            "Apache Drill must be running to allow querying of parquet data"
-        )
+    return drill_client.get_client().query(sql)
+
+
+@log_error(clogger)
+def query_parquet_frame(sql: str) -> pd.DataFrame:
+    """
+    Runs a SQL query on Apache Drill and returns its result as a typed DataFrame
+    """
+    import drill_client
 
-    return drill.query(sql, timeout=10)
+    return drill_client.get_client().query_frame(sql)
 
 
-def format_task_query_output(query_output: dict):
+def format_task_query_output(query_output):
+    """
+    Prints every site day of the query output (several when the hottest days tie)
+    """
     header = ["ObservationDate", "Region", "SiteName", "DailyAverageTemperature"]
 
-    row = list(query_output.rows[0].values())
+    if not isinstance(query_output, pd.DataFrame):
+        import drill_client
+
+        query_output = drill_client.result_to_table(query_output.data).to_pandas()
+
+    rows = [
+        [str(value) for value in row]
+        for row in query_output[header].itertuples(index=False)
+    ]
+
+    if not rows:
+        print("\nNo weather data matched the hottest day query")
+        return
+
     width = (
         max(
-            max(len(column) for column in row),
+            max(len(column) for row in rows for column in row),
             max(len(column_name) for column_name in header),
         )
         + 2
     )
+    lines = "\n        ".join(
+        "".join(column.ljust(width) for column in row) for row in rows
+    )
 
     print(
         f"""\nData for weather station site with the hottest day (maximum daily average temperature): \n
         {"".join(column_name.ljust(width) for column_name in header)}
-        {"".join(column.ljust(width)
-            for column in [row[1], row[2], row[0], row[3]]
-        )}"""
+        {lines}"""
     )